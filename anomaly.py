@@ -0,0 +1,144 @@
+# Потоковое обнаружение всплесков и провалов: для каждого ряда (видео или канала) хранится
+# экспоненциально взвешенное среднее и дисперсия скорости роста — O(1) памяти и времени на замер
+from dataclasses import dataclass
+import math
+
+import numpy as np
+
+SPIKE = 'spike'
+DROP = 'drop'
+
+
+@dataclass
+class Anomaly:
+    row: int
+    kind: str  # SPIKE или DROP
+    delta: int  # Изменение с прошлого изменения значения
+    value: int
+    rate: float  # Скорость за последний интервал, в час
+    hours: float  # Длина интервала, по которому считалась скорость, ч
+    expected: float  # Ожидаемая скорость по базовой линии, в час
+    score: float  # Отклонение в стандартных отклонениях
+
+
+class EwmaDetector:
+    # Базовая линия — EWMA скорости роста в час. Замеры приходят неравномерно (уровни опроса),
+    # поэтому вес замера зависит от прошедшего времени: за half_life часов старые данные теряют половину веса.
+    # sensitivity — порог отклонения в стандартных отклонениях; min_samples — замеров до первых срабатываний;
+    # min_delta — минимальное абсолютное изменение, о котором стоит сообщать.
+    # Публичные счетчики YouTube меняются ступенями: просмотры обновляются раз в десятки минут,
+    # подписчики округляются до трех значащих цифр. Поэтому скорость считается от последнего изменения
+    # значения, а неизменное значение считается нулевым приростом только через stale_hours.
+    # significant_digits — точность округления счетчика (None — значения точные)
+    def __init__(self, sensitivity=5.0, half_life=24.0, min_samples=4, min_delta=1, detect_drops=True, capacity=1024,
+                 stale_hours=2.0, significant_digits=None):
+        self.sensitivity = sensitivity
+        self.half_life = half_life
+        self.min_samples = min_samples
+        self.min_delta = min_delta
+        self.detect_drops = detect_drops
+        self.stale_hours = stale_hours
+        self.significant_digits = significant_digits
+        self.mean = np.zeros(capacity)
+        self.var = np.zeros(capacity)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.last_value = np.zeros(capacity, dtype=np.int64)
+        self.last_ts = np.zeros(capacity)  # Последнее изменение значения (или замер после stale_hours без изменений)
+        self.anchored = np.zeros(capacity, dtype=bool)  # Отсчет last_ts начат с изменения, а не с первого замера
+
+    def __len__(self):
+        return int(np.count_nonzero(self.count))
+
+    def _grow(self, size):
+        capacity = len(self.mean)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ('mean', 'var', 'count', 'last_value', 'last_ts', 'anchored'):
+            old = getattr(self, name)
+            column = np.zeros(capacity, dtype=old.dtype)
+            column[:len(old)] = old
+            setattr(self, name, column)
+
+    # Шаг округления счетчика: при трех значащих цифрах у 123 400 это 100
+    def rounding_step(self, values):
+        if self.significant_digits is None:
+            return np.zeros(len(values))
+        digits = np.floor(np.log10(np.maximum(np.abs(values), 1))) + 1
+        return 10.0 ** np.maximum(0, digits - self.significant_digits)
+
+    # Замеры values для строк rows на момент timestamp (секунды). Возвращает отклонения этого замера.
+    # Всплеск — скорость выше базовой линии больше чем на sensitivity отклонений; провал — ниже
+    # (в том числе уменьшение значения, например отписки)
+    def update(self, rows, values, timestamp):
+        rows = np.asarray(rows, dtype=np.int64)
+        values = np.asarray(values, dtype=np.int64)
+        if not len(rows):
+            return []
+        self._grow(int(rows.max()) + 1)
+        step = self.rounding_step(np.minimum(values, self.last_value[rows]))
+        delta = values - self.last_value[rows]
+        # Изменение меньше шага округления — не изменение счетчика, а смена разряда округления
+        delta = np.where(np.abs(delta) < step, 0, delta)
+        hours = np.maximum((timestamp - self.last_ts[rows]) / 3600, 1 / 3600)
+        count = self.count[rows]
+        # Значение не изменилось, а stale_hours еще не прошло: счетчик мог просто не обновиться.
+        # Такой замер пропускается целиком, интервал продолжает расти до следующего изменения
+        evaluated = (count == 0) | (delta != 0) | (hours >= self.stale_hours)
+        # Первое изменение после первого замера только начинает отсчет: неизвестно, когда до первого
+        # замера счетчик изменился в прошлый раз, и скорость по такому интервалу завышена
+        anchoring = (count > 0) & (delta != 0) & ~self.anchored[rows]
+        self.last_value[rows[anchoring]] = values[anchoring]
+        self.last_ts[rows[anchoring]] = timestamp
+        self.anchored[rows] |= evaluated & (count > 0)
+        evaluated &= ~anchoring
+        if not evaluated.all():
+            rows, values, delta, hours, count, step = (
+                rows[evaluated], values[evaluated], delta[evaluated], hours[evaluated], count[evaluated], step[evaluated]
+            )
+        seen = count > 0
+        rate = delta / hours
+        mean = self.mean[rows]
+        # Дисперсия не меньше пуассоновской: при редких событиях один просмотр не считается всплеском.
+        # Округление обоих концов интервала добавляет step² / 6 к дисперсии прироста
+        std = np.sqrt(np.maximum(self.var[rows], np.abs(mean) / hours) + 1.0 / hours + step * step / (6 * hours * hours))
+        score = (rate - mean) / std
+
+        ready = seen & (count > self.min_samples)
+        spike = ready & (score >= self.sensitivity) & (delta >= self.min_delta)
+        drop = np.zeros_like(spike)
+        if self.detect_drops:
+            # Провал: ожидаемого прироста хватало бы на min_delta, а пришло заметно меньше — или значение упало
+            expected_delta = mean * hours
+            drop = ready & (score <= -self.sensitivity) & ((expected_delta >= self.min_delta) | (delta <= -self.min_delta))
+
+        # Обновление базовой линии только для строк с прошлым замером; выброс учитывается
+        # обрезанным до порога, чтобы один всплеск не раздувал дисперсию надолго
+        # Пока замеров мало, базовая линия — обычное среднее без обрезки, иначе частые замеры учились бы сутками
+        alpha = np.maximum(1.0 - np.exp(-hours * math.log(2) / self.half_life), 1.0 / np.maximum(count, 1))
+        first = count == 1
+        clipped = np.clip(rate, mean - self.sensitivity * std, mean + self.sensitivity * std)
+        sample = np.where(ready, clipped, rate)
+        diff = sample - mean
+        new_mean = np.where(first, rate, mean + alpha * diff)
+        new_var = np.where(first, 0.0, (1 - alpha) * (self.var[rows] + alpha * diff * diff))
+        self.mean[rows] = np.where(seen, new_mean, 0.0)
+        self.var[rows] = np.where(seen, new_var, 0.0)
+        self.count[rows] = count + 1
+        self.last_value[rows] = values
+        self.last_ts[rows] = timestamp
+
+        anomalies = []
+        for kind, mask in ((SPIKE, spike), (DROP, drop)):
+            for i in np.flatnonzero(mask).tolist():
+                anomalies.append(Anomaly(
+                    row=int(rows[i]), kind=kind, delta=int(delta[i]), value=int(values[i]),
+                    rate=float(rate[i]), hours=float(hours[i]), expected=float(mean[i]), score=float(score[i])
+                ))
+        return anomalies
+
+    def baseline(self, row):
+        if row >= len(self.count) or self.count[row] == 0:
+            return None
+        return {'rate': float(self.mean[row]), 'std': float(math.sqrt(self.var[row])), 'samples': int(self.count[row])}
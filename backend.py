@@ -0,0 +1,242 @@
+# Общая шина между фронтендом (Telegram, обработка результатов) и сборщиками (запросы к Data API):
+# очередь заданий с арендой, поток событий и общее состояние. InProcessBackend работает внутри
+# одного процесса, RedisBackend — через Redis (или совместимый сервер) для нескольких процессов и машин
+import asyncio
+import collections
+import json
+import time
+
+EVENTS_MAXLEN = 10000
+
+
+class InProcessBackend:
+    # Задание выдается одному сборщику на lease секунд. Если сборщик не завершил его
+    # и не продлил аренду (упал или завис), задание снова выдается следующему claim()
+    def __init__(self):
+        self.jobs = {}  # key -> payload
+        self.available_at = {}  # key -> время, с которого задание можно взять
+        self.owners = {}  # key -> (worker_id, lease_until)
+        self.events = collections.deque(maxlen=EVENTS_MAXLEN)
+        self.last_id = 0
+        self.state = {}
+        self._changed = None
+
+    # Пробуждение всех ожидающих claim()/read_events(): future заменяется новым после каждого изменения.
+    # asyncio.wait, в отличие от wait_for, не теряет отмену задачи при одновременном истечении таймаута
+    def _notify(self):
+        if self._changed is not None:
+            self._changed.set_result(None)
+            self._changed = None
+
+    async def _wait(self, timeout):
+        if self._changed is None:
+            self._changed = asyncio.get_running_loop().create_future()
+        await asyncio.wait([self._changed], timeout=max(timeout, 0))
+
+    async def put_job(self, key, payload, delay=0.0):
+        self.jobs[key] = payload
+        self.available_at[key] = time.time() + delay
+        self.owners.pop(key, None)
+        self._notify()
+
+    async def claim(self, worker_id, limit=1, lease=30.0, block=1.0):
+        deadline = time.monotonic() + block
+        while True:
+            now = time.time()
+            claimed = []
+            for key, available_at in self.available_at.items():
+                if len(claimed) >= limit:
+                    break
+                if available_at <= now:
+                    claimed.append(key)
+            for key in claimed:
+                self.available_at[key] = now + lease
+                self.owners[key] = (worker_id, now + lease)
+            if claimed or time.monotonic() >= deadline:
+                return [(key, self.jobs[key]) for key in claimed]
+            await self._wait(min(deadline - time.monotonic(), 0.1))
+
+    def _owns(self, key, worker_id):
+        owner = self.owners.get(key)
+        return owner is not None and owner[0] == worker_id and owner[1] > time.time()
+
+    async def renew(self, key, worker_id, lease=30.0):
+        if not self._owns(key, worker_id):
+            return False
+        until = time.time() + lease
+        self.available_at[key] = until
+        self.owners[key] = (worker_id, until)
+        return True
+
+    async def complete(self, key, worker_id):
+        if not self._owns(key, worker_id):
+            return False
+        await self.cancel(key)
+        return True
+
+    async def cancel(self, key):
+        self.jobs.pop(key, None)
+        self.available_at.pop(key, None)
+        self.owners.pop(key, None)
+
+    async def pending(self):
+        return len(self.jobs)
+
+    async def publish(self, event):
+        self.last_id += 1
+        self.events.append((self.last_id, event))
+        self._notify()
+        return self.last_id
+
+    async def latest_event_id(self):
+        return self.last_id
+
+    # События после after; если их нет — ожидание до block секунд
+    async def read_events(self, after, block=1.0, count=100):
+        deadline = time.monotonic() + block
+        while self.last_id <= after:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return []
+            await self._wait(timeout)
+        return [(event_id, event) for event_id, event in self.events if event_id > after][:count]
+
+    async def set_state(self, name, value):
+        self.state[name] = value
+
+    async def get_state(self, prefix=''):
+        return {name: value for name, value in self.state.items() if name.startswith(prefix)}
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    # Задания: JSON в хэше {prefix}:jobs и очередь {prefix}:queue (ZSET по времени доступности).
+    # Аренда — ключ {prefix}:lease:<key> с TTL, который ставится SET NX: задание получает один сборщик.
+    # События — поток {prefix}:events (XADD/XREAD), состояние — хэш {prefix}:state.
+    # client — готовый клиент redis.asyncio (например, локальная замена в бенчмарке).
+    # При max_connections одновременных запросах остальные ждут свободного соединения, а не падают
+    def __init__(self, url=None, prefix='ytbot', client=None, max_connections=64):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise RuntimeError("Для STATE_BACKEND_URL=redis://... нужен пакет redis (pip install redis)") from e
+            pool = redis.BlockingConnectionPool.from_url(url, max_connections=max_connections, decode_responses=True)
+            client = redis.Redis(connection_pool=pool)
+        self.redis = client
+        self.prefix = prefix
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    async def put_job(self, key, payload, delay=0.0):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key('jobs'), key, json.dumps(payload, ensure_ascii=False))
+            pipe.zadd(self._key('queue'), {key: time.time() + delay})
+            pipe.delete(self._key(f'lease:{key}'))
+            await pipe.execute()
+
+    async def claim(self, worker_id, limit=1, lease=30.0, block=1.0):
+        deadline = time.monotonic() + block
+        while True:
+            now = time.time()
+            candidates = await self.redis.zrangebyscore(self._key('queue'), '-inf', now, start=0, num=limit * 4)
+            claimed = []
+            for key in candidates:
+                if len(claimed) >= limit:
+                    break
+                if not await self.redis.set(self._key(f'lease:{key}'), worker_id, nx=True, px=int(lease * 1000)):
+                    continue
+                # XX: задание, завершенное после zrangebyscore, не возвращается в очередь
+                if await self.redis.zadd(self._key('queue'), {key: now + lease}, xx=True, ch=True):
+                    claimed.append(key)
+                else:
+                    await self.redis.delete(self._key(f'lease:{key}'))
+            if claimed:
+                payloads = await self.redis.hmget(self._key('jobs'), claimed)
+                missing = [key for key, payload in zip(claimed, payloads) if payload is None]
+                if missing:
+                    async with self.redis.pipeline(transaction=True) as pipe:
+                        pipe.zrem(self._key('queue'), *missing)
+                        pipe.delete(*(self._key(f'lease:{key}') for key in missing))
+                        await pipe.execute()
+                jobs = [(key, json.loads(payload)) for key, payload in zip(claimed, payloads) if payload is not None]
+                if jobs:
+                    return jobs
+            if time.monotonic() >= deadline:
+                return []
+            await asyncio.sleep(min(0.05, max(0.0, deadline - time.monotonic())))
+
+    # Проверка владельца и изменение атомарны: между ними аренду не может перехватить другой сборщик
+    async def _if_owner(self, key, worker_id, update):
+        lease_key = self._key(f'lease:{key}')
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(lease_key)
+                if await pipe.get(lease_key) != worker_id:
+                    await pipe.unwatch()
+                    return False
+                pipe.multi()
+                update(pipe)
+                await pipe.execute()
+                return True
+            except Exception as e:
+                if type(e).__name__ == 'WatchError':
+                    return False
+                raise
+
+    async def renew(self, key, worker_id, lease=30.0):
+        def update(pipe):
+            pipe.pexpire(self._key(f'lease:{key}'), int(lease * 1000))
+            pipe.zadd(self._key('queue'), {key: time.time() + lease})
+        return await self._if_owner(key, worker_id, update)
+
+    async def complete(self, key, worker_id):
+        def update(pipe):
+            pipe.zrem(self._key('queue'), key)
+            pipe.hdel(self._key('jobs'), key)
+            pipe.delete(self._key(f'lease:{key}'))
+        return await self._if_owner(key, worker_id, update)
+
+    async def cancel(self, key):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self._key('queue'), key)
+            pipe.hdel(self._key('jobs'), key)
+            pipe.delete(self._key(f'lease:{key}'))
+            await pipe.execute()
+
+    async def pending(self):
+        return await self.redis.zcard(self._key('queue'))
+
+    async def publish(self, event):
+        return await self.redis.xadd(
+            self._key('events'), {'data': json.dumps(event, ensure_ascii=False)}, maxlen=EVENTS_MAXLEN, approximate=True
+        )
+
+    async def latest_event_id(self):
+        entries = await self.redis.xrevrange(self._key('events'), count=1)
+        return entries[0][0] if entries else '0-0'
+
+    async def read_events(self, after, block=1.0, count=100):
+        response = await self.redis.xread({self._key('events'): after}, count=count, block=max(1, int(block * 1000)))
+        if not response:
+            return []
+        return [(event_id, json.loads(fields['data'])) for event_id, fields in response[0][1]]
+
+    async def set_state(self, name, value):
+        await self.redis.hset(self._key('state'), name, json.dumps(value, ensure_ascii=False))
+
+    async def get_state(self, prefix=''):
+        state = await self.redis.hgetall(self._key('state'))
+        return {name: json.loads(value) for name, value in state.items() if name.startswith(prefix)}
+
+    async def close(self):
+        await self.redis.aclose(close_connection_pool=True)
+
+
+def create_backend(url=None):
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    return InProcessBackend()
@@ -0,0 +1,152 @@
+# Детектор всплесков на синтетическом потоке: у каждого видео своя пуассоновская скорость
+# просмотров, в случайные тики вносятся всплески (в spike_factor раз) и провалы (до нуля).
+# Сравнивается число оповещений прежнего правила «любой прирост» и детектора, полнота и точность
+# детектора и время обновления на тик для 1k/10k/100k видео.
+# Вторая часть — ступенчатые счетчики без внесенных событий (любое оповещение ложное): подписчики,
+# округленные до трех значащих цифр, за неделю и просмотры, публичный счетчик которых обновляется
+# раз в 1/10/30/60 минут, за трое суток. Замер каждую минуту; «по замерам» — скорость от прошлого замера.
+#
+# Запуск: python benchmarks/bench_anomaly.py [--sizes 1000 10000 100000] [--ticks 200]
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anomaly import DROP, SPIKE, EwmaDetector
+
+
+def simulate(size, ticks, args, seed=1):
+    rng = np.random.default_rng(seed)
+    rates = rng.lognormal(mean=2.0, sigma=1.5, size=size)  # просмотров в час
+    views = rng.integers(1000, 10 ** 6, size=size)
+    detector = EwmaDetector(args.sensitivity, args.half_life, min_samples=4, min_delta=args.min_delta,
+                            stale_hours=args.stale_hours)
+    rows = np.arange(size)
+    # Неизменный счетчик считается нулевым приростом только через stale_hours, поэтому провал
+    # длится столько тиков, чтобы детектор его увидел, а засчитывается в течение всего провала и тика после
+    drop_ticks = math.ceil(args.stale_hours * 60 / args.tick_minutes) + 1
+    dropped_until = np.zeros(size, dtype=np.int64)
+    # Внесенные события (начало, строка, длина): все (для точности) и заметные —
+    # с ожидаемым изменением от 3 * min_delta (для полноты)
+    events = {SPIKE: [], DROP: []}
+    notable = {SPIKE: [], DROP: []}
+    found = {SPIKE: set(), DROP: set()}
+    naive_alerts = 0
+    elapsed = 0.0
+    hours = args.tick_minutes / 60
+    for tick in range(ticks):
+        expected = rates * hours
+        factor = np.ones(size)
+        if 20 <= tick < ticks - drop_ticks:
+            spiking = (rng.random(size) < args.event_share) & (dropped_until <= tick)
+            dropping = ((rng.random(size) < args.event_share) & ~spiking & (dropped_until <= tick)
+                        & (expected >= 3 * args.min_delta))
+            dropped_until[dropping] = tick + drop_ticks
+            factor[spiking] = args.spike_factor
+            events[SPIKE] += [(tick, row, 1) for row in np.flatnonzero(spiking).tolist()]
+            events[DROP] += [(tick, row, drop_ticks + 1) for row in np.flatnonzero(dropping).tolist()]
+            notable[SPIKE] += [(tick, row, 1) for row in np.flatnonzero(spiking & (expected * args.spike_factor >= 3 * args.min_delta)).tolist()]
+            notable[DROP] = events[DROP]
+        factor[dropped_until > tick] = 0.0
+        delta = rng.poisson(expected * factor)
+        views = views + delta
+        naive_alerts += int(np.count_nonzero(delta > 0))
+        started = time.perf_counter()
+        anomalies = detector.update(rows, views, tick * hours * 3600)
+        elapsed += time.perf_counter() - started
+        for anomaly in anomalies:
+            found[anomaly.kind].add((tick, anomaly.row))
+    return events, notable, found, naive_alerts, elapsed / ticks
+
+
+def covered(events):
+    return {(start + offset, row) for start, row, length in events for offset in range(length)}
+
+
+# Ступенчатый счетчик без событий: true_counts(tick) — истинное значение, public — что показывает API.
+# Возвращает число оповещений детектора со скоростью от прошлого изменения и детектора, который
+# считает скорость от прошлого замера и не знает об округлении (stale_hours=0)
+def count_false_alerts(size, ticks, rates_per_minute, start, public, args, significant_digits=None, seed=2):
+    rng = np.random.default_rng(seed)
+    rows = np.arange(size)
+    detectors = [
+        EwmaDetector(args.sensitivity, args.half_life, min_samples=4, min_delta=args.min_delta,
+                     stale_hours=args.stale_hours, significant_digits=significant_digits),
+        EwmaDetector(args.sensitivity, args.half_life, min_samples=4, min_delta=args.min_delta, stale_hours=0.0)
+    ]
+    counts = start.copy()
+    alerts = [0, 0]
+    for tick in range(ticks):
+        counts = counts + rng.poisson(rates_per_minute)
+        values = public(tick, counts)
+        for i, detector in enumerate(detectors):
+            alerts[i] += len(detector.update(rows, values, tick * 60))
+    return alerts
+
+
+def round_significant(values, digits=3):
+    step = 10 ** np.maximum(0, np.floor(np.log10(np.maximum(values, 1))).astype(np.int64) + 1 - digits)
+    return values // step * step
+
+
+def stepwise(args):
+    rng = np.random.default_rng(3)
+    size = args.stepwise_size
+    print(f"\nСтупенчатые счетчики, {size} рядов, замер раз в минуту, ложных оповещений: детектор / по замерам")
+    # Подписчики: от тысячи до нескольких миллионов, прирост 0.1–1% в сутки
+    subscribers = (10 ** rng.uniform(3, 6.5, size=size)).astype(np.int64)
+    per_minute = subscribers * rng.uniform(0.001, 0.01, size=size) / (24 * 60)
+    alerts = count_false_alerts(size, 7 * 24 * 60, per_minute, subscribers,
+                                lambda tick, counts: round_significant(counts), args, significant_digits=3)
+    print(f"{'подписчики (3 знака), неделя':>34} | {alerts[0]:>6} / {alerts[1]}")
+    # Просмотры: публичный счетчик обновляется раз в refresh минут, у каждого видео в свою минуту
+    rates = rng.lognormal(mean=4.0, sigma=1.0, size=size) / 60
+    views = rng.integers(1000, 10 ** 6, size=size)
+    phase = rng.integers(0, 60, size=size)
+    for refresh in args.refresh_minutes:
+        shown = views.copy()
+
+        def public(tick, counts, refresh=refresh, shown=shown):
+            refreshed = (tick + phase) % refresh == 0
+            shown[refreshed] = counts[refreshed]
+            return shown.copy()
+
+        alerts = count_false_alerts(size, 3 * 24 * 60, rates, views, public, args)
+        print(f"{f'просмотры, обновление раз в {refresh} мин, 3 сут':>34} | {alerts[0]:>6} / {alerts[1]}")
+
+
+def main(args):
+    print(f"{'видео':>8} | {'«любой прирост»':>15} | {'детектор':>8} | {'всплески: полнота/точность':>26} | "
+          f"{'провалы: полнота/точность':>25} | {'мс/тик':>6}")
+    for size in args.sizes:
+        events, notable, found, naive, per_tick = simulate(size, args.ticks, args)
+        cells = []
+        for kind in (SPIKE, DROP):
+            hits = [event for event in notable[kind] if covered([event]) & found[kind]]
+            recall = len(hits) / len(notable[kind]) if notable[kind] else 1.0
+            precision = len(covered(events[kind]) & found[kind]) / len(found[kind]) if found[kind] else 1.0
+            cells.append(f"{recall:.0%} / {precision:.0%}")
+        total = len(found[SPIKE]) + len(found[DROP])
+        print(f"{size:>8} | {naive:>15} | {total:>8} | {cells[0]:>26} | {cells[1]:>25} | {per_tick * 1000:>6.2f}")
+    stepwise(args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--tick-minutes', type=float, default=10.0)
+    parser.add_argument('--event-share', type=float, default=0.001, help="Доля видео со всплеском или провалом за тик")
+    parser.add_argument('--spike-factor', type=float, default=5.0)
+    parser.add_argument('--sensitivity', type=float, default=5.0)
+    parser.add_argument('--half-life', type=float, default=24.0)
+    parser.add_argument('--min-delta', type=int, default=10)
+    parser.add_argument('--stale-hours', type=float, default=2.0)
+    parser.add_argument('--stepwise-size', type=int, default=100, help="Рядов в проверке ступенчатых счетчиков")
+    parser.add_argument('--refresh-minutes', type=int, nargs='+', default=[1, 10, 30, 60])
+    main(parser.parse_args())
@@ -0,0 +1,85 @@
+# Бенчмарк: задержка обработчика команды во время тика опроса.
+# Сравнивает прямой вызов блокирующих функций в цикле событий и вызов через пул потоков.
+#
+# Запуск: python benchmarks/bench_event_loop.py [--videos 500] [--latency 0.2]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+os.environ.setdefault("CHANNEL_ID", "UCbenchmark")
+os.chdir(tempfile.mkdtemp(prefix="yt_bot_bench_"))
+
+import main
+from fake_youtube import FakeYouTube, FakeYouTubeAnalytics
+
+
+# Имитация обработчика /start: замеряем, через сколько он получает управление
+async def handler_latencies(stop, interval=0.01):
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        latencies.append(time.perf_counter() - started - interval)
+    return latencies
+
+
+async def blocking_tick(youtube, youtube_analytics, video_ids):
+    main.get_channel_stats(youtube, main.CHANNEL_ID)
+    # Та же работа, что у fetch_video_stats: метаданные новых видео, затем статистика
+    main.get_video_metadata(youtube, video_ids, {})
+    main.get_video_stats(youtube, video_ids)
+    main.get_analytics_data(youtube_analytics)
+    main.get_audience_data(youtube_analytics)
+    main.get_traffic_sources(youtube_analytics)
+
+
+async def pooled_tick(youtube, youtube_analytics, video_ids):
+    await asyncio.gather(
+        main.fetch_channel_stats(youtube, main.CHANNEL_ID),
+        main.fetch_video_stats(youtube, video_ids),
+        main.fetch_analytics_data(youtube_analytics)
+    )
+
+
+async def measure(tick, youtube, youtube_analytics, video_ids):
+    stop = asyncio.Event()
+    probe = asyncio.create_task(handler_latencies(stop))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await tick(youtube, youtube_analytics, video_ids)
+    duration = time.perf_counter() - started
+    stop.set()
+    latencies = await probe
+    return duration, latencies
+
+
+def report(name, duration, latencies):
+    latencies = sorted(latencies) or [0.0]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<10} тик: {duration * 1000:8.1f} мс  "
+          f"задержка обработчика p50: {statistics.median(latencies) * 1000:7.1f} мс  "
+          f"p99/max: {p99 * 1000:7.1f} / {latencies[-1] * 1000:7.1f} мс")
+
+
+async def run(args):
+    main.logger.setLevel("WARNING")
+    youtube = FakeYouTube(video_count=args.videos, latency=args.latency, channel_ids=[main.CHANNEL_ID])
+    youtube_analytics = FakeYouTubeAnalytics(latency=args.latency)
+    video_ids = youtube.video_ids
+    for name, tick in (("blocking", blocking_tick), ("pooled", pooled_tick)):
+        main.stats_store.clear_cache()
+        duration, latencies = await measure(tick, youtube, youtube_analytics, video_ids)
+        report(name, duration, latencies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--videos', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.2)
+    asyncio.run(run(parser.parse_args()))
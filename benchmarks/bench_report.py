@@ -0,0 +1,111 @@
+# Отчеты из разделов с кэшем: время сборки отчета по всем каналам без кэша и из кэша,
+# время ответа /report, /top и /video на локальной замене API (запросов к API они не делают)
+# и деление длинных ответов на сообщения до 4096 символов.
+#
+# Запуск: python benchmarks/bench_report.py [--channels 20] [--videos-per-channel 200] [--repeat 50]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:report")
+os.environ["CHANNEL_ID"] = "UC" + "0" * 22
+os.environ["METRICS_PORT"] = "0"
+os.chdir(tempfile.mkdtemp(prefix="yt_bot_report_"))
+
+import main
+from fake_youtube import FakeBot, FakeYouTube, FakeYouTubeAnalytics
+from notifier import MESSAGE_LIMIT
+from report import SectionCache
+
+
+class FakeMessage:
+    def __init__(self, text, chat_id=1):
+        self.text = text
+        self.chat = SimpleNamespace(id=chat_id)
+        self.replies = []
+
+    async def reply(self, text):
+        self.replies.append(text)
+
+
+def timed(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations) * 1000
+
+
+async def timed_command(handler, text, repeat):
+    durations = []
+    message = None
+    for _ in range(repeat):
+        message = FakeMessage(text)
+        calls = youtube.calls
+        started = time.perf_counter()
+        await handler(message)
+        durations.append(time.perf_counter() - started)
+        assert youtube.calls == calls, "команда обратилась к API"
+    return statistics.median(durations) * 1000, message.replies
+
+
+async def run(args):
+    global youtube
+    main.logger.setLevel(args.log_level)
+    channel_ids = [main.CHANNEL_ID] + ["UC" + f"{i:022d}" for i in range(1, args.channels)]
+    youtube = FakeYouTube(video_count=args.channels * args.videos_per_channel, latency=0, active_share=0.3, channel_ids=channel_ids)
+    main.bot = FakeBot()
+    for channel_id in channel_ids:
+        main.subscriptions.subscribe(1, channel_id)
+    await main.on_startup(None, services=(None, youtube, FakeYouTubeAnalytics(latency=0, video_ids=youtube.video_ids)))
+    await main.poll_tick()
+    await main.poll_tick()
+    await main.notifier.join()
+
+    reports = {channel_id: main.last_channel_stats[channel_id] for channel_id in channel_ids}
+
+    def build_all():
+        for channel_id, stats in reports.items():
+            report_data = main.load_report_data(channel_id)
+            main.generate_daily_report(
+                stats, main.get_top_videos(channel_id, report_data), main.last_analytics_data if channel_id == main.CHANNEL_ID else None,
+                report_data, main.channel_comparisons.get(channel_id, (None, None))[1], main.get_channel_title(channel_id),
+                channel_id=channel_id
+            )
+
+    def cold():
+        main.report_sections = SectionCache()
+        main.top_growth_cache.clear()
+        build_all()
+
+    cold_ms = timed(cold, args.repeat)
+    build_all()
+    warm_ms = timed(build_all, args.repeat)
+    print(f"Сборка отчетов по {args.channels} каналам: без кэша {cold_ms:.2f} мс, из кэша {warm_ms:.2f} мс "
+          f"(разделов из кэша: {main.report_sections.hit_rate():.0%})")
+
+    results = []
+    for handler, text in ((main.report_command, "/report"), (main.top_command, f"/top {main.TOP_MAX}"),
+                          (main.video_command, f"/video {main.get_channel_video_ids(main.CHANNEL_ID)[0]}")):
+        latency, replies = await timed_command(handler, text, args.repeat)
+        longest = max(len(reply) for reply in replies)
+        print(f"{text.split()[0]:>8}: {latency:.2f} мс, сообщений {len(replies)}, самое длинное {longest} символов")
+        results.append(longest <= MESSAGE_LIMIT)
+    await main.persistence.flush()
+    return all(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--videos-per-channel', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--log-level', default="ERROR")
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
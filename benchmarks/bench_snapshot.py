@@ -0,0 +1,114 @@
+# Сравнение расчета прироста и топа видео: словари словарей (прежний путь) и колоночный срез VideoSnapshot.
+# Один «тик» — разбор ответа, поиск видео для оповещений (в срезе — детектор EwmaDetector, как в poll_tick)
+# и топ-2 для отчета. Детектор ведет базовую линию каждого ряда и делает больше работы, чем прежняя
+# проверка прироста, поэтому по времени пути сопоставимы, а выигрыш среза — в памяти. Время считается по заранее
+# построенным ответам, память — по тому, что каждый путь удерживает между тиками.
+#
+# Запуск: python benchmarks/bench_snapshot.py [--sizes 1000 10000 100000] [--repeat 5]
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anomaly import EwmaDetector
+from snapshot import VideoSnapshot
+
+TICK_SECONDS = 60
+
+
+def make_ticks(size, ticks, seed=1):
+    rng = random.Random(seed)
+    ids = [f"video{i:07d}" for i in range(size)]
+    views = {video_id: rng.randint(0, 10 ** 6) for video_id in ids}
+    result = []
+    for _ in range(ticks):
+        for video_id in rng.sample(ids, max(1, size // 20)):
+            views[video_id] += rng.randint(1, 500)
+        result.append(list(views.values()))
+    return ids, result
+
+
+# Ответ get_video_stats в том виде, в каком его получает poll_tick
+def payload(ids, views):
+    return {
+        video_id: {
+            'viewCount': count, 'likeCount': count // 50, 'dislikeCount': 0,
+            'commentCount': count // 500, 'title': f"Видео {video_id}", 'publishedAt': None
+        }
+        for video_id, count in zip(ids, views)
+    }
+
+
+# Прежний путь: прошлые ответы целиком, проверка в цикле и полный sorted() ради двух видео
+def dict_path(ids, payloads, baseline):
+    prev_video_views = {}
+    notified_views = {}
+    for current in payloads:
+        changes = []
+        for video_id, data in current.items():
+            previous = notified_views.get(video_id)
+            if previous is None:
+                previous = prev_video_views[video_id]['viewCount'] if video_id in prev_video_views else data['viewCount']
+                notified_views[video_id] = previous
+            if data['viewCount'] - previous > 0:
+                changes.append((data['title'], data['viewCount'] - previous))
+                notified_views[video_id] = data['viewCount']
+            prev_video_views[video_id] = data
+        diff = {video_id: prev_video_views[video_id]['viewCount'] - baseline.get(video_id, 0) for video_id in ids}
+        top = sorted(diff.items(), key=lambda x: x[1], reverse=True)[:2]
+    return prev_video_views, notified_views, top
+
+
+def snapshot_path(ids, payloads, baseline):
+    snapshot = VideoSnapshot()
+    detector = EwmaDetector()
+    for tick, current in enumerate(payloads):
+        rows, _, _ = snapshot.update(current)
+        detector.update(rows, snapshot.views[rows], tick * TICK_SECONDS)
+        top = snapshot.top_growth(ids, baseline, 2)
+    return snapshot, detector, top
+
+
+def measure(func, ids, ticks, baseline, repeat):
+    payloads = [payload(ids, views) for views in ticks]
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(ids, payloads, baseline)
+        best = min(best, time.perf_counter() - started)
+    del payloads
+    # Ответы строятся внутри замера: в памяти остается только то, что путь сохранил
+    tracemalloc.start()
+    result = func(ids, (payload(ids, views) for views in ticks), baseline)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return best, retained
+
+
+def main(args):
+    print(f"{'видео':>8} | {'словари, мс/тик':>16} | {'срез, мс/тик':>13} | {'ускорение':>9} | "
+          f"{'память словари, МБ':>18} | {'память срез, МБ':>15}")
+    for size in args.sizes:
+        ids, ticks = make_ticks(size, args.ticks)
+        baseline = {video_id: views - 100 for video_id, views in zip(ids, ticks[0])}
+        dict_time, dict_memory = measure(dict_path, ids, ticks, baseline, repeat=args.repeat)
+        snapshot_time, snapshot_memory = measure(snapshot_path, ids, ticks, baseline, repeat=args.repeat)
+        payloads = [payload(ids, views) for views in ticks]
+        dict_top = dict_path(ids, payloads, baseline)[-1]
+        snapshot_top = snapshot_path(ids, payloads, baseline)[-1]
+        assert [diff for _, diff in dict_top] == [diff for _, diff in snapshot_top], (dict_top, snapshot_top)
+        print(f"{size:>8} | {dict_time / args.ticks * 1000:>16.2f} | {snapshot_time / args.ticks * 1000:>13.2f} | "
+              f"{dict_time / snapshot_time:>8.1f}x | {dict_memory / 2 ** 20:>18.1f} | {snapshot_memory / 2 ** 20:>15.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--ticks', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,147 @@
+# Время от запуска процесса до первого ответа на /start и расход квоты при запуске.
+# Теплый запуск: бот поднимается из снимка WARM_STATE_FILE, клиенты API строятся в фоне.
+# Холодный: снимка нет, бот ждет клиентов API и обхода плейлистов, статистика каналов запрашивается заново.
+# OAuth и построение клиентов API заменены задержкой --build-delay; импорт модулей (aiogram,
+# googleapiclient) в замер входит, так как каждый запуск — отдельный процесс.
+#
+# Запуск: python benchmarks/bench_startup.py [--channels 20] [--videos-per-channel 200] [--runs 3]
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class FakeMessage:
+    def __init__(self, text, chat_id=1):
+        self.text = text
+        self.chat = SimpleNamespace(id=chat_id)
+        self.replies = []
+
+    async def reply(self, text):
+        self.replies.append(text)
+
+
+# Один запуск бота в текущем процессе: prime — подготовка снимка (первый запуск и один тик опроса)
+async def run_bot(args):
+    os.chdir(args.workdir)
+    import main
+    from fake_youtube import FakeBot, FakeYouTube, FakeYouTubeAnalytics
+    main.logger.setLevel(args.log_level)
+    main.bot = FakeBot()
+    channel_ids = [main.CHANNEL_ID] + ["UC" + f"{i:022d}" for i in range(1, args.channels)]
+    youtube = FakeYouTube(video_count=args.channels * args.videos_per_channel, latency=args.latency,
+                          active_share=0.3, channel_ids=channel_ids)
+
+    def build_services():
+        time.sleep(args.build_delay)
+        return None, youtube, FakeYouTubeAnalytics(latency=args.latency, video_ids=youtube.video_ids)
+
+    main.build_services = build_services
+    if args.prime:
+        for channel_id in channel_ids:
+            main.subscriptions.subscribe(1, channel_id)
+        main.persistence.mark('subscriptions')
+        await main.on_startup(None)
+        await main.poll_tick()
+        main.save_warm_state(force=True)
+        await main.persistence.flush()
+        return
+
+    # Расход квоты за сегодня восстанавливается из снимка, в замер входит только потраченное после запуска
+    restored = 0
+    if os.path.exists(main.WARM_STATE_FILE):
+        with open(main.WARM_STATE_FILE, encoding='utf-8') as f:
+            restored = json.load(f)['poll']['spent']
+    started = time.perf_counter()
+    await main.on_startup(None, lazy=args.lazy)
+    message = FakeMessage("/start")
+    await main.start_command(message)
+    replied = time.time()
+    after_import = time.perf_counter() - started
+    start_units = main.poll_scheduler.spent - restored
+    await main.startup_task
+    await main.persistence.flush()
+    print(json.dumps({
+        'replied': replied,
+        'after_import': after_import,
+        'reply': message.replies[0],
+        'start_units': start_units,
+        'startup_units': main.poll_scheduler.spent - restored,
+        'timings': main.startup_timings
+    }))
+
+
+def spawn(args, workdir, *flags):
+    command = [sys.executable, os.path.abspath(__file__), '--bot', '--workdir', workdir,
+               '--channels', str(args.channels), '--videos-per-channel', str(args.videos_per_channel),
+               '--latency', str(args.latency), '--build-delay', str(args.build_delay), '--log-level', args.log_level, *flags]
+    started = time.time()
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    lines = result.stdout.strip().splitlines()
+    return (json.loads(lines[-1]), started) if lines else (None, started)
+
+
+def measure(args, primed, *flags):
+    runs = []
+    for _ in range(args.runs):
+        workdir = tempfile.mkdtemp(prefix="yt_bot_startup_")
+        shutil.copytree(primed, workdir, dirs_exist_ok=True)
+        data, started = spawn(args, workdir, *flags)
+        runs.append((data['replied'] - started, data))
+        shutil.rmtree(workdir)
+    return (statistics.median(latency for latency, _ in runs),
+            statistics.median(data['after_import'] for _, data in runs), runs[-1][1])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--videos-per-channel', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.1, help="Задержка API, сек")
+    parser.add_argument('--build-delay', type=float, default=2.0, help="OAuth и построение клиентов API, сек")
+    parser.add_argument('--log-level', default="ERROR")
+    parser.add_argument('--bot', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--prime', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--lazy', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ.setdefault("BOT_TOKEN", "123456:startup")
+    os.environ["CHANNEL_ID"] = "UC" + "0" * 22
+    os.environ["METRICS_PORT"] = "0"
+    if args.bot:
+        asyncio.run(run_bot(args))
+        return
+
+    primed = tempfile.mkdtemp(prefix="yt_bot_primed_")
+    spawn(args, primed, '--prime')
+    cold_dir = tempfile.mkdtemp(prefix="yt_bot_cold_")
+    shutil.copy(os.path.join(primed, "subscriptions.json"), cold_dir)
+    cold = ("холодный",) + measure(args, cold_dir)
+    warm = ("теплый",) + measure(args, primed, '--lazy')
+
+    print(f"Каналов: {args.channels}, видео: {args.channels * args.videos_per_channel}, задержка API: "
+          f"{args.latency * 1000:.0f} мс, клиенты API: {args.build_delay:.1f} с")
+    print(f"{'запуск':>9} | {'до ответа /start, с':>19} | {'без импорта, с':>14} | {'квота до ответа':>15} | {'квота запуска':>13} | этапы")
+    for name, latency, after_import, data in (cold, warm):
+        timings = ", ".join(f"{phase} {seconds * 1000:.0f} мс" for phase, seconds in data['timings'].items())
+        print(f"{name:>9} | {latency:>19.2f} | {after_import:>14.3f} | {data['start_units']:>15} | {data['startup_units']:>13} | {timings}")
+    shutil.rmtree(primed)
+    shutil.rmtree(cold_dir)
+    # Ответ из снимка совпадает с ответом по свежей статистике
+    return warm[3]['reply'] == cold[3]['reply']
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main_cli() is not False else 1)
@@ -0,0 +1,158 @@
+# Нагрузочный тест: тысячи подписок чатов на сотни каналов с общим конвейером опроса.
+# Сравнивает число запросов к API с вариантом «отдельный процесс на каждую подписку».
+# Бюджет квоты — DAILY_QUOTA_BUDGET, если не задан --budget. Вторая часть — модельные сутки квоты
+# только планировщика для разного числа каналов: расход не должен превышать бюджет,
+# а каналы при нехватке опрашиваются реже, но все.
+#
+# Сообщения уходят через очередь main.notifier; лимиты Telegram по умолчанию ослаблены (--chat-rate),
+# чтобы тест не длился минутами, --flood-share имитирует ответы retry_after.
+#
+# Запуск: python benchmarks/bench_tenancy.py [--channels 300] [--videos-per-channel 20] [--chats 1500]
+import argparse
+import asyncio
+from datetime import timedelta
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+os.environ["CHANNEL_ID"] = "UC" + "0" * 22
+os.chdir(tempfile.mkdtemp(prefix="yt_bot_bench_"))
+
+import main
+from fake_youtube import FakeBot, FakeYouTube, FakeYouTubeAnalytics
+from notifier import NotificationDispatcher
+from quota import QuotaScheduler
+
+
+async def run(args):
+    main.logger.setLevel("WARNING")
+    logging.getLogger("notifier").setLevel("ERROR")
+    channel_ids = ["UC" + f"{i:022d}" for i in range(args.channels)]
+    youtube = FakeYouTube(
+        video_count=args.channels * args.videos_per_channel,
+        latency=args.latency,
+        active_share=args.active_share,
+        channel_ids=channel_ids
+    )
+    main.youtube = youtube
+    main.youtube_analytics = FakeYouTubeAnalytics(latency=args.latency)
+    main.bot = FakeBot(flood_share=args.flood_share)
+    main.notifier = NotificationDispatcher(
+        main.notifier.send, chat_rate=args.chat_rate, group_rate=args.chat_rate, global_rate=args.global_rate
+    )
+    main.poll_scheduler.daily_budget = args.budget
+    main.poll_scheduler.tiers = [(0, 0)]  # Худший случай: каждое видео опрашивается каждый тик
+
+    rng = random.Random(1)
+    for chat_id in range(1, args.chats + 1):
+        for channel_id in rng.sample(channel_ids, args.channels_per_chat):
+            main.subscriptions.subscribe(chat_id, channel_id)
+    print(f"Подписок: {len(main.subscriptions)}, чатов: {args.chats}, каналов: {args.channels}, "
+          f"видео: {args.channels * args.videos_per_channel}")
+
+    started = time.perf_counter()
+    await main.refresh_all_video_ids()
+    print(f"Обнаружение видео: {time.perf_counter() - started:.2f} с, запросов: {youtube.calls}, "
+          f"единиц квоты: {main.poll_scheduler.spent}")
+
+    for tick in range(1, args.ticks + 1):
+        calls, spent, sent = youtube.calls, main.poll_scheduler.spent, len(main.bot.sent)
+        started = time.perf_counter()
+        plan = await main.poll_tick()
+        elapsed = time.perf_counter() - started
+        await main.notifier.join()
+        print(f"Тик {tick}: {elapsed:.2f} с, запросов Data API: {youtube.calls - calls}, "
+              f"единиц квоты: {main.poll_scheduler.spent - spent} (по плану {plan.planned_units}, остальное — метаданные новых видео), "
+              f"каналов: {len(plan.channel_ids)}, видео: {len(plan.video_ids)}, сообщений: {len(main.bot.sent) - sent} "
+              f"(доставка {time.perf_counter() - started - elapsed:.2f} с)")
+
+    delivery = main.notifier.metrics()
+    print(f"Доставка: отправлено {delivery['sent']}, ошибок {delivery['failed']}, повторов после retry_after "
+          f"{delivery['retries']}, задержка p50/p99/max: {delivery['latency_p50']:.2f}/"
+          f"{delivery['latency_p99']:.2f}/{delivery['latency_max']:.2f} с")
+
+    # Отдельный процесс на подписку: свой channels().list и свой обход видео канала каждый тик
+    naive = len(main.subscriptions) * (1 + math.ceil(args.videos_per_channel / 50))
+    print(f"Без общего конвейера: {naive} запросов за тик")
+
+
+# Сутки квоты по тикам POLL_INTERVAL: каждый запрос плана считается выполненным,
+# видео растут со случайной скоростью и расходятся по уровням опроса main
+def simulate_day(channels, args):
+    rng = random.Random(channels)
+    scheduler = QuotaScheduler(
+        daily_budget=args.budget, poll_interval=main.POLL_INTERVAL,
+        tiers=main.poll_scheduler.tiers, channel_interval=main.CHANNEL_POLL_INTERVAL
+    )
+    now = scheduler.next_reset() - timedelta(days=1)
+    scheduler.reset_at = scheduler.next_reset(now)
+    end = scheduler.reset_at - timedelta(seconds=1)
+    channel_ids = ["UC" + f"{i:022d}" for i in range(channels)]
+    video_ids = [f"v{i:010d}" for i in range(args.day_videos)]
+    rates = {video_id: rng.lognormvariate(0, 2.5) / 3600 for video_id in video_ids}  # просмотров в секунду
+    views = dict.fromkeys(video_ids, 0)
+    last_polled = {}
+    max_gap = 0.0
+    ticks = channel_polls = video_polls = 0
+    while now < end:
+        plan = scheduler.plan_tick(video_ids, channel_ids, now=now)
+        if plan.exhausted:
+            break
+        for _ in range(math.ceil(len(plan.channel_ids) / 50)):
+            scheduler.record('youtube.channels.list')
+        for _ in range(math.ceil(len(plan.video_ids) / 50)):
+            scheduler.record('youtube.videos.list')
+        timestamp = now.timestamp()
+        for channel_id in plan.channel_ids:
+            max_gap = max(max_gap, timestamp - last_polled.get(channel_id, timestamp))
+            last_polled[channel_id] = timestamp
+        for video_id in plan.video_ids:
+            views[video_id] += int(rates[video_id] * main.POLL_INTERVAL * rng.random() * 2)
+        scheduler.observe(plan.video_ids, {video_id: {'viewCount': views[video_id]} for video_id in plan.video_ids}, now=now)
+        scheduler.observe_channels(plan.channel_ids, dict.fromkeys(plan.channel_ids, {}), now=now)
+        ticks += 1
+        channel_polls += len(plan.channel_ids)
+        video_polls += len(plan.video_ids)
+        now += timedelta(seconds=main.POLL_INTERVAL)
+    # Самый давний замер канала к концу суток тоже входит в худший интервал
+    max_gap = max([max_gap] + [now.timestamp() - last_polled.get(channel_id, 0) for channel_id in channel_ids])
+    return scheduler.spent, ticks, channel_polls, video_polls, max_gap
+
+
+def quota_day(args):
+    print(f"\nМодельные сутки квоты: бюджет {args.budget}, видео: {args.day_videos}, тик {main.POLL_INTERVAL} с, "
+          f"опрос каналов раз в {main.CHANNEL_POLL_INTERVAL} с")
+    print(f"{'каналов':>8} | {'потрачено':>9} | {'тиков':>5} | {'каналов/тик':>11} | {'видео/тик':>9} | {'худший интервал канала':>22}")
+    within_budget = True
+    for channels in args.day_channels:
+        spent, ticks, channel_polls, video_polls, max_gap = simulate_day(channels, args)
+        within_budget &= spent <= args.budget
+        print(f"{channels:>8} | {spent:>9} | {ticks:>5} | {channel_polls / max(ticks, 1):>11.1f} | "
+              f"{video_polls / max(ticks, 1):>9.1f} | {max_gap / 60:>18.0f} мин")
+    return within_budget
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channels', type=int, default=300)
+    parser.add_argument('--videos-per-channel', type=int, default=20)
+    parser.add_argument('--chats', type=int, default=1500)
+    parser.add_argument('--channels-per-chat', type=int, default=2)
+    parser.add_argument('--ticks', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--active-share', type=float, default=0.05)
+    parser.add_argument('--chat-rate', type=float, default=100.0)
+    parser.add_argument('--global-rate', type=float, default=3000.0)
+    parser.add_argument('--flood-share', type=float, default=0.01)
+    parser.add_argument('--budget', type=int, default=main.DAILY_QUOTA_BUDGET, help="DAILY_QUOTA_BUDGET планировщика")
+    parser.add_argument('--day-channels', type=int, nargs='+', default=[100, 300, 1000, 3000])
+    parser.add_argument('--day-videos', type=int, default=2000, help="Видео в модельных сутках квоты")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+    sys.exit(0 if quota_day(args) else 1)
@@ -0,0 +1,143 @@
+# Проверка приемника WebSub на локальном хабе: подписка с подтверждением, продление аренды,
+# отбрасывание уведомлений с неверной подписью и задержка от публикации до начала опроса нового видео.
+# Для сравнения выводится средняя задержка и расход квоты обхода плейлистов раз в VIDEO_DISCOVERY_INTERVAL.
+#
+# Запуск: python benchmarks/bench_websub.py [--channels 3] [--uploads 20] [--lease 2]
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:websub")
+os.environ["CHANNEL_ID"] = "UC" + "0" * 22
+os.environ["METRICS_PORT"] = "0"
+os.chdir(tempfile.mkdtemp(prefix="yt_bot_websub_"))
+
+import main
+from fake_hub import FakeHub, deleted_xml, feed_xml
+from fake_youtube import FakeBot, FakeYouTube, FakeYouTubeAnalytics
+from websub import topic_for
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for(predicate, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("условие не выполнено за отведенное время")
+        await asyncio.sleep(0.001)
+
+
+def check(name, condition):
+    print(f"{'OK' if condition else 'FAIL':>4}  {name}")
+    return condition
+
+
+async def run(args):
+    logging.getLogger().setLevel(args.log_level)
+    main.logger.setLevel(args.log_level)
+    channel_ids = [main.CHANNEL_ID] + ["UC" + f"{i:022d}" for i in range(1, args.channels)]
+    youtube = FakeYouTube(video_count=args.channels * 20, latency=args.latency, active_share=0.0, channel_ids=channel_ids)
+    main.bot = FakeBot()
+    for channel_id in channel_ids:
+        main.subscriptions.subscribe(1, channel_id)
+    await main.on_startup(None, services=(None, youtube, FakeYouTubeAnalytics(latency=0)))
+
+    hub = FakeHub(max_lease=args.lease)
+    port = free_port()
+    main.WEBSUB_HUB_URL = await hub.start()
+    main.WEBSUB_CALLBACK_URL = f"http://127.0.0.1:{port}/websub"
+    main.WEBSUB_HOST, main.WEBSUB_PORT, main.WEBSUB_SECRET = '127.0.0.1', port, 'bench-secret'
+    runner = await main.start_websub_server()
+    # Короткая аренда: продление за половину срока, проверка каждые 50 мс
+    main.websub.renew_margin = args.lease / 2
+    main.websub.retry_interval = args.lease / 2
+    renew = asyncio.create_task(main.websub.renew_task(main.subscriptions.channels, check_interval=0.05))
+
+    results = []
+    try:
+        # Хаб засчитывает подтверждение после ответа приемника, то есть позже, чем подписка становится активной
+        await wait_for(lambda: all(main.websub.is_active(channel_id) for channel_id in channel_ids)
+                       and hub.verifications >= len(channel_ids))
+        results.append(check(f"подписки подтверждены хабом: {len(channel_ids)}", hub.verifications >= len(channel_ids)))
+        verified = main.websub.stats['verified']
+        await asyncio.sleep(args.lease * 1.5)
+        results.append(check(
+            f"аренда продлена: подтверждений {main.websub.stats['verified'] - verified} за {args.lease * 1.5:.1f} с",
+            main.websub.stats['verified'] > verified and all(hub.is_subscribed(topic_for(c)) for c in channel_ids)
+        ))
+
+        fake_id = "forged00000"
+        await hub.publish(topic_for(channel_ids[0]), feed_xml(fake_id, channel_ids[0]), signature_secret="wrong")
+        await asyncio.sleep(0.05)
+        results.append(check("уведомление с неверной подписью отброшено", fake_id not in main.video_channels))
+
+        # Подпись верна, но канал в записи чужой: видео другого канала и удаление чужого видео
+        foreign_id = "foreign0000"
+        youtube.upload(foreign_id, channel_ids[1])
+        await hub.publish(topic_for(channel_ids[0]), feed_xml(foreign_id, channel_ids[0]))
+        await hub.publish(topic_for(channel_ids[0]), deleted_xml(main.get_channel_video_ids(channel_ids[1])[-1], channel_ids[0]))
+        await asyncio.sleep(0.2)
+        results.append(check(
+            "запись с чужим каналом отброшена",
+            foreign_id not in main.video_channels and main.get_channel_video_ids(channel_ids[1])[-1] in main.get_tracked_video_ids()
+        ))
+
+        latencies = []
+        calls = youtube.calls
+        for i in range(args.uploads):
+            channel_id = channel_ids[i % len(channel_ids)]
+            video_id = f"push{i:07d}"
+            youtube.upload(video_id, channel_id, views=i)
+            started = time.perf_counter()
+            await hub.publish(topic_for(channel_id), feed_xml(video_id, channel_id, f"Видео {video_id}"))
+            await wait_for(lambda: video_id in main.video_snapshot)
+            latencies.append(time.perf_counter() - started)
+        calls = youtube.calls - calls
+        results.append(check(
+            f"новые видео опрошены: {args.uploads}, задержка p50/max {statistics.median(latencies) * 1000:.1f}/"
+            f"{max(latencies) * 1000:.1f} мс, запросов Data API на видео: {calls / args.uploads:.1f}",
+            all(f"push{i:07d}" in main.get_tracked_video_ids() for i in range(args.uploads))
+        ))
+
+        await hub.publish(topic_for(channel_ids[0]), deleted_xml("push0000000", channel_ids[0]))
+        await wait_for(lambda: "push0000000" not in main.get_tracked_video_ids())
+        results.append(check("удаленное видео снято с опроса", True))
+
+        await main.notifier.join()
+        results.append(check(f"уведомлений о новых видео отправлено: {len(main.bot.sent)}", len(main.bot.sent) >= args.uploads))
+    finally:
+        renew.cancel()
+        await asyncio.gather(renew, return_exceptions=True)
+        await main.websub.close()
+        await runner.cleanup()
+        await hub.stop()
+        await main.persistence.flush()
+
+    interval = main.VIDEO_DISCOVERY_INTERVAL
+    print(f"\nОбход плейлистов раз в {interval} с: средняя задержка {interval / 2:.0f} с, "
+          f"не меньше {args.channels * 86400 // interval} единиц квоты в сутки; "
+          f"с WebSub — обход раз в {main.WEBSUB_DISCOVERY_INTERVAL} с "
+          f"({args.channels * 86400 // main.WEBSUB_DISCOVERY_INTERVAL} единиц в сутки)")
+    return all(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--uploads', type=int, default=20)
+    parser.add_argument('--lease', type=int, default=2, help="Срок подписки, который выдает хаб, сек")
+    parser.add_argument('--latency', type=float, default=0.005, help="Задержка Data API, сек")
+    parser.add_argument('--log-level', default="ERROR")
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
@@ -0,0 +1,146 @@
+# Масштабирование сборщиков: фронтенд (BOT_ROLE=frontend) планирует тики и раздает запросы к Data API
+# заданиями через общую очередь, сборщики (BOT_ROLE=worker) — отдельные процессы — выполняют их.
+# Очередь — локальная замена Redis (fakeredis.TcpFakeServer) или настоящий Redis (--redis-url).
+# Один сборщик убивается посреди прогона: его задания после окончания аренды берут остальные.
+#
+# Запуск: python benchmarks/bench_workers.py [--workers 1 2 4] [--channels 100] [--videos-per-channel 40]
+# Нужен пакет redis, для локальной замены — fakeredis
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_youtube(args):
+    from fake_youtube import FakeYouTube
+    channel_ids = ["UC" + f"{i:022d}" for i in range(args.channels)]
+    return FakeYouTube(video_count=args.channels * args.videos_per_channel, latency=args.latency,
+                       active_share=0.2, channel_ids=channel_ids)
+
+
+def configure_env(args, role):
+    os.environ["BOT_ROLE"] = role
+    os.environ["STATE_BACKEND_URL"] = args.redis_url
+    os.environ["JOB_LEASE_SECONDS"] = str(args.lease)
+    os.environ["YOUTUBE_WORKERS"] = str(args.threads)
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["CHANNEL_ID"] = "UC" + "0" * 22
+    os.environ.setdefault("BOT_TOKEN", "123456:workers")
+
+
+# Процесс-сборщик: те же синтетические каналы, что и у фронтенда
+def run_worker_process(args):
+    configure_env(args, 'worker')
+    os.environ["WORKER_ID"] = args.worker_id
+    os.chdir(tempfile.mkdtemp(prefix="yt_bot_worker_"))
+    import main
+    main.logger.setLevel(args.log_level)
+    asyncio.run(main.run_worker(services=(None, make_youtube(args), None)))
+
+
+def spawn_workers(args, count):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--redis-url', args.redis_url,
+               '--channels', str(args.channels), '--videos-per-channel', str(args.videos_per_channel),
+               '--latency', str(args.latency), '--lease', str(args.lease), '--threads', str(args.threads)]
+    return [subprocess.Popen(command + ['--worker-id', f"bench-{count}-{i}"]) for i in range(count)]
+
+
+async def run_frontend(args):
+    configure_env(args, 'frontend')
+    os.chdir(tempfile.mkdtemp(prefix="yt_bot_frontend_"))
+    import main
+    from fake_youtube import FakeBot, FakeYouTubeAnalytics
+    main.logger.setLevel(args.log_level)
+    main.bot = FakeBot()
+    main.poll_scheduler.daily_budget = 10 ** 9
+    main.poll_scheduler.tiers = [(0, 0)]  # Каждый тик — все видео: нагрузка на сборщики постоянна
+    youtube = make_youtube(args)
+    for channel_id in youtube.channel_ids:
+        main.subscriptions.subscribe(1, channel_id)
+    main.REPORT_INTERVAL = 10 ** 9
+    main.last_report_time.update({channel_id: main.datetime.now() for channel_id in youtube.channel_ids})
+
+    results = []
+    for count in args.workers:
+        await main.backend.redis.flushdb()
+        workers = spawn_workers(args, count)
+        tasks = main.start_job_queue()
+        try:
+            # Запуск процесса (импорт aiogram и googleapiclient) в замеры не входит
+            while len(await main.backend.get_state('worker:')) < count:
+                await asyncio.sleep(0.1)
+            # Подготовка: обход плейлистов и метаданные — тоже задания для сборщиков
+            await main.on_startup(None, services=(None, youtube, FakeYouTubeAnalytics(latency=0)))
+            await main.poll_tick()
+            durations = []
+            killed = None
+            for tick in range(args.ticks):
+                if count > 1 and tick == args.ticks - 1:  # Последний тик — с упавшим сборщиком
+                    killed = workers[0]
+                    killed.send_signal(signal.SIGKILL)
+                started = time.perf_counter()
+                plan = await main.poll_tick()
+                durations.append(time.perf_counter() - started)
+            results.append((count, durations, killed is not None, len(plan.video_ids)))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for worker in workers:
+                worker.kill()
+                worker.wait()
+
+    print(f"\nКаналов: {args.channels}, видео: {args.channels * args.videos_per_channel}, задержка API: "
+          f"{args.latency * 1000:.0f} мс, потоков на сборщик: {args.threads}, аренда: {args.lease} с")
+    print(f"{'сборщиков':>9} | {'тик, с (медиана)':>16} | {'тик, с (макс)':>13} | {'видео/с':>9} | сбой сборщика")
+    for count, durations, killed, videos in results:
+        durations = sorted(durations)
+        print(f"{count:>9} | {durations[len(durations) // 2]:>16.2f} | {durations[-1]:>13.2f} | "
+              f"{videos * len(durations) / sum(durations):>9.0f} | {'да, тики завершены' if killed else '—'}")
+    await main.backend.close()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--channels', type=int, default=100)
+    parser.add_argument('--videos-per-channel', type=int, default=40)
+    parser.add_argument('--ticks', type=int, default=6)
+    parser.add_argument('--latency', type=float, default=0.1, help="Задержка Data API, сек")
+    parser.add_argument('--threads', type=int, default=4, help="YOUTUBE_WORKERS каждого сборщика")
+    parser.add_argument('--lease', type=float, default=2.0, help="JOB_LEASE_SECONDS")
+    parser.add_argument('--redis-url', default=None, help="Настоящий Redis вместо локальной замены")
+    parser.add_argument('--log-level', default="ERROR")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-id', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker_process(args)
+        return
+    if args.redis_url is None:
+        from fakeredis import TcpFakeServer
+        port = free_port()
+        server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        args.redis_url = f"redis://127.0.0.1:{port}/0"
+    asyncio.run(run_frontend(args))
+
+
+if __name__ == '__main__':
+    main_cli()
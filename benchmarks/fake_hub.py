@@ -0,0 +1,132 @@
+# Локальная замена хаба WebSub (PubSubHubbub) для проверки приемника без внешней сети:
+# принимает subscribe/unsubscribe, проверяет намерение GET-запросом на callback с hub.challenge
+# и рассылает подписчикам Atom-уведомления с подписью X-Hub-Signature, как хаб YouTube
+import asyncio
+import hashlib
+import hmac
+import secrets
+import time
+
+import aiohttp
+from aiohttp import web
+
+FEED_TEMPLATE = """<?xml version='1.0' encoding='UTF-8'?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+  <link rel="hub" href="https://pubsubhubbub.appspot.com"/>
+  <link rel="self" href="https://www.youtube.com/xml/feeds/videos.xml?channel_id={channel_id}"/>
+  <title>YouTube video feed</title>
+  <updated>{updated}</updated>
+  <entry>
+    <id>yt:video:{video_id}</id>
+    <yt:videoId>{video_id}</yt:videoId>
+    <yt:channelId>{channel_id}</yt:channelId>
+    <title>{title}</title>
+    <link rel="alternate" href="https://www.youtube.com/watch?v={video_id}"/>
+    <author>
+      <name>Channel</name>
+      <uri>https://www.youtube.com/channel/{channel_id}</uri>
+    </author>
+    <published>{updated}</published>
+    <updated>{updated}</updated>
+  </entry>
+</feed>"""
+
+DELETED_TEMPLATE = """<?xml version='1.0' encoding='UTF-8'?>
+<feed xmlns:at="http://purl.org/atompub/tombstones/1.0" xmlns="http://www.w3.org/2005/Atom">
+  <at:deleted-entry ref="yt:video:{video_id}" when="{updated}">
+    <link href="https://www.youtube.com/watch?v={video_id}"/>
+    <at:by>
+      <name>Channel</name>
+      <uri>https://www.youtube.com/channel/{channel_id}</uri>
+    </at:by>
+  </at:deleted-entry>
+</feed>"""
+
+
+def _now():
+    return time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime())
+
+
+def feed_xml(video_id, channel_id, title="Новое видео"):
+    return FEED_TEMPLATE.format(video_id=video_id, channel_id=channel_id, title=title, updated=_now()).encode('utf-8')
+
+
+def deleted_xml(video_id, channel_id):
+    return DELETED_TEMPLATE.format(video_id=video_id, channel_id=channel_id, updated=_now()).encode('utf-8')
+
+
+class FakeHub:
+    # max_lease — наибольший срок подписки, который хаб выдает (YouTube выдает 5 суток)
+    def __init__(self, max_lease=432000):
+        self.max_lease = max_lease
+        self.subscribers = {}  # topic -> {callback: (secret, expires_at)}
+        self.requests = []
+        self.verifications = 0
+        self.deliveries = 0
+        self._session = None
+        self._runner = None
+        self._tasks = set()
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_post('/subscribe', self.handle_subscribe)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self._session = aiohttp.ClientSession()
+        return f"http://{host}:{port}/subscribe"
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def handle_subscribe(self, request):
+        form = await request.post()
+        mode, topic, callback = form.get('hub.mode'), form.get('hub.topic'), form.get('hub.callback')
+        if mode not in ('subscribe', 'unsubscribe') or not topic or not callback:
+            return web.Response(status=400, text="hub.mode, hub.topic и hub.callback обязательны")
+        self.requests.append((mode, topic))
+        lease = min(int(form.get('hub.lease_seconds') or self.max_lease), self.max_lease)
+        # Проверка намерения идет после ответа 202, как у асинхронного хаба
+        task = asyncio.create_task(self._verify(mode, topic, callback, lease, form.get('hub.secret')))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=202)
+
+    async def _verify(self, mode, topic, callback, lease, secret):
+        challenge = secrets.token_hex(8)
+        params = {'hub.mode': mode, 'hub.topic': topic, 'hub.challenge': challenge, 'hub.lease_seconds': str(lease)}
+        async with self._session.get(callback, params=params) as response:
+            confirmed = response.status == 200 and await response.text() == challenge
+        self.verifications += 1
+        if not confirmed:
+            return
+        if mode == 'subscribe':
+            self.subscribers.setdefault(topic, {})[callback] = (secret, time.time() + lease)
+        else:
+            self.subscribers.get(topic, {}).pop(callback, None)
+
+    def is_subscribed(self, topic):
+        return any(expires_at > time.time() for _, expires_at in self.subscribers.get(topic, {}).values())
+
+    # Рассылка уведомления всем действующим подписчикам темы; signature_secret подменяет ключ подписи
+    async def publish(self, topic, body, signature_secret=None):
+        delivered = 0
+        for callback, (secret, expires_at) in list(self.subscribers.get(topic, {}).items()):
+            if expires_at <= time.time():
+                continue
+            headers = {'Content-Type': 'application/atom+xml'}
+            key = signature_secret or secret
+            if key:
+                headers['X-Hub-Signature'] = 'sha1=' + hmac.new(key.encode('utf-8'), body, hashlib.sha1).hexdigest()
+            async with self._session.post(callback, data=body, headers=headers) as response:
+                if 200 <= response.status < 300:
+                    delivered += 1
+        self.deliveries += delivered
+        return delivered
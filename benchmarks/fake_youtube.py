@@ -0,0 +1,220 @@
+# Локальная замена YouTube Data API и Analytics API для бенчмарков.
+# Повторяет интерфейс googleapiclient: service.resource().method(...).execute()
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+# Тело ответа Data API при исчерпанной квоте
+QUOTA_EXCEEDED = json.dumps({'error': {
+    'code': 403,
+    'message': 'The request cannot be completed because you have exceeded your quota.',
+    'errors': [{'message': 'quota', 'domain': 'youtube.quota', 'reason': 'quotaExceeded'}]
+}}).encode()
+
+
+# Запрос, который имитирует задержку сети и возвращает заранее собранный ответ.
+# Ответ сериализуется в JSON и разбирается через postproc, как в googleapiclient
+class FakeRequest:
+    def __init__(self, service, method_id, handler, kwargs):
+        self.service = service
+        self.methodId = method_id
+        self.handler = handler
+        self.kwargs = kwargs
+        self.headers = {}
+        self.postproc = lambda resp, content: json.loads(content)
+
+    def execute(self, http=None):
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        quota_limit = getattr(self.service, 'quota_limit', None)
+        if quota_limit is not None:
+            if self.service.quota_used >= quota_limit:
+                self.service.quota_errors += 1
+                raise HttpError(httplib2.Response({'status': 403}), QUOTA_EXCEEDED)
+            self.service.quota_used += 1
+        self.service.calls += 1
+        response = self.handler(**self.kwargs)
+        etag = '"' + hashlib.md5(json.dumps(response, sort_keys=True).encode()).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.service.not_modified += 1
+            raise HttpError(httplib2.Response({'status': 304}), b'')
+        response['etag'] = etag
+        content = json.dumps(response).encode()
+        self.service.bytes_sent += len(content)
+        return self.postproc(httplib2.Response({'status': 200}), content)
+
+
+class FakeResource:
+    def __init__(self, service, name, methods):
+        self.service = service
+        self.name = name
+        self.methods = methods
+
+    def __getattr__(self, method):
+        handler = self.methods[method]
+        method_id = f"{self.service.api_name}.{self.name}.{method}"
+        return lambda **kwargs: FakeRequest(self.service, method_id, handler, kwargs)
+
+
+# Каналы с заданным общим числом видео (распределяются по каналам поровну);
+# при каждом запросе растет доля active_share видео и каналов.
+# После quota_limit запросов (каждый стоит 1 единицу) API отвечает 403 quotaExceeded до reset_quota()
+class FakeYouTube:
+    api_name = 'youtube'
+
+    def __init__(self, video_count=200, latency=0.2, active_share=1.0, seed=0, channel_ids=None, quota_limit=None):
+        self.latency = latency
+        self.quota_limit = quota_limit
+        self.quota_used = 0
+        self.quota_errors = 0
+        self.active_share = active_share
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.videos_polled = 0  # ID в запросах статистики videos().list
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.channel_ids = list(channel_ids or ['UCfakechannel'])
+        self.channel_videos = {channel_id: [] for channel_id in self.channel_ids}
+        self.video_channel = {}
+        self.views = {}
+        self.subscribers = {channel_id: 1000 for channel_id in self.channel_ids}
+        for i in range(video_count):
+            channel_id = self.channel_ids[i % len(self.channel_ids)]
+            self.upload(f"vid{i:07d}", channel_id, views=1000 + i)
+
+    def reset_quota(self):
+        self.quota_used = 0
+
+    @property
+    def video_ids(self):
+        return [video_id for channel_id in self.channel_ids for video_id in self.channel_videos[channel_id]]
+
+    def channels(self):
+        return FakeResource(self, 'channels', {'list': self._channels_list})
+
+    def videos(self):
+        return FakeResource(self, 'videos', {'list': self._videos_list})
+
+    def playlistItems(self):
+        return FakeResource(self, 'playlistItems', {'list': self._playlist_items_list})
+
+    # Новое видео появляется в начале плейлиста загрузок, как на YouTube
+    def upload(self, video_id, channel_id=None, views=0):
+        channel_id = channel_id or self.channel_ids[0]
+        self.channel_videos[channel_id].insert(0, video_id)
+        self.video_channel[video_id] = channel_id
+        self.views[video_id] = views
+
+    def _channels_list(self, part, id, maxResults=None):
+        parts = part.split(',')
+        items = []
+        for channel_id in id.split(','):
+            if channel_id not in self.channel_videos:
+                continue
+            item = {'id': channel_id}
+            if 'statistics' in parts:
+                if self.random.random() < self.active_share:
+                    self.subscribers[channel_id] += 1
+                videos = self.channel_videos[channel_id]
+                item['statistics'] = {
+                    'subscriberCount': str(self.subscribers[channel_id]),
+                    'viewCount': str(sum(self.views[vid] for vid in videos)),
+                    'videoCount': str(len(videos))
+                }
+            if 'contentDetails' in parts:
+                item['contentDetails'] = {'relatedPlaylists': {'uploads': 'UU' + channel_id[2:]}}
+            if 'snippet' in parts:
+                item['snippet'] = {'title': f"Канал {channel_id}"}
+            items.append(item)
+        return {'items': items}
+
+    def _playlist_items_list(self, part, playlistId, maxResults, pageToken=None):
+        videos = self.channel_videos.get('UC' + playlistId[2:], [])
+        start = int(pageToken or 0)
+        end = start + maxResults
+        response = {'items': [{'contentDetails': {'videoId': vid}} for vid in videos[start:end]]}
+        if end < len(videos):
+            response['nextPageToken'] = str(end)
+        return response
+
+    def _videos_list(self, part, id, fields=None):
+        parts = part.split(',')
+        items = []
+        if 'statistics' in parts:
+            self.videos_polled += len(id.split(','))
+        for vid in id.split(','):
+            if vid not in self.views:
+                continue
+            item = {'id': vid, 'etag': f"etag-{vid}"}
+            if 'statistics' in parts:
+                if self.random.random() < self.active_share:
+                    self.views[vid] += 1
+                item['statistics'] = {'viewCount': str(self.views[vid]), 'likeCount': '10', 'commentCount': '2'}
+            if 'contentDetails' in parts:
+                item['contentDetails'] = {'duration': 'PT10M'}
+            if 'snippet' in parts:
+                item['snippet'] = {'title': f"Видео {vid}", 'publishedAt': '2024-01-01T00:00:00Z', 'channelId': self.video_channel[vid],
+                                   'liveBroadcastContent': 'none'}
+            items.append(item)
+        return {'items': items}
+
+
+# Telegram-бот, который только считает отправленные сообщения
+# Аналог TelegramRetryAfter: у исключения есть атрибут retry_after
+class FakeRetryAfter(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Flood control exceeded. Retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class FakeBot:
+    # flood_share — доля отправок, на которые «Telegram» отвечает ограничением частоты
+    def __init__(self, latency=0.0, flood_share=0.0, retry_after=0.05, seed=1):
+        self.latency = latency
+        self.flood_share = flood_share
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.sent = []
+        self.flooded = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_share and self.random.random() < self.flood_share:
+            self.flooded += 1
+            raise FakeRetryAfter(self.retry_after)
+        self.sent.append((chat_id, text))
+
+
+class FakeYouTubeAnalytics:
+    api_name = 'youtubeAnalytics'
+
+    # video_ids — видео канала для отчетов с dimensions=video
+    def __init__(self, latency=0.2, video_ids=()):
+        self.latency = latency
+        self.video_ids = list(video_ids)
+        self.calls = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+
+    def reports(self):
+        return FakeResource(self, 'reports', {'query': self._query})
+
+    def _query(self, ids, startDate, endDate, metrics, dimensions, **kwargs):
+        if dimensions == 'day':
+            return {'rows': [[startDate, 500, 40, 1, 5, 3, 1200, 180.5, 4]]}
+        if dimensions == 'gender':
+            return {'rows': [['male', 60.0], ['female', 40.0]]}
+        if dimensions == 'insightTrafficSourceType':
+            return {'rows': [['SUGGESTED', 300], ['YT_SEARCH', 150], ['EXT_URL', 50]]}
+        if dimensions == 'video':
+            rows = [[video_id, 1000 - i, (1000 - i) * 3, 40.0 + i % 50] for i, video_id in enumerate(self.video_ids)]
+            start = kwargs.get('startIndex', 1) - 1
+            return {'rows': rows[start:start + kwargs.get('maxResults', 200)]}
+        return {'rows': []}
@@ -0,0 +1,237 @@
+# Офлайн-прогон бота: background_task и video_discovery_task работают на локальных заменах
+# Data API, Analytics API и Bot API. Поток статистики — синтетический (FakeYouTube) или записанный
+# ботом в stats.db (--replay). Сеть не нужна, поэтому прогон подходит для CI:
+# --max-p99-ms и --min-ticks-per-sec завершают процесс с кодом 1 при регрессии.
+#
+# Запуск: python benchmarks/replay.py [--ticks 50] [--channels 3] [--videos-per-channel 200] [--json]
+#         python benchmarks/replay.py --replay stats.db
+#         python benchmarks/replay.py --quota-limit 300 --day 0.5
+#         python benchmarks/replay.py --ticks 1440 --tick-seconds 60 [--every-tick]
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:replay")
+os.environ["CHANNEL_ID"] = "UC" + "0" * 22
+os.environ["METRICS_PORT"] = "0"
+
+REPLAY_DB = None
+if '--replay' in sys.argv:
+    REPLAY_DB = os.path.abspath(sys.argv[sys.argv.index('--replay') + 1])
+os.chdir(tempfile.mkdtemp(prefix="yt_bot_replay_"))
+
+import main
+from fake_youtube import FakeBot, FakeYouTube, FakeYouTubeAnalytics
+from notifier import NotificationDispatcher
+
+
+# Записанный поток: замеры каналов и видео из stats.db, сгруппированные по времени замера
+def load_frames(path):
+    conn = sqlite3.connect(path)
+    frames = {}
+    for channel_id, ts, subscribers in conn.execute("SELECT channel_id, ts, subscribers FROM channel_stats ORDER BY ts"):
+        frames.setdefault(ts, ({}, {}))[0][channel_id] = subscribers
+    for video_id, ts, views in conn.execute("SELECT video_id, ts, views FROM video_stats ORDER BY ts"):
+        frames.setdefault(ts, ({}, {}))[1][video_id] = views
+    conn.close()
+    return [frames[ts] for ts in sorted(frames)]
+
+
+def make_youtube(args):
+    if not REPLAY_DB:
+        channel_ids = [main.CHANNEL_ID] + ["UC" + f"{i:022d}" for i in range(1, args.channels)]
+        return FakeYouTube(
+            video_count=args.channels * args.videos_per_channel, latency=args.latency,
+            active_share=args.active_share, seed=args.seed, channel_ids=channel_ids, quota_limit=args.quota_limit
+        ), None
+
+    frames = load_frames(REPLAY_DB)
+    if not frames:
+        raise SystemExit(f"В {REPLAY_DB} нет замеров")
+    channel_ids = sorted({channel_id for channels, _ in frames for channel_id in channels}) or [main.CHANNEL_ID]
+    video_ids = sorted({video_id for _, videos in frames for video_id in videos})
+    # Владелец токена — первый канал записи: для него строится аналитика
+    main.CHANNEL_ID = channel_ids[0]
+    youtube = FakeYouTube(video_count=0, latency=args.latency, active_share=0.0, channel_ids=channel_ids,
+                          quota_limit=args.quota_limit)
+    for i, video_id in enumerate(video_ids):
+        youtube.upload(video_id, channel_ids[i % len(channel_ids)])
+    return youtube, frames
+
+
+def apply_frame(youtube, frame):
+    channels, videos = frame
+    youtube.subscribers.update({channel_id: value for channel_id, value in channels.items() if channel_id in youtube.subscribers})
+    youtube.views.update({video_id: value for video_id, value in videos.items() if video_id in youtube.views})
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def run(args):
+    logging.getLogger().setLevel(args.log_level)
+    main.logger.setLevel(args.log_level)
+    youtube, frames = make_youtube(args)
+    youtube_analytics = FakeYouTubeAnalytics(latency=args.analytics_latency, video_ids=youtube.video_ids)
+    main.bot = FakeBot(latency=args.bot_latency, flood_share=args.flood_share)
+    main.notifier = NotificationDispatcher(
+        main.send_message, chat_rate=args.chat_rate, group_rate=args.chat_rate, global_rate=args.global_rate
+    )
+
+    # Тики идут без пауз; «сутки» квоты длятся --day секунд, после сброса квота заменителя тоже обновляется
+    day = timedelta(seconds=args.day)
+    main.POLL_INTERVAL = 0
+    main.VIDEO_DISCOVERY_INTERVAL = args.discovery_interval
+    main.poll_scheduler.daily_budget = args.budget
+    main.poll_scheduler.next_reset = lambda now=None: (now or datetime.now(timezone.utc)) + day
+    main.poll_scheduler.reset_at = main.poll_scheduler.next_reset()
+    if args.every_tick:
+        main.poll_scheduler.tiers = [(0, 0)]
+
+    # Модельное время: каждый тик сдвигает часы планировщика на --tick-seconds,
+    # чтобы уровни опроса (минуты, часы, сутки) срабатывали за секунды прогона
+    clock = [datetime.now(timezone.utc)]
+    if args.tick_seconds:
+        scheduler = main.poll_scheduler
+        for name in ('plan_tick', 'observe', 'observe_channels', 'tier_counts'):
+            method = getattr(scheduler, name)
+            setattr(scheduler, name, lambda *a, _method=method, **kw: _method(*a, now=clock[0], **kw))
+        main.poll_scheduler.reset_at = main.poll_scheduler.next_reset(clock[0])
+
+    def now():
+        return clock[0] if args.tick_seconds else datetime.now(timezone.utc)
+
+    for chat_id in range(1, args.chats + 1):
+        for channel_id in youtube.channel_ids:
+            main.subscriptions.subscribe(chat_id, channel_id)
+
+    # FETCH_WORKERS > 0: запросы к Data API идут заданиями через очередь сборщиков внутри процесса
+    job_tasks = main.start_job_queue()
+    started = time.perf_counter()
+    await main.on_startup(None, services=(None, youtube, youtube_analytics))
+    startup = time.perf_counter() - started
+
+    # Замер каждого тика, вызванного из background_task
+    poll_tick = main.poll_tick
+    latencies = []
+    done = asyncio.Event()
+
+    async def measured_tick():
+        if args.tick_seconds:
+            clock[0] += timedelta(seconds=args.tick_seconds)
+        if youtube.quota_limit is not None and now() >= main.poll_scheduler.reset_at:
+            youtube.reset_quota()
+        if frames:
+            apply_frame(youtube, frames[len(latencies) % len(frames)])
+        elif args.upload_every and latencies and len(latencies) % args.upload_every == 0:
+            youtube.upload(f"new{len(latencies):07d}", youtube.channel_ids[len(latencies) % len(youtube.channel_ids)], views=0)
+        tick_started = time.perf_counter()
+        try:
+            return await poll_tick()
+        finally:
+            latencies.append(time.perf_counter() - tick_started)
+            if len(latencies) >= args.ticks:
+                done.set()
+
+    main.poll_tick = measured_tick
+    calls_before, videos_before, units_before = youtube.calls, youtube.videos_polled, sum(main.metrics.counter_values('quota_units_total').values())
+    started = time.perf_counter()
+    tasks = job_tasks + [asyncio.create_task(main.background_task()), asyncio.create_task(main.video_discovery_task())]
+    try:
+        await asyncio.wait_for(done.wait(), timeout=args.timeout)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        main.poll_tick = poll_tick
+    elapsed = time.perf_counter() - started
+    await main.notifier.join()
+    await main.persistence.flush()
+
+    delivery = main.notifier.metrics()
+    units = sum(main.metrics.counter_values('quota_units_total').values()) - units_before
+    return {
+        'source': REPLAY_DB or 'synthetic',
+        'channels': len(youtube.channel_ids),
+        'videos': len(youtube.video_ids),
+        'chats': args.chats,
+        'startup_seconds': round(startup, 3),
+        'ticks': len(latencies),
+        'ticks_per_second': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'tick_p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'tick_p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'tick_max_ms': round(max(latencies) * 1000, 1),
+        'videos_by_tier': main.poll_scheduler.tier_counts(),
+        'data_api_requests': youtube.calls - calls_before,
+        'videos_polled': youtube.videos_polled - videos_before,
+        'quota_units': units,
+        'quota_errors': youtube.quota_errors,
+        'analytics_requests': youtube_analytics.calls,
+        'messages_sent': len(main.bot.sent),
+        'state_file_writes': main.persistence.writes,
+        'messages_failed': delivery['failed'],
+        'telegram_retries': delivery['retries'],
+        'delivery_p99_seconds': round(delivery['latency_p99'], 3)
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Офлайн-прогон бота на локальных заменах API")
+    parser.add_argument('--replay', help="stats.db с записанными замерами вместо синтетического потока")
+    parser.add_argument('--ticks', type=int, default=50)
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--videos-per-channel', type=int, default=200)
+    parser.add_argument('--chats', type=int, default=10)
+    parser.add_argument('--active-share', type=float, default=0.2, help="Доля видео, растущих за запрос")
+    parser.add_argument('--upload-every', type=int, default=10, help="Новая загрузка каждые N тиков (0 — нет)")
+    parser.add_argument('--latency', type=float, default=0.005, help="Задержка Data API, сек")
+    parser.add_argument('--analytics-latency', type=float, default=0.01)
+    parser.add_argument('--bot-latency', type=float, default=0.0)
+    parser.add_argument('--flood-share', type=float, default=0.0, help="Доля ответов Telegram с retry_after")
+    parser.add_argument('--chat-rate', type=float, default=1000.0)
+    parser.add_argument('--global-rate', type=float, default=10000.0)
+    parser.add_argument('--quota-limit', type=int, default=None, help="Единиц Data API в сутки до 403 quotaExceeded")
+    parser.add_argument('--budget', type=int, default=10 ** 9, help="DAILY_QUOTA_BUDGET планировщика")
+    parser.add_argument('--day', type=float, default=3600.0, help="Длина суток квоты, сек")
+    parser.add_argument('--tick-seconds', type=float, default=0.0,
+                        help="Модельное время одного тика для планировщика, сек (0 — реальное время)")
+    parser.add_argument('--every-tick', action='store_true', help="Опрашивать все видео каждый тик, без уровней")
+    parser.add_argument('--discovery-interval', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=600.0)
+    parser.add_argument('--log-level', default="ERROR")
+    parser.add_argument('--json', action='store_true', help="Результат одной строкой JSON")
+    parser.add_argument('--max-p99-ms', type=float, default=None)
+    parser.add_argument('--min-ticks-per-sec', type=float, default=None)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        for key, value in result.items():
+            print(f"{key:>22}: {value}")
+
+    failed = []
+    if args.max_p99_ms is not None and result['tick_p99_ms'] > args.max_p99_ms:
+        failed.append(f"p99 тика {result['tick_p99_ms']} мс > {args.max_p99_ms} мс")
+    if args.min_ticks_per_sec is not None and result['ticks_per_second'] < args.min_ticks_per_sec:
+        failed.append(f"{result['ticks_per_second']} тиков/с < {args.min_ticks_per_sec}")
+    if failed:
+        print("Регрессия: " + "; ".join(failed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -1,32 +1,119 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # Начало запуска процесса: загрузка модулей входит в время старта
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiohttp import web
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google_auth_oauthlib.flow import InstalledAppFlow
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
 import isodate
 import asyncio
-from datetime import datetime, timedelta
+from collections import OrderedDict
+import functools
+import threading
+from datetime import datetime, timedelta, timezone
 import logging
 import pickle
 import os
 import json
+import socket
+import uuid
 from dotenv import load_dotenv
+from quota import QuotaScheduler
+from timeseries import StatsStore, DAY
+from subscriptions import SubscriptionRegistry
+from notifier import NotificationDispatcher, split_message
+from snapshot import VideoSnapshot
+from anomaly import SPIKE, EwmaDetector
+from metrics import Metrics
+from persistence import DebouncedWriter, atomic_write
+from websub import HUB_URL, MAX_NOTIFICATION_SIZE, WebSubSubscriber
+from backend import create_backend
+from report import (
+    SectionCache, render_activity, render_audience, render_comparison, render_header, render_metrics,
+    render_top_videos, render_traffic, render_trend
+)
 
 # Загрузка переменных из .env
 load_dotenv()
 
 # Константы из .env
 API_KEY = os.getenv("API_KEY")
-CHANNEL_ID = os.getenv("CHANNEL_ID")
+CHANNEL_ID = os.getenv("CHANNEL_ID")  # Канал владельца OAuth-токена: только для него доступен Analytics API
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CREDENTIALS_FILE = os.getenv("CREDENTIALS_FILE")
 TOKEN_FILE = os.getenv("TOKEN_FILE")
-CHAT_ID_FILE = "chat_id.txt"
-REPORT_DATA_FILE = "report_data.json"
-ANALYTICS_CACHE_FILE = "analytics_cache.json"
+CHAT_ID_FILE = "chat_id.txt"  # Прежний формат, импортируется в SUBSCRIPTIONS_FILE при первом запуске
+SUBSCRIPTIONS_FILE = "subscriptions.json"
+REPORT_DATA_FILE = "report_data.json"  # Прежний формат, импортируется в STATS_DB_FILE при первом запуске
+STATS_DB_FILE = os.getenv("STATS_DB_FILE", "stats.db")
+VIDEO_CURSOR_FILE = "video_cursor.json"
+VIDEO_METADATA_FILE = "video_metadata.json"
+WARM_STATE_FILE = os.getenv("WARM_STATE_FILE", "warm_state.json")  # Снимок последних данных для быстрого запуска
+WARM_STATE_INTERVAL = int(os.getenv("WARM_STATE_INTERVAL", "300"))  # Как часто обновляется снимок, сек (и при остановке)
+SHORTS_MAX_DURATION = 320  # Видео короче (в секундах) считаются Shorts и не отслеживаются
+YOUTUBE_WORKERS = int(os.getenv("YOUTUBE_WORKERS", "4"))  # Размер пула потоков для запросов к API
+POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "60"))  # Интервал опроса горячих видео, сек
+WARM_POLL_INTERVAL = int(os.getenv("WARM_POLL_INTERVAL", "600"))  # Интервал опроса видео с умеренным ростом, сек
+COLD_POLL_INTERVAL = int(os.getenv("COLD_POLL_INTERVAL", "3600"))  # Интервал опроса медленно растущих видео, сек
+DORMANT_POLL_INTERVAL = int(os.getenv("DORMANT_POLL_INTERVAL", "86400"))  # Интервал опроса видео без роста, сек
+CHANNEL_POLL_INTERVAL = int(os.getenv("CHANNEL_POLL_INTERVAL", "600"))  # Интервал опроса статистики каналов, сек
+DAILY_QUOTA_BUDGET = int(os.getenv("DAILY_QUOTA_BUDGET", "9000"))  # Дневной бюджет единиц квоты Data API
+HOT_VIDEO_AGE_HOURS = int(os.getenv("HOT_VIDEO_AGE_HOURS", "48"))  # Новые видео считаются горячими
+HOT_VIEWS_PER_HOUR = int(os.getenv("HOT_VIEWS_PER_HOUR", "60"))  # Рост просмотров, при котором видео горячее
+WARM_VIEWS_PER_HOUR = float(os.getenv("WARM_VIEWS_PER_HOUR", "6"))  # Рост для опроса раз в WARM_POLL_INTERVAL
+COLD_VIEWS_PER_HOUR = float(os.getenv("COLD_VIEWS_PER_HOUR", "0.5"))  # Ниже — видео опрашивается раз в сутки
+VIDEO_DISCOVERY_INTERVAL = int(os.getenv("VIDEO_DISCOVERY_INTERVAL", "900"))  # Проверка новых загрузок, сек
+METADATA_REFRESH_INTERVAL = int(os.getenv("METADATA_REFRESH_INTERVAL", "604800"))  # Обновление названий и длительности, сек
+STATS_RAW_RETENTION_DAYS = int(os.getenv("STATS_RAW_RETENTION_DAYS", "2"))  # Все замеры
+STATS_HOURLY_RETENTION_DAYS = int(os.getenv("STATS_HOURLY_RETENTION_DAYS", "30"))  # По одному замеру в час
+STATS_DAILY_RETENTION_DAYS = int(os.getenv("STATS_DAILY_RETENTION_DAYS", "400"))  # По одному замеру в сутки
+NOTIFY_MIN_DELTA = int(os.getenv("NOTIFY_MIN_DELTA", "10"))  # Минимальное изменение просмотров в оповещении
+NOTIFY_MIN_LIKES = int(os.getenv("NOTIFY_MIN_LIKES", "3"))  # Минимальное изменение лайков в оповещении
+NOTIFY_MIN_SUBSCRIBERS = int(os.getenv("NOTIFY_MIN_SUBSCRIBERS", "1"))  # Минимальное изменение подписчиков в оповещении
+NOTIFY_MAX_VIDEOS = int(os.getenv("NOTIFY_MAX_VIDEOS", "10"))  # Оповещений по каналу в одной сводке, остальные сворачиваются
+ANOMALY_SENSITIVITY = float(os.getenv("ANOMALY_SENSITIVITY", "5"))  # Порог отклонения от базовой линии, в стандартных отклонениях
+ANOMALY_HALF_LIFE_HOURS = float(os.getenv("ANOMALY_HALF_LIFE_HOURS", "24"))  # Период полураспада веса старых замеров
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "4"))  # Замеров до первых оповещений по ряду
+ANOMALY_STALE_HOURS = float(os.getenv("ANOMALY_STALE_HOURS", "2"))  # Через сколько часов неизменный счетчик считается нулевым приростом
+SUBSCRIBER_SIGNIFICANT_DIGITS = 3  # Публичное число подписчиков округляется до трех значащих цифр
+REPORT_INTERVAL = int(os.getenv("REPORT_INTERVAL", "86400"))  # Как часто отправляется отчет по каналу, сек (0 — только по /report)
+TOP_DEFAULT = 10  # Видео в ответе /top без аргумента
+TOP_MAX = 50
+PERSIST_DEBOUNCE = float(os.getenv("PERSIST_DEBOUNCE", "2"))  # Задержка записи файлов состояния, сек
+PERSIST_FSYNC = os.getenv("PERSIST_FSYNC", "1") != "0"  # fsync после записи (0 — быстрее, но без гарантий при сбое питания)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # Порт /metrics в формате Prometheus (0 — не запускать)
+WEBSUB_CALLBACK_URL = os.getenv("WEBSUB_CALLBACK_URL")  # Внешний адрес приемника WebSub (не задан — push-уведомления выключены)
+WEBSUB_HUB_URL = os.getenv("WEBSUB_HUB_URL", HUB_URL)
+WEBSUB_SECRET = os.getenv("WEBSUB_SECRET")  # Ключ подписи уведомлений (X-Hub-Signature)
+WEBSUB_HOST = os.getenv("WEBSUB_HOST", "0.0.0.0")
+WEBSUB_PORT = int(os.getenv("WEBSUB_PORT", "8081"))
+WEBSUB_PATH = os.getenv("WEBSUB_PATH", "/websub")
+WEBSUB_LEASE_SECONDS = int(os.getenv("WEBSUB_LEASE_SECONDS", "432000"))  # Запрашиваемый срок подписки, сек
+WEBSUB_DISCOVERY_INTERVAL = int(os.getenv("WEBSUB_DISCOVERY_INTERVAL", "21600"))  # Резервный обход плейлистов при работающем WebSub, сек
+# Время жизни кэша отчетов Analytics API, сек. Дневные данные YouTube обрабатывает раз в сутки с задержкой,
+# 7-дневные срезы аудитории и источников трафика меняются медленно
+ANALYTICS_CACHE_TTL = {
+    'daily_activity': int(os.getenv("ANALYTICS_DAILY_TTL", "43200")),
+    'audience': int(os.getenv("ANALYTICS_AUDIENCE_TTL", "86400")),
+    'traffic_sources': int(os.getenv("ANALYTICS_TRAFFIC_TTL", "43200")),
+    'videos': int(os.getenv("ANALYTICS_VIDEOS_TTL", "43200")),
+}
+VIDEO_ANALYTICS_PAGE_SIZE = 200  # Максимум строк отчета с dimensions=video
+# Роль процесса: all — все в одном процессе, frontend — Telegram, планирование и обработка результатов,
+# worker — только запросы к Data API из общей очереди заданий
+BOT_ROLE = os.getenv("BOT_ROLE", "all")
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL")  # redis://host:6379/0 — общая очередь для нескольких процессов; не задан — в памяти процесса
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "0"))  # Сборщиков внутри процесса при BOT_ROLE=all (0 — запросы без очереди)
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "30"))  # Аренда задания: после нее задание упавшего сборщика берет другой
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "120"))  # Сколько фронтенд ждет результата задания, сек
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
 
 # Настройка логирования
 logging.basicConfig(
@@ -39,52 +126,242 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Инициализация бота и диспетчера. Сборщикам Telegram не нужен; при общем Redis
+# состояние диалогов тоже хранится в нем
+bot = Bot(token=BOT_TOKEN) if BOT_ROLE != 'worker' else None
+if STATE_BACKEND_URL and STATE_BACKEND_URL.startswith(('redis://', 'rediss://', 'unix://')):
+    from aiogram.fsm.storage.redis import RedisStorage
+    storage = RedisStorage.from_url(STATE_BACKEND_URL)
+else:
+    storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+# Очередь заданий для сборщиков и поток их результатов
+backend = create_backend(STATE_BACKEND_URL)
+pending_jobs = {}  # ключ задания -> Future с событием-результатом
+
+# Пул потоков для блокирующих запросов к Google API
+api_executor = ThreadPoolExecutor(max_workers=YOUTUBE_WORKERS, thread_name_prefix="youtube-api")
+_thread_local = threading.local()
+
+# ETag последних ответов Data API для условных запросов (If-None-Match)
+ETAG_CACHE_SIZE = 2000
+etag_cache = OrderedDict()
+etag_lock = threading.Lock()
+etag_stats = {'requests': 0, 'not_modified': 0, 'bytes_saved': 0}
+
+# Длительности этапов конвейера и счетчики запросов
+metrics = Metrics()
+
+# Хранилище временных рядов статистики
+stats_store = StatsStore(
+    STATS_DB_FILE,
+    raw_retention=STATS_RAW_RETENTION_DAYS * DAY,
+    hourly_retention=STATS_HOURLY_RETENTION_DAYS * DAY,
+    daily_retention=STATS_DAILY_RETENTION_DAYS * DAY,
+    legacy_channel_id=CHANNEL_ID or ''
+)
+
+# Подписки чатов на каналы
+subscriptions = SubscriptionRegistry(SUBSCRIPTIONS_FILE)
+
+# Отложенная атомарная запись JSON-файлов состояния; файлы регистрируются ниже, после функций сериализации
+persistence = DebouncedWriter(delay=PERSIST_DEBOUNCE, fsync=PERSIST_FSYNC, observe=metrics.observe)
+
+# Очередь исходящих сообщений с ограничением частоты; bot берется в момент отправки
+@metrics.timed('telegram_send')
+async def send_message(chat_id, text):
+    return await bot.send_message(chat_id, text)
+
+notifier = NotificationDispatcher(send_message)
+
+# Планировщик опроса с учетом квоты
+poll_scheduler = QuotaScheduler(
+    daily_budget=DAILY_QUOTA_BUDGET,
+    poll_interval=POLL_INTERVAL,
+    hot_age=timedelta(hours=HOT_VIDEO_AGE_HOURS),
+    hot_views_per_hour=HOT_VIEWS_PER_HOUR,
+    tiers=[
+        (HOT_VIEWS_PER_HOUR, POLL_INTERVAL),
+        (WARM_VIEWS_PER_HOUR, WARM_POLL_INTERVAL),
+        (COLD_VIEWS_PER_HOUR, COLD_POLL_INTERVAL),
+        (0, DORMANT_POLL_INTERVAL)
+    ],
+    channel_interval=CHANNEL_POLL_INTERVAL
+)
+
 # Глобальные переменные
+credentials = None
 youtube = None
 youtube_analytics = None
-video_ids = []
-prev_subscribers = 0
-prev_video_views = {}
-chat_id = None
-last_report_time = None
-
-# Функция для загрузки данных отчета
-def load_report_data():
-    if os.path.exists(REPORT_DATA_FILE):
-        with open(REPORT_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+video_cursor = {}  # {channel_id: {'uploads_playlist_id', 'title', 'video_ids', 'pushed_ids'}}
+video_channels = {}  # video_id -> channel_id
+video_metadata = {}
+last_channel_stats = {}
+channel_rows = {}  # channel_id -> строка в subscriber_detector
+video_snapshot = VideoSnapshot()  # Последние известные просмотры, лайки и комментарии всех видео
+last_report_time = {}
+last_analytics_data = None  # Последний результат fetch_analytics_data для канала CHANNEL_ID
+last_poll_ts = None  # Время замеров последнего тика
+channel_comparisons = {}  # channel_id -> (last_poll_ts, сравнение с прошлыми периодами)
+top_growth_cache = {}  # (channel_id, k) -> (ключ, срез отчета, [(video_id, прирост)])
+report_sections = SectionCache()  # Готовые разделы отчетов по каналам
+# Базовые линии скорости роста: просмотры и лайки по строкам video_snapshot, подписчики — по channel_rows
+view_detector = EwmaDetector(ANOMALY_SENSITIVITY, ANOMALY_HALF_LIFE_HOURS, ANOMALY_MIN_SAMPLES, NOTIFY_MIN_DELTA,
+                             stale_hours=ANOMALY_STALE_HOURS)
+like_detector = EwmaDetector(ANOMALY_SENSITIVITY, ANOMALY_HALF_LIFE_HOURS, ANOMALY_MIN_SAMPLES, NOTIFY_MIN_LIKES,
+                             stale_hours=ANOMALY_STALE_HOURS)
+subscriber_detector = EwmaDetector(ANOMALY_SENSITIVITY, ANOMALY_HALF_LIFE_HOURS, ANOMALY_MIN_SAMPLES, NOTIFY_MIN_SUBSCRIBERS,
+                                   capacity=64, stale_hours=ANOMALY_STALE_HOURS,
+                                   significant_digits=SUBSCRIBER_SIGNIFICANT_DIGITS)
+report_baselines = {}  # channel_id -> срез статистики на момент прошлого отчета (загружается из базы один раз)
+last_tick_plan = None
+websub = None  # WebSubSubscriber, если задан WEBSUB_CALLBACK_URL
+last_discovery_time = None
+services_ready = None  # asyncio.Event: клиенты Google API построены (создается в on_startup)
+startup_task = None  # Фоновая часть запуска: клиенты API и первичный обход плейлистов
+startup_timings = {}  # Этап запуска -> длительность, сек
+last_warm_save = 0.0
+
+# Срез прошлого отчета без обращения к базе, если он уже в памяти
+async def get_report_data(channel_id):
+    if channel_id in report_baselines:
+        return report_baselines[channel_id]
+    return await asyncio.to_thread(load_report_data, channel_id)
+
+# Функция для загрузки данных отчета: срез статистики канала на момент его прошлого отчета.
+# Из базы читается только при первом обращении, дальше срез обновляет save_report_data
+def load_report_data(channel_id):
+    if channel_id in report_baselines:
+        return report_baselines[channel_id]
+    last_report_ts = stats_store.get_meta(f'last_report_ts:{channel_id}')
+    if last_report_ts is None:
+        data = {}
+    else:
+        data = stats_store.snapshot_at(float(last_report_ts), channel_id, get_channel_video_ids(channel_id))
+    report_baselines[channel_id] = data
+    return data
+
+# Срез для следующего отчета — текущие значения, те же, что только что записаны в хранилище
+def remember_report_baseline(channel_id, statistics):
+    report_baselines[channel_id] = {
+        'subscribers': int(statistics['subscriberCount']),
+        'total_views': int(statistics['viewCount']),
+        'video_stats': {
+            video_id: video_snapshot.get(video_id)
+            for video_id in get_channel_video_ids(channel_id) if video_id in video_snapshot
+        }
+    }
+
+# Функция для сохранения данных отчета: сами значения уже записаны в хранилище, запоминаем время отчета
+@metrics.timed('persist_report_data')
+def save_report_data(channel_id, report_time):
+    stats_store.set_meta(f'last_report_ts:{channel_id}', int(report_time.timestamp()))
+    logger.info(f"Время отчета по каналу {channel_id} сохранено в {STATS_DB_FILE}")
+
+# Импорт report_data.json прежнего формата в хранилище временных рядов
+def import_legacy_report_data():
+    if not CHANNEL_ID or not os.path.exists(REPORT_DATA_FILE):
+        return
+    if stats_store.get_meta(f'last_report_ts:{CHANNEL_ID}') is not None:
+        return
+    with open(REPORT_DATA_FILE, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    ts = os.path.getmtime(REPORT_DATA_FILE)
+    if 'subscribers' in data:
+        stats_store.add_channel_sample(CHANNEL_ID, ts, {'subscriberCount': data['subscribers'], 'viewCount': data.get('total_views', 0)})
+    stats_store.add_video_samples(ts, data.get('video_stats', {}))
+    stats_store.flush()
+    stats_store.set_meta(f'last_report_ts:{CHANNEL_ID}', int(ts))
+    logger.info(f"Данные из {REPORT_DATA_FILE} импортированы в {STATS_DB_FILE}")
+
+# Функция для загрузки курсоров плейлистов загрузок всех каналов
+def load_video_cursor():
+    if os.path.exists(VIDEO_CURSOR_FILE):
+        with open(VIDEO_CURSOR_FILE, 'r', encoding='utf-8') as f:
+            cursor = json.load(f)
+        # Прежний формат хранил курсор одного канала
+        if 'channel_id' in cursor:
+            channel_id = cursor.pop('channel_id')
+            cursor = {channel_id: cursor}
+        return cursor
     return {}
 
-# Функция для сохранения данных отчета
-def save_report_data(data):
-    with open(REPORT_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    logger.info(f"Данные отчета сохранены в {REPORT_DATA_FILE}")
-
-# Функция для загрузки кэша аналитики
-def load_analytics_cache():
-    if os.path.exists(ANALYTICS_CACHE_FILE):
-        with open(ANALYTICS_CACHE_FILE, 'r', encoding='utf-8') as f:
-            cache = json.load(f)
-            cache_time = datetime.fromisoformat(cache.get('timestamp', '1970-01-01'))
-            if (datetime.now() - cache_time).total_seconds() < 86400:  # Кэш действителен 24 часа
-                return cache.get('data', {})
+# Функция для сохранения курсоров плейлистов загрузок: запись откладывается и выполняется вне цикла событий
+def save_video_cursor():
+    persistence.mark('video_cursor')
+
+# Функция для загрузки кэша метаданных видео
+def load_video_metadata():
+    if os.path.exists(VIDEO_METADATA_FILE):
+        with open(VIDEO_METADATA_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
     return {}
 
-# Функция для сохранения кэша аналитики
-def save_analytics_cache(data):
-    cache = {
-        'timestamp': datetime.now().isoformat(),
-        'data': data
-    }
-    with open(ANALYTICS_CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cache, f, ensure_ascii=False, indent=4)
-    logger.info(f"Кэш аналитики сохранен в {ANALYTICS_CACHE_FILE}")
+# Функция для сохранения кэша метаданных видео
+def save_video_metadata():
+    persistence.mark('video_metadata')
+
+# Снимок для быстрого запуска: последняя статистика каналов и видео, состояние опроса и расход квоты,
+# время последних отчетов. После перезапуска бот сразу отвечает на команды и не опрашивает все видео заново
+def dump_warm_state():
+    return json.dumps({
+        'saved_at': time.time(),
+        'last_poll_ts': last_poll_ts,
+        'channels': last_channel_stats,
+        'videos': video_snapshot.dump_state(),
+        'poll': poll_scheduler.dump_state(),
+        'reports': {channel_id: report_time.isoformat() for channel_id, report_time in last_report_time.items()}
+    }, ensure_ascii=False)
+
+def load_warm_state():
+    global last_poll_ts
+    if not os.path.exists(WARM_STATE_FILE):
+        return False
+    try:
+        with open(WARM_STATE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        last_poll_ts = data['last_poll_ts']
+        last_channel_stats.update(data['channels'])
+        video_snapshot.load_state(data['videos'])
+        poll_scheduler.load_state(data['poll'])
+        last_report_time.update({channel_id: datetime.fromisoformat(value) for channel_id, value in data['reports'].items()})
+    except Exception as e:
+        logger.error(f"Ошибка при чтении {WARM_STATE_FILE}, запуск без снимка: {e}")
+        return False
+    logger.info(f"Снимок {WARM_STATE_FILE} от {datetime.fromtimestamp(data['saved_at']):%d.%m %H:%M}: "
+                f"каналов {len(data['channels'])}, видео {len(video_snapshot)}")
+    return True
+
+# Запись снимка не чаще раза в WARM_STATE_INTERVAL секунд; force — при остановке
+def save_warm_state(force=False):
+    global last_warm_save
+    if force or time.time() - last_warm_save >= WARM_STATE_INTERVAL:
+        last_warm_save = time.time()
+        persistence.mark('warm_state')
+
+persistence.register('video_cursor', VIDEO_CURSOR_FILE, lambda: json.dumps(video_cursor, ensure_ascii=False))
+persistence.register('video_metadata', VIDEO_METADATA_FILE, lambda: json.dumps(video_metadata, ensure_ascii=False))
+persistence.register('subscriptions', SUBSCRIPTIONS_FILE, subscriptions.dumps)
+persistence.register('warm_state', WARM_STATE_FILE, dump_warm_state)
+
+# Кэш отчетов Analytics API: у каждого типа отчета свое время жизни (ANALYTICS_CACHE_TTL)
+def load_analytics_cache(kind):
+    return stats_store.get_cached(kind, ANALYTICS_CACHE_TTL[kind])
+
+def save_analytics_cache(kind, data):
+    stats_store.put_cache({kind: data})
+    logger.info(f"Кэш аналитики ({kind}) сохранен в {STATS_DB_FILE}")
+
+# Аналитика канала владельца из кэша stats.db при запуске, без запросов к API: отчеты сразу
+# после перезапуска содержат аудиторию, трафик и досмотр. Разделы, которых нет в кэше
+# (или истекло время жизни), пусты до следующей загрузки; None — в кэше нет ничего
+def load_cached_analytics():
+    cached = {kind: load_analytics_cache(kind) for kind in ANALYTICS_CACHE_TTL}
+    if all(data is None for data in cached.values()):
+        return None
+    empty = {'daily_activity': [0] * 8, 'audience': {'male': 0, 'female': 0}, 'traffic_sources': {}, 'videos': {}}
+    return {kind: empty[kind] if data is None else data for kind, data in cached.items()}
 
 # Функция для получения учетных данных OAuth
 def get_credentials():
@@ -99,61 +376,179 @@ def get_credentials():
                 return credentials
             if credentials.expired and credentials.refresh_token:
                 credentials.refresh(Request())
-                with open(TOKEN_FILE, 'wb') as token:
-                    pickle.dump(credentials, token)
+                atomic_write(TOKEN_FILE, pickle.dumps(credentials), PERSIST_FSYNC)
                 return credentials
+    # Интерактивная авторизация нужна только при первом запуске: модуль загружается по требованию
+    from google_auth_oauthlib.flow import InstalledAppFlow
     flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, scopes)
     credentials = flow.run_local_server(port=0)
-    with open(TOKEN_FILE, 'wb') as token:
-        pickle.dump(credentials, token)
+    atomic_write(TOKEN_FILE, pickle.dumps(credentials), PERSIST_FSYNC)
     return credentials
 
-# Функция для получения статистики канала (Data API)
+# Выполнение запроса к Google API. httplib2 не потокобезопасен,
+# поэтому каждый поток пула использует собственный HTTP-клиент
+def execute_request(request):
+    method_id = getattr(request, 'methodId', None) or 'unknown'
+    collected = getattr(_thread_local, 'requests', None)
+    if collected is not None:
+        collected.append(method_id)  # Задание сборщика: квоту учитывает фронтенд по результату
+    else:
+        record_api_request(method_id)
+    if credentials is None:
+        return request.execute()
+    http = getattr(_thread_local, 'http', None)
+    if http is None:
+        http = AuthorizedHttp(credentials, http=httplib2.Http())
+        _thread_local.http = http
+    return request.execute(http=http)
+
+def record_api_request(method_id):
+    cost = poll_scheduler.record(method_id)
+    metrics.inc('api_requests_total', method=method_id)
+    metrics.inc('quota_units_total', cost, method=method_id)
+
+# Условный запрос: повторно отправляет ETag прошлого ответа с тем же ключом.
+# Возвращает None, если данные не изменились (304) — тогда разбирать и сравнивать нечего
+def execute_conditional(request, key):
+    with etag_lock:
+        cached = etag_cache.get(key)
+        etag_stats['requests'] += 1
+    if cached:
+        request.headers['If-None-Match'] = cached['etag']
+
+    # Размер тела ответа нужен для подсчета сэкономленного трафика при следующих 304
+    size = [0]
+    postproc = request.postproc
+    def measure(resp, content):
+        size[0] = len(content)
+        return postproc(resp, content)
+    request.postproc = measure
+
+    try:
+        response = execute_request(request)
+    except HttpError as e:
+        if e.resp.status == 304 and cached:
+            with etag_lock:
+                etag_stats['not_modified'] += 1
+                etag_stats['bytes_saved'] += cached['size']
+                etag_cache.move_to_end(key)
+            return None
+        raise
+    if response.get('etag'):
+        with etag_lock:
+            etag_cache[key] = {'etag': response['etag'], 'size': size[0]}
+            etag_cache.move_to_end(key)
+            while len(etag_cache) > ETAG_CACHE_SIZE:
+                etag_cache.popitem(last=False)
+    return response
+
+# Доля запросов, на которые API ответил 304 Not Modified
+def etag_hit_rate():
+    with etag_lock:
+        if not etag_stats['requests']:
+            return 0.0
+        return etag_stats['not_modified'] / etag_stats['requests']
+
+# Запуск блокирующей функции в пуле потоков, чтобы не останавливать цикл событий
+async def run_in_api_pool(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(api_executor, functools.partial(func, *args))
+
+# Функция для получения статистики каналов (Data API): до 50 каналов за один запрос.
+# Для пачек без изменений (304) возвращается последняя известная статистика
+@metrics.timed('get_channel_stats')
+def get_channels_stats(youtube, channel_ids):
+    if youtube is None:
+        logger.error("YouTube API не инициализирован в get_channels_stats.")
+        return {}
+    try:
+        stats = {}
+        for i in range(0, len(channel_ids), 50):
+            chunk = channel_ids[i:i+50]
+            request = youtube.channels().list(part='statistics', id=','.join(chunk), maxResults=50)
+            response = execute_conditional(request, ('channels', ','.join(chunk)))
+            if response is None:
+                stats.update({channel_id: last_channel_stats[channel_id] for channel_id in chunk if channel_id in last_channel_stats})
+                continue
+            for item in response.get('items', []):
+                last_channel_stats[item['id']] = item['statistics']
+                stats[item['id']] = item['statistics']
+        logger.info(f"Успешно получена статистика {len(stats)} каналов.")
+        return stats
+    except HttpError as e:
+        if e.resp.status == 403 and 'quotaExceeded' in str(e):
+            logger.warning("Квота API превышена в get_channels_stats.")
+            raise Exception("Quota exceeded")
+        logger.error(f"HTTP ошибка при получении статистики каналов: {e}")
+        return {}
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики каналов: {e}")
+        return {}
+
+# Функция для получения статистики одного канала (Data API)
 def get_channel_stats(youtube, channel_id):
+    return get_channels_stats(youtube, [channel_id]).get(channel_id)
+
+# Функция для получения плейлистов загрузок и названий каналов: до 50 каналов за один запрос
+@metrics.timed('get_channels_details')
+def get_channels_details(youtube, channel_ids):
     if youtube is None:
-        logger.error("YouTube API не инициализирован в get_channel_stats.")
-        return None
+        logger.error("YouTube API не инициализирован в get_channels_details.")
+        return {}
     try:
-        request = youtube.channels().list(part='statistics', id=channel_id)
-        response = request.execute()
-        logger.info("Успешно получена статистика канала.")
-        return response['items'][0]['statistics']
+        details = {}
+        for i in range(0, len(channel_ids), 50):
+            chunk = channel_ids[i:i+50]
+            request = youtube.channels().list(part='contentDetails,snippet', id=','.join(chunk), maxResults=50)
+            response = execute_request(request)
+            for item in response.get('items', []):
+                details[item['id']] = {
+                    'uploads_playlist_id': item['contentDetails']['relatedPlaylists']['uploads'],
+                    'title': item['snippet']['title']
+                }
+        return details
     except HttpError as e:
         if e.resp.status == 403 and 'quotaExceeded' in str(e):
-            logger.warning("Квота API превышена в get_channel_stats.")
+            logger.warning("Квота API превышена в get_channels_details.")
             raise Exception("Quota exceeded")
-        logger.error(f"HTTP ошибка при получении статистики канала: {e}")
-        return None
+        logger.error(f"HTTP ошибка при получении плейлистов загрузок: {e}")
+        return {}
     except Exception as e:
-        logger.error(f"Ошибка при получении статистики канала: {e}")
-        return None
+        logger.error(f"Ошибка при получении плейлистов загрузок: {e}")
+        return {}
 
-# Функция для получения всех ID видео с канала
-def get_all_video_ids(youtube, channel_id):
+# Функция для получения новых ID видео из плейлиста загрузок (1 единица квоты за страницу).
+# Плейлист отсортирован от новых к старым, поэтому обход останавливается на первом известном ID
+@metrics.timed('get_new_video_ids')
+def get_new_video_ids(youtube, playlist_id, known_ids):
     if youtube is None:
-        logger.error("YouTube API не инициализирован в get_all_video_ids.")
+        logger.error("YouTube API не инициализирован в get_new_video_ids.")
         return []
     try:
-        video_ids = []
+        new_ids = []
         next_page_token = None
         while True:
-            request = youtube.search().list(
-                part='id',
-                channelId=channel_id,
+            request = youtube.playlistItems().list(
+                part='contentDetails',
+                playlistId=playlist_id,
                 maxResults=50,
-                type='video',
                 pageToken=next_page_token
             )
-            response = request.execute()
-            video_ids.extend([item['id']['videoId'] for item in response['items']])
+            response = execute_request(request)
+            for item in response['items']:
+                video_id = item['contentDetails']['videoId']
+                if video_id in known_ids:
+                    logger.info(f"Найдено {len(new_ids)} новых ID видео.")
+                    return new_ids
+                new_ids.append(video_id)
             next_page_token = response.get('nextPageToken')
             if not next_page_token:
                 break
-        logger.info(f"Успешно получено {len(video_ids)} ID видео.")
-        return video_ids
+        logger.info(f"Найдено {len(new_ids)} новых ID видео.")
+        return new_ids
     except HttpError as e:
         if e.resp.status == 403 and 'quotaExceeded' in str(e):
-            logger.warning("Квота API превышена в get_all_video_ids.")
+            logger.warning("Квота API превышена в get_new_video_ids.")
             raise Exception("Quota exceeded")
         logger.error(f"HTTP ошибка при получении ID видео: {e}")
         return []
@@ -161,48 +556,135 @@ def get_all_video_ids(youtube, channel_id):
         logger.error(f"Ошибка при получении ID видео: {e}")
         return []
 
-# Функция для получения статистики видео (Data API)
-def get_video_stats(youtube, video_ids):
+# Функция для получения метаданных видео (Data API). Название и длительность меняются редко,
+# поэтому длительность разбирается заново только при смене ETag элемента.
+# У анонсированных премьер и идущих трансляций длительность P0D: это не Shorts
+@metrics.timed('get_video_metadata')
+def get_video_metadata(youtube, video_ids, cached):
     if youtube is None:
-        logger.error("YouTube API не инициализирован в get_video_stats.")
+        logger.error("YouTube API не инициализирован в get_video_metadata.")
         return {}
     try:
-        stats = {}
+        metadata = {}
+        fetched_at = datetime.now().isoformat()
         for i in range(0, len(video_ids), 50):
             chunk = video_ids[i:i+50]
             request = youtube.videos().list(
-                part='statistics,contentDetails,snippet',
+                part='contentDetails,snippet',
                 id=','.join(chunk)
             )
-            response = request.execute()
+            response = execute_request(request)
             for item in response['items']:
+                previous = cached.get(item['id'])
+                if previous and previous.get('etag') == item['etag'] and 'channel_id' in previous and 'live_broadcast' in previous:
+                    metadata[item['id']] = dict(previous, fetched_at=fetched_at)
+                    continue
                 duration = isodate.parse_duration(item['contentDetails']['duration']).total_seconds()
-                if duration > 320:  # Исключаем Shorts
-                    stats[item['id']] = {
-                        'viewCount': int(item['statistics'].get('viewCount', 0)),
-                        'likeCount': int(item['statistics'].get('likeCount', 0)),
-                        'dislikeCount': int(item['statistics'].get('dislikeCount', 0)),
-                        'commentCount': int(item['statistics'].get('commentCount', 0)),
-                        'title': item['snippet']['title']
-                    }
+                live_broadcast = item['snippet'].get('liveBroadcastContent', 'none')
+                metadata[item['id']] = {
+                    'title': item['snippet']['title'],
+                    'publishedAt': item['snippet'].get('publishedAt'),
+                    'channel_id': item['snippet'].get('channelId'),
+                    'duration': duration,
+                    'live_broadcast': live_broadcast,
+                    'is_short': live_broadcast == 'none' and 0 < duration <= SHORTS_MAX_DURATION,
+                    'etag': item['etag'],
+                    'fetched_at': fetched_at
+                }
+            # Удаленные и приватные видео не возвращаются — запоминаем их, чтобы не запрашивать каждый тик
+            for video_id in chunk:
+                if video_id not in metadata:
+                    metadata[video_id] = {'unavailable': True, 'fetched_at': fetched_at}
+        logger.info(f"Успешно получены метаданные для {len(metadata)} видео.")
+        return metadata
+    except HttpError as e:
+        if e.resp.status == 403 and 'quotaExceeded' in str(e):
+            logger.warning("Квота API превышена в get_video_metadata.")
+            raise Exception("Quota exceeded")
+        logger.error(f"HTTP ошибка при получении метаданных видео: {e}")
+        return {}
+    except Exception as e:
+        logger.error(f"Ошибка при получении метаданных видео: {e}")
+        return {}
+
+# Видео, которые нужно опрашивать: без Shorts и недоступных
+def is_tracked_video(video_id):
+    metadata = video_metadata.get(video_id, {})
+    return not metadata.get('is_short') and not metadata.get('unavailable')
+
+# Анонсированные премьеры, идущие трансляции и видео, длительность которых еще неизвестна
+def get_live_video_ids():
+    return [
+        video_id for video_id in get_all_video_ids()
+        if video_metadata.get(video_id, {}).get('live_broadcast') in ('upcoming', 'live')
+        or video_metadata.get(video_id, {}).get('duration') == 0
+    ]
+
+# ID видео канала (новые первыми)
+def get_channel_video_ids(channel_id):
+    return video_cursor.get(channel_id, {}).get('video_ids', [])
+
+# Видео всех каналов с подписками: пачки по 50 ID собираются из видео разных каналов
+def get_all_video_ids():
+    video_ids = []
+    for channel_id in subscriptions.channels():
+        video_ids.extend(get_channel_video_ids(channel_id))
+    return video_ids
+
+def get_tracked_video_ids():
+    return [video_id for video_id in get_all_video_ids() if is_tracked_video(video_id)]
+
+# Функция для получения статистики видео (Data API). Запрашивается только part=statistics,
+# название и дата публикации берутся из кэша метаданных. Видео из пачек без изменений (304)
+# возвращаются отдельным списком not_modified: сравнивать их с прошлым тиком не нужно, но их
+# просмотры точно не выросли. Видео из пачек, не доставшихся из-за ошибки, нет ни там, ни там
+@metrics.timed('get_video_stats')
+def get_video_stats(youtube, video_ids):
+    stats = {}
+    not_modified = []
+    if youtube is None:
+        logger.error("YouTube API не инициализирован в get_video_stats.")
+        return {'stats': stats, 'not_modified': not_modified}
+    try:
+        video_ids = [video_id for video_id in video_ids if is_tracked_video(video_id)]
+        for i in range(0, len(video_ids), 50):
+            chunk = video_ids[i:i+50]
+            request = youtube.videos().list(
+                part='statistics',
+                id=','.join(chunk),
+                fields='etag,items(id,statistics)'
+            )
+            response = execute_conditional(request, ('videos', ','.join(chunk)))
+            if response is None:
+                not_modified.extend(chunk)
+                continue
+            for item in response['items']:
+                metadata = video_metadata.get(item['id'], {})
+                stats[item['id']] = {
+                    'viewCount': int(item['statistics'].get('viewCount', 0)),
+                    'likeCount': int(item['statistics'].get('likeCount', 0)),
+                    'dislikeCount': int(item['statistics'].get('dislikeCount', 0)),
+                    'commentCount': int(item['statistics'].get('commentCount', 0)),
+                    'title': metadata.get('title', item['id']),
+                    'publishedAt': metadata.get('publishedAt')
+                }
         logger.info(f"Успешно получена статистика для {len(stats)} видео.")
-        return stats
     except HttpError as e:
         if e.resp.status == 403 and 'quotaExceeded' in str(e):
             logger.warning("Квота API превышена в get_video_stats.")
             raise Exception("Quota exceeded")
         logger.error(f"HTTP ошибка при получении статистики видео: {e}")
-        return {}
     except Exception as e:
         logger.error(f"Ошибка при получении статистики видео: {e}")
-        return {}
+    return {'stats': stats, 'not_modified': not_modified}
 
 # Функция для получения аналитики канала за последние 24 часа (Analytics API)
+@metrics.timed('analytics_daily_activity')
 def get_analytics_data(youtube_analytics):
-    cache = load_analytics_cache()
-    if 'daily_activity' in cache:
+    cached = load_analytics_cache('daily_activity')
+    if cached is not None:
         logger.info("Используются кэшированные данные аналитики (daily_activity).")
-        return cache['daily_activity']
+        return cached
     
     try:
         today = datetime.now().date()
@@ -214,8 +696,9 @@ def get_analytics_data(youtube_analytics):
             metrics='views,likes,dislikes,comments,shares,estimatedMinutesWatched,averageViewDuration,subscribersGained',
             dimensions='day'
         )
-        response = request.execute()
-        logger.info(f"Ответ Analytics API (daily_activity): {json.dumps(response, indent=2)}")
+        response = execute_request(request)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Ответ Analytics API (daily_activity): {json.dumps(response, indent=2)}")
         if 'rows' in response and response['rows']:
             row = response['rows'][0]
             data = [
@@ -228,8 +711,7 @@ def get_analytics_data(youtube_analytics):
                 row[7],  # averageViewDuration
                 row[8]   # subscribersGained
             ]
-            cache['daily_activity'] = data
-            save_analytics_cache(cache)
+            save_analytics_cache('daily_activity', data)
             return data
         logger.warning("Нет данных в ответе Analytics API (daily_activity).")
         return [0, 0, 0, 0, 0, 0, 0, 0]
@@ -241,7 +723,12 @@ def get_analytics_data(youtube_analytics):
         return [0, 0, 0, 0, 0, 0, 0, 0]
 
 # Функция для получения данных о поле аудитории
+@metrics.timed('analytics_audience')
 def get_audience_data(youtube_analytics):
+    cached = load_analytics_cache('audience')
+    if cached is not None:
+        logger.info("Используются кэшированные данные аналитики (audience).")
+        return cached
     try:
         today = datetime.now().date()
         last_7_days_start = today - timedelta(days=7)
@@ -252,14 +739,16 @@ def get_audience_data(youtube_analytics):
             metrics='viewerPercentage',
             dimensions='gender'
         )
-        response = request.execute()
-        logger.info(f"Ответ Analytics API (audience): {json.dumps(response, indent=2)}")
+        response = execute_request(request)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Ответ Analytics API (audience): {json.dumps(response, indent=2)}")
         
         genders = {'male': 0, 'female': 0}
         for row in response.get('rows', []):
             gender, percentage = row
             genders[gender] = percentage
-        
+        if response.get('rows'):
+            save_analytics_cache('audience', genders)
         return genders
     except HttpError as e:
         logger.error(f"HTTP ошибка при получении данных аудитории: {e}")
@@ -269,7 +758,12 @@ def get_audience_data(youtube_analytics):
         return {'male': 0, 'female': 0}
 
 # Функция для получения источников трафика
+@metrics.timed('analytics_traffic_sources')
 def get_traffic_sources(youtube_analytics):
+    cached = load_analytics_cache('traffic_sources')
+    if cached is not None:
+        logger.info("Используются кэшированные данные аналитики (traffic sources).")
+        return cached
     try:
         today = datetime.now().date()
         last_7_days_start = today - timedelta(days=7)
@@ -280,14 +774,17 @@ def get_traffic_sources(youtube_analytics):
             metrics='views',
             dimensions='insightTrafficSourceType'
         )
-        response = request.execute()
-        logger.info(f"Ответ Analytics API (traffic sources): {json.dumps(response, indent=2)}")
+        response = execute_request(request)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Ответ Analytics API (traffic sources): {json.dumps(response, indent=2)}")
         
         traffic = {}
         total_views = sum(row[1] for row in response.get('rows', []))
         for row in response.get('rows', []):
             source, views = row
             traffic[source] = (views / total_views) * 100 if total_views > 0 else 0
+        if traffic:
+            save_analytics_cache('traffic_sources', traffic)
         return traffic
     except HttpError as e:
         logger.error(f"HTTP ошибка при получении источников трафика: {e}")
@@ -296,163 +793,690 @@ def get_traffic_sources(youtube_analytics):
         logger.error(f"Ошибка при получении источников трафика: {e}")
         return {}
 
-# Функция для формирования ежедневного отчета
-def generate_daily_report(current_stats, video_stats, analytics_data, report_data):
-    date = datetime.now().strftime("%d %B %Y")
-    report = f"📅 **Ежедневный отчет по каналу**  \nДата: {date}  \n\n"
+# Функция для получения удержания и времени просмотра по видео за 7 дней одним отчетом dimensions=video.
+# Сортировка и разбиение на страницы выполняются на сервере: 500 видео — 3 запроса.
+# Видео без просмотров за период в отчет не попадают
+@metrics.timed('analytics_videos')
+def get_video_analytics(youtube_analytics, video_ids):
+    cached = load_analytics_cache('videos')
+    if cached is not None:
+        logger.info("Используются кэшированные данные аналитики (videos).")
+        return cached
+    try:
+        today = datetime.now().date()
+        last_7_days_start = today - timedelta(days=7)
+        wanted = set(video_ids)
+        videos = {}
+        max_pages = max(1, -(-len(wanted) // VIDEO_ANALYTICS_PAGE_SIZE))
+        for page in range(max_pages):
+            request = youtube_analytics.reports().query(
+                ids="channel==MINE",
+                startDate=last_7_days_start.strftime('%Y-%m-%d'),
+                endDate=today.strftime('%Y-%m-%d'),
+                metrics='views,estimatedMinutesWatched,averageViewPercentage',
+                dimensions='video',
+                sort='-views',
+                maxResults=VIDEO_ANALYTICS_PAGE_SIZE,
+                startIndex=page * VIDEO_ANALYTICS_PAGE_SIZE + 1
+            )
+            response = execute_request(request)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Ответ Analytics API (videos, страница {page + 1}): {json.dumps(response, indent=2)}")
+            rows = response.get('rows', [])
+            for video_id, views, minutes_watched, view_percentage in rows:
+                if video_id in wanted:
+                    videos[video_id] = {
+                        'views': views,
+                        'minutesWatched': minutes_watched,
+                        'viewPercentage': view_percentage
+                    }
+            if len(rows) < VIDEO_ANALYTICS_PAGE_SIZE or len(videos) == len(wanted):
+                break
+        logger.info(f"Получена аналитика по {len(videos)} видео за {page + 1} запрос(а).")
+        if videos:
+            save_analytics_cache('videos', videos)
+        return videos
+    except HttpError as e:
+        logger.error(f"HTTP ошибка при получении аналитики по видео: {e}")
+        return {}
+    except Exception as e:
+        logger.error(f"Ошибка при получении аналитики по видео: {e}")
+        return {}
+
+# Запросы к Data API, которые могут выполнять сборщики. Аргументы и результаты передаются как JSON
+WORKER_JOBS = {
+    'channels_stats': get_channels_stats,
+    'channels_details': get_channels_details,
+    'new_video_ids': lambda youtube, playlist_id, known_ids: get_new_video_ids(youtube, playlist_id, set(known_ids)),
+    'video_metadata': get_video_metadata,
+    'video_stats': get_video_stats,
+}
+
+def use_job_queue():
+    return BOT_ROLE == 'frontend' or FETCH_WORKERS > 0
+
+# Запрос к Data API: в пуле потоков этого процесса или заданием для сборщиков через очередь
+async def call_api(name, youtube, *args):
+    if not use_job_queue():
+        return await run_in_api_pool(WORKER_JOBS[name], youtube, *args)
+    key = f"{name}:{uuid.uuid4().hex}"
+    future = asyncio.get_running_loop().create_future()
+    pending_jobs[key] = future
+    try:
+        await backend.put_job(key, {'name': name, 'args': list(args)})
+        event = await asyncio.wait_for(future, JOB_TIMEOUT)
+    except asyncio.TimeoutError:
+        await backend.cancel(key)
+        raise Exception(f"Задание {name} не выполнено за {JOB_TIMEOUT:.0f} с: нет свободных сборщиков")
+    finally:
+        pending_jobs.pop(key, None)
+    for method_id in event['requests']:
+        record_api_request(method_id)
+    if event['error']:
+        raise Exception(event['error'])
+    return event['result']
+
+# Пачки по 50 ID — отдельные задания, чтобы их параллельно выполняли разные сборщики.
+# make_args строит аргументы задания для пачки
+async def call_api_chunks(name, youtube, ids, make_args=lambda chunk: (chunk,), merge=None):
+    if not use_job_queue() or len(ids) <= 50:
+        return await call_api(name, youtube, *make_args(ids))
+    results = await asyncio.gather(*(call_api(name, youtube, *make_args(ids[i:i+50])) for i in range(0, len(ids), 50)))
+    if merge is not None:
+        return merge(results)
+    merged = {}
+    for result in results:
+        merged.update(result)
+    return merged
+
+def merge_video_stats(results):
+    merged = {'stats': {}, 'not_modified': []}
+    for result in results:
+        merged['stats'].update(result['stats'])
+        merged['not_modified'].extend(result['not_modified'])
+    return merged
+
+# Выполнение задания в потоке пула сборщика: запросы к API собираются для учета квоты на фронтенде
+def run_job(name, args):
+    _thread_local.requests = []
+    try:
+        return {'result': WORKER_JOBS[name](youtube, *args), 'error': None, 'requests': _thread_local.requests}
+    except Exception as e:
+        return {'result': None, 'error': str(e), 'requests': _thread_local.requests}
+    finally:
+        _thread_local.requests = None
+
+# Сборщик: берет задания из очереди с арендой, продлевает ее, пока запрос выполняется,
+# и публикует результат. Задание упавшего сборщика после окончания аренды берет другой
+async def fetch_worker(worker_id):
+    completed = 0
+    while True:
+        try:
+            jobs = await backend.claim(worker_id, limit=YOUTUBE_WORKERS, lease=JOB_LEASE_SECONDS)
+            if jobs:
+                await asyncio.gather(*(run_claimed_job(worker_id, key, payload) for key, payload in jobs))
+                completed += len(jobs)
+            await backend.set_state(f'worker:{worker_id}', {'ts': time.time(), 'jobs': completed})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Сборщик {worker_id}: ошибка очереди заданий: {e}")
+            await asyncio.sleep(1)
+
+async def run_claimed_job(worker_id, key, payload):
+    task = asyncio.ensure_future(run_in_api_pool(run_job, payload['name'], payload['args']))
+    while not task.done():
+        done, _ = await asyncio.wait({task}, timeout=JOB_LEASE_SECONDS / 3)
+        if not done:
+            await backend.renew(key, worker_id, JOB_LEASE_SECONDS)
+    # Сначала результат, потом снятие задания: при падении между ними задание повторится, а не потеряется
+    await backend.publish(dict(task.result(), job=key, worker=worker_id))
+    await backend.complete(key, worker_id)
+
+# Фронтенд: результаты заданий из потока событий передаются ожидающим call_api
+async def job_results_task():
+    after = await backend.latest_event_id()
+    while True:
+        try:
+            events = await backend.read_events(after, block=1.0)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка чтения результатов заданий: {e}")
+            await asyncio.sleep(1)
+            continue
+        for event_id, event in events:
+            after = event_id
+            future = pending_jobs.get(event.get('job'))
+            if future is not None and not future.done():
+                future.set_result(event)
+
+# Задачи очереди заданий для роли процесса: чтение результатов и сборщики внутри процесса
+def start_job_queue():
+    tasks = []
+    if BOT_ROLE == 'worker':
+        tasks.append(asyncio.create_task(fetch_worker(WORKER_ID)))
+    elif use_job_queue():
+        tasks.append(asyncio.create_task(job_results_task()))
+        if BOT_ROLE == 'all':
+            tasks.extend(asyncio.create_task(fetch_worker(f"{WORKER_ID}/{i}")) for i in range(FETCH_WORKERS))
+    return tasks
+
+# Асинхронные обертки над функциями получения данных
+async def fetch_channel_stats(youtube, channel_id):
+    return (await call_api('channels_stats', youtube, [channel_id])).get(channel_id)
+
+async def fetch_channels_stats(youtube, channel_ids):
+    return await call_api('channels_stats', youtube, channel_ids)
+
+async def fetch_new_video_ids(youtube, playlist_id, known_ids):
+    return await call_api('new_video_ids', youtube, playlist_id, list(known_ids))
+
+# Название и дата публикации берутся из кэша метаданных этого процесса: у сборщика его нет
+async def fetch_video_stats(youtube, video_ids):
+    await refresh_video_metadata(youtube, video_ids)
+    result = await call_api_chunks(
+        'video_stats', youtube, [video_id for video_id in video_ids if is_tracked_video(video_id)], merge=merge_video_stats
+    )
+    video_stats = result['stats']
+    for video_id, data in video_stats.items():
+        metadata = video_metadata.get(video_id, {})
+        data['title'] = metadata.get('title', video_id)
+        data['publishedAt'] = metadata.get('publishedAt')
+    return video_stats, result['not_modified']
+
+# Обновление кэша метаданных: отсутствующие видео, а при max_age — и устаревшие записи
+async def refresh_video_metadata(youtube, video_ids, max_age=None):
+    now = datetime.now()
+    stale = [
+        video_id for video_id in video_ids
+        if video_id not in video_metadata or (
+            max_age is not None
+            and (now - datetime.fromisoformat(video_metadata[video_id]['fetched_at'])).total_seconds() >= max_age
+        )
+    ]
+    if not stale:
+        return {}
+    cached = {video_id: video_metadata[video_id] for video_id in stale if video_id in video_metadata}
+    metadata = await call_api_chunks(
+        'video_metadata', youtube, stale, lambda chunk: (chunk, {video_id: cached[video_id] for video_id in chunk if video_id in cached})
+    )
+    if metadata:
+        video_metadata.update(metadata)
+        save_video_metadata()
+    return metadata
+
+# Этап загрузки аналитики: все отчеты Analytics API запрашиваются параллельно до построения отчета.
+# Измерения day, gender и insightTrafficSourceType нельзя объединить в одном reports().query
+async def fetch_analytics_data(youtube_analytics, video_ids=()):
+    daily_activity, audience, traffic_sources, videos = await asyncio.gather(
+        run_in_api_pool(get_analytics_data, youtube_analytics),
+        run_in_api_pool(get_audience_data, youtube_analytics),
+        run_in_api_pool(get_traffic_sources, youtube_analytics),
+        run_in_api_pool(get_video_analytics, youtube_analytics, list(video_ids))
+    )
+    return {'daily_activity': daily_activity, 'audience': audience, 'traffic_sources': traffic_sources, 'videos': videos}
+
+def get_video_title(video_id):
+    return video_metadata.get(video_id, {}).get('title', video_id)
+
+# Видео канала с наибольшим приростом просмотров с момента прошлого отчета: [(video_id, прирост)].
+# Результат хранится до следующего обновления video_snapshot, смены среза отчета или списка видео канала
+def channel_top_growth(channel_id, report_data, k):
+    video_ids = get_channel_video_ids(channel_id)
+    key = (video_snapshot.version, len(video_ids))
+    cached = top_growth_cache.get((channel_id, k))
+    if cached is not None and cached[0] == key and cached[1] is report_data:
+        return cached[2]
+    baseline = {video_id: data['viewCount'] for video_id, data in report_data.get('video_stats', {}).items()}
+    top = video_snapshot.top_growth(video_ids, baseline, k)
+    top_growth_cache[(channel_id, k)] = (key, report_data, top)
+    return top
+
+def get_top_videos(channel_id, report_data, k=2):
+    return [
+        dict(video_snapshot.get(video_id), id=video_id, title=get_video_title(video_id))
+        for video_id, _ in channel_top_growth(channel_id, report_data, k)
+    ]
+
+# Функция для формирования ежедневного отчета. Только форматирует уже загруженные данные:
+# analytics_data — результат fetch_analytics_data (None для чужих каналов, Analytics API доступен только владельцу),
+# top_videos — уже отобранные видео с наибольшим приростом (get_top_videos).
+# Разделы берутся из report_sections, если их входные данные не изменились с прошлой сборки
+@metrics.timed('render_report')
+def generate_daily_report(current_stats, top_videos, analytics_data, report_data, comparison=None, channel_title=None, now=None, channel_id=None):
+    def section(name, render, *args):
+        return report_sections.render(channel_id, name, args, render, *args)
 
-    # Основные метрики
     subscribers = int(current_stats['subscriberCount'])
     subscriber_diff = subscribers - report_data.get('subscribers', 0)
     total_views = int(current_stats['viewCount'])
     views_diff = total_views - report_data.get('total_views', 0)
-    report += "### **Основные метрики**  \n"
-    report += f"▫️ **Подписчики:** {subscribers:,} (+{subscriber_diff})  \n"
-    report += f"▫️ **Просмотры канала:** {total_views:,} (+{views_diff:,})  \n\n"
-
-    # Активность за 24 часа (из Analytics API)
-    views_24h, likes_24h, dislikes_24h, comments_24h, shares_24h, minutes_watched, avg_duration, subs_gained = analytics_data
-    report += "### **Активность за 24 часа**  \n"
-    if views_24h == 0 and subs_gained == 0:
-        report += "⚠️ Данные за последние 24 часа еще не обработаны YouTube Analytics.\n"
-    report += f"▫️ **Просмотры:** {views_24h:,}  \n"
-    report += f"▫️ **Лайки:** {likes_24h:,}  \n"
-    report += f"▫️ **Дизлайки:** {dislikes_24h:,}  \n"
-    report += f"▫️ **Комментарии:** {comments_24h:,}  \n"
-    report += f"▫️ **Шеры:** {shares_24h:,}  \n"
-    report += f"▫️ **Средняя продолжительность просмотра:** {avg_duration:.2f} сек  \n"
-    report += f"▫️ **Подписчики за день:** {subs_gained}  \n\n"
-
-    # Топ-видео дня
-    video_views_diff = {}
-    for video_id, data in video_stats.items():
-        prev_data = report_data.get('video_stats', {}).get(video_id, {})
-        video_views_diff[video_id] = data['viewCount'] - prev_data.get('viewCount', 0)
-    top_videos = sorted(video_views_diff.items(), key=lambda x: x[1], reverse=True)[:2]
-    report += "### **Топ-видео дня**  \n"
-    for i, (video_id, diff) in enumerate(top_videos, 1):
-        video_data = video_stats[video_id]
-        report += f"{i}. **«{video_data['title']}»**  \n"
-        report += f"   - Просмотры всего: {video_data['viewCount']:,}  \n"
-        report += f"   - Лайки: {video_data['likeCount']:,}  \n"
-        report += f"   - Дизлайки: {video_data['dislikeCount']:,}  \n"
-        report += f"   - Комментарии: {video_data['commentCount']:,}  \n"
-        report += "   - % досмотра: N/A (Analytics API)  \n\n"
-
-    # Анализ аудитории (только пол)
-    genders = get_audience_data(youtube_analytics)
-    report += "### **Анализ аудитории**  \n"
-    report += "▫️ **Пол аудитории:**  \n"
-    report += f"   - Мужчины: {genders['male']:.1f}%  \n"
-    report += f"   - Женщины: {genders['female']:.1f}%  \n"
-    report += "▫️ **Процент возвращающихся зрителей:** N/A (Требуется подписка)  \n\n"
-
-    # Источники трафика
-    traffic = get_traffic_sources(youtube_analytics)
-    report += "### **Источники трафика**  \n"
-    report += f"▫️ **Рекомендации YouTube:** {traffic.get('SUGGESTED', 0):.1f}%  \n"
-    report += f"▫️ **Поисковые запросы:** {traffic.get('YT_SEARCH', 0):.1f}%  \n"
-    report += f"▫️ **Внешние источники:** {traffic.get('EXT_URL', 0):.1f}%  \n\n"
-
-    # Сравнение с прошлыми периодами (заглушка)
-    report += "### **Сравнение с прошлыми периодами**  \n"
-    report += "▫️ **Подписки:** N/A  \n"
-    report += "▫️ **Просмотры:** N/A  \n\n"
-
-    # Общий тренд
-    trend = "Подписки и просмотры растут." if subscriber_diff > 0 and views_24h > 0 else "Активность стабильна."
-    report += f"📊 **Общий тренд:**  \n{trend}  \n"
-
-    return report
+    daily_activity = tuple(analytics_data['daily_activity']) if analytics_data is not None else None
+    video_analytics = analytics_data.get('videos', {}) if analytics_data is not None else {}
+    top = tuple(
+        (video['title'], video['viewCount'], video['likeCount'], video['dislikeCount'], video['commentCount'],
+         (video_analytics[video['id']]['viewPercentage'], video_analytics[video['id']]['minutesWatched'])
+         if video['id'] in video_analytics else None)
+        for video in top_videos
+    )
+    comparison = comparison or {}
 
-# Фоновая задача
-async def background_task():
-    global prev_subscribers, prev_video_views, last_report_time
+    def growth(name):
+        values = comparison.get(name)
+        return tuple(values[key] for key in ('day', 'prev_day', 'week', 'prev_week')) if values else None
+
+    parts = [
+        section('header', render_header, channel_title, (now or datetime.now()).strftime("%d %B %Y")),
+        section('metrics', render_metrics, subscribers, subscriber_diff, total_views, views_diff),
+        section('activity', render_activity, daily_activity, channel_id == CHANNEL_ID),
+        section('top_videos', render_top_videos, top),
+    ]
+    if analytics_data is not None:
+        genders = analytics_data['audience']
+        traffic = analytics_data['traffic_sources']
+        parts.append(section('audience', render_audience, genders['male'], genders['female']))
+        parts.append(section(
+            'traffic', render_traffic, traffic.get('SUGGESTED', 0), traffic.get('YT_SEARCH', 0), traffic.get('EXT_URL', 0)
+        ))
+    parts.append(section('comparison', render_comparison, growth('subscribers'), growth('views')))
+    views_24h = daily_activity[0] if daily_activity is not None else 0
+    parts.append(section('trend', render_trend, subscriber_diff > 0 and views_24h > 0))
+    return "".join(parts)
+
+# Аналитика канала владельца по запросу: отчеты берутся из кэша stats.db, пока не истекло их
+# время жизни (ANALYTICS_CACHE_TTL), к Analytics API — только за устаревшими. До готовности
+# клиентов API остаются последние загруженные данные (или None)
+async def refresh_owner_analytics():
+    global last_analytics_data
+    if youtube_analytics is not None:
+        last_analytics_data = await fetch_analytics_data(youtube_analytics, get_channel_video_ids(CHANNEL_ID))
+    return last_analytics_data
+
+# Отчет по каналу из последних известных данных: статистика канала из тика, топ видео из video_snapshot,
+# аналитика — из последнего запроса для канала владельца. Запросов к API не делает, поэтому
+# подходит и для отчета по расписанию, и для /report. Сравнение с прошлыми периодами
+# читается из базы один раз за тик
+async def build_channel_report(channel_id, statistics, now=None):
+    report_data = await get_report_data(channel_id)
+    # В тике опрашивается только часть видео, поэтому топ строится по последним известным данным
+    top_videos = get_top_videos(channel_id, report_data)
+    cached = channel_comparisons.get(channel_id)
+    if cached is not None and cached[0] == last_poll_ts:
+        comparison = cached[1]
+    else:
+        comparison = await asyncio.to_thread(stats_store.channel_comparison, channel_id, last_poll_ts)
+        channel_comparisons[channel_id] = (last_poll_ts, comparison)
+    channel_analytics = last_analytics_data if channel_id == CHANNEL_ID else None
+    return generate_daily_report(
+        statistics, top_videos, channel_analytics, report_data, comparison, get_channel_title(channel_id), now, channel_id
+    )
+
+# Обновление списка видео канала по курсору его плейлиста загрузок
+# Обход останавливается только на видео, которое он уже встречал в плейлисте: видео из уведомлений
+# WebSub (pushed_ids) он проходит, иначе загрузка с потерянным уведомлением, вышедшая перед ними,
+# так и не нашлась бы. Возвращаются только видео, которых еще не было в отслеживании
+async def refresh_video_ids(channel_id):
+    cursor = video_cursor.setdefault(channel_id, {'video_ids': []})
+    if not cursor.get('uploads_playlist_id'):
+        return []
+    video_ids = cursor['video_ids']
+    pushed = set(cursor.get('pushed_ids', []))
+    seen_ids = await fetch_new_video_ids(youtube, cursor['uploads_playlist_id'], [video_id for video_id in video_ids if video_id not in pushed])
+    if not seen_ids:
+        return []
+    seen_set = set(seen_ids)
+    new_ids = [video_id for video_id in seen_ids if video_id not in pushed]
+    cursor['video_ids'] = seen_ids + [video_id for video_id in video_ids if video_id not in seen_set]
+    if pushed:
+        cursor['pushed_ids'] = [video_id for video_id in cursor['pushed_ids'] if video_id not in seen_set]
+    for video_id in new_ids:
+        video_channels[video_id] = channel_id
+    if pushed & seen_set:
+        save_video_cursor()
+    return new_ids
+
+# Обновление видео всех каналов с подписками. Плейлисты загрузок новых каналов
+# запрашиваются пачками, обход плейлистов разных каналов идет параллельно
+async def refresh_all_video_ids(channel_ids=None):
+    channel_ids = channel_ids or subscriptions.channels()
+    unknown = [channel_id for channel_id in channel_ids if not video_cursor.get(channel_id, {}).get('uploads_playlist_id')]
+    if unknown:
+        details = await call_api('channels_details', youtube, unknown)
+        for channel_id, data in details.items():
+            video_cursor.setdefault(channel_id, {'video_ids': []}).update(data)
+    results = await asyncio.gather(*(refresh_video_ids(channel_id) for channel_id in channel_ids))
+    new_ids = {channel_id: ids for channel_id, ids in zip(channel_ids, results) if ids}
+    if new_ids or unknown:
+        save_video_cursor()
+    return new_ids
+
+# Название канала для сообщений
+def get_channel_title(channel_id):
+    return video_cursor.get(channel_id, {}).get('title', channel_id)
+
+# Обход плейлистов нужен, пока хотя бы один канал не получает push-уведомления WebSub.
+# Если подписки на все каналы действуют, обход остается редкой страховкой от пропущенных уведомлений
+def discovery_due(now):
+    if last_discovery_time is None:
+        return True
+    if websub is not None and all(websub.is_active(channel_id) for channel_id in subscriptions.channels()):
+        return (now - last_discovery_time).total_seconds() >= WEBSUB_DISCOVERY_INTERVAL
+    return True
+
+# Периодическая проверка новых загрузок на каналах
+async def video_discovery_task():
+    global last_discovery_time
+    await services_ready.wait()
     while True:
-        await asyncio.sleep(60)  # Проверка каждые 60 секунд
-        if not chat_id:
-            logger.warning("Chat ID не установлен, пропуск уведомлений.")
+        await asyncio.sleep(VIDEO_DISCOVERY_INTERVAL)
+        if poll_scheduler.remaining < 1:
             continue
         try:
-            current_stats = get_channel_stats(youtube, CHANNEL_ID)
-            current_video_views = get_video_stats(youtube, video_ids)
-            analytics_data = get_analytics_data(youtube_analytics)
-            report_data = load_report_data()
-
-            # Проверка подписчиков
-            if current_stats:
-                current_subscribers = int(current_stats['subscriberCount'])
-                if current_subscribers > prev_subscribers:
-                    diff = current_subscribers - prev_subscribers
-                    await bot.send_message(chat_id, f"Подписчиков стало больше на {diff}! Теперь: {current_subscribers}")
-                    logger.info(f"Уведомление отправлено: Подписчиков стало больше на {diff}")
-                    prev_subscribers = current_subscribers
-
-            # Проверка просмотров видео
-            for video_id, data in current_video_views.items():
-                if video_id in prev_video_views:
-                    current_views = data['viewCount']
-                    prev_views = prev_video_views[video_id]['viewCount']
-                    if current_views > prev_views:
-                        diff = current_views - prev_views
-                        await bot.send_message(chat_id, f'Просмотры видео "{data["title"]}" увеличились на {diff}! Теперь: {current_views}')
-                        logger.info(f"Уведомление отправлено: Просмотры видео '{data["title"]}' увеличились на {diff}")
-                prev_video_views[video_id] = data
-
-            # Отправка ежедневного отчета
-            now = datetime.now()
-            if last_report_time is None or (now - last_report_time).total_seconds() >= 600:
-                report = generate_daily_report(current_stats, current_video_views, analytics_data, report_data)
-                await bot.send_message(chat_id, report)
-                last_report_time = now
-                report_data['subscribers'] = current_subscribers
-                report_data['total_views'] = int(current_stats['viewCount'])
-                report_data['video_stats'] = {
-                    vid: {
-                        'viewCount': data['viewCount'],
-                        'likeCount': data['likeCount'],
-                        'dislikeCount': data['dislikeCount'],
-                        'commentCount': data['commentCount']
-                    } for vid, data in current_video_views.items()
-                }
-                save_report_data(report_data)
+            if discovery_due(datetime.now()):
+                last_discovery_time = datetime.now()
+                new_ids = await refresh_all_video_ids()
+                for channel_id, ids in new_ids.items():
+                    logger.info(f"Канал {channel_id}: добавлено {len(ids)} новых видео в отслеживание: {', '.join(ids)}")
+                await refresh_video_metadata(youtube, get_all_video_ids(), max_age=METADATA_REFRESH_INTERVAL)
+            # Премьеры и трансляции проверяются каждый раз: после эфира появится настоящая длительность
+            await refresh_video_metadata(youtube, get_live_video_ids(), max_age=VIDEO_DISCOVERY_INTERVAL / 2)
+        except Exception as e:
+            if str(e) == "Quota exceeded":
+                poll_scheduler.mark_exhausted()
+                logger.warning("Квота API превышена при поиске новых видео.")
+            else:
+                logger.error(f"Ошибка при поиске новых видео: {e}")
+
+# Записи ленты WebSub: новые видео сразу попадают в отслеживание и опрашиваются вне очереди,
+# у измененных обновляются метаданные, удаленные больше не опрашиваются.
+# Канал из уведомления не принимается на веру: новое видео отслеживается, только если канал
+# совпадает с snippet.channelId из Data API, удаление — только для видео этого же канала
+async def handle_feed_entries(entries):
+    await services_ready.wait()
+    channel_ids = set(subscriptions.channels())
+    candidates = {}
+    updated = []
+    for entry in entries:
+        if entry.deleted:
+            if video_channels.get(entry.video_id) == entry.channel_id:
+                video_metadata[entry.video_id] = {'unavailable': True, 'fetched_at': datetime.now().isoformat()}
+                save_video_metadata()
+                logger.info(f"WebSub: видео {entry.video_id} удалено")
+            continue
+        if entry.channel_id not in channel_ids:
+            continue
+        if entry.video_id in video_channels:
+            updated.append(entry.video_id)
+            continue
+        candidates[entry.video_id] = entry.channel_id
+    metrics.inc('websub_entries_total', len(entries))
+    # Без квоты новые видео не проверить: их найдет обход плейлистов
+    if not (candidates or updated) or poll_scheduler.remaining < 1:
+        return {}
+    new_ids = {}
+    try:
+        if updated:
+            await refresh_video_metadata(youtube, updated, max_age=0)
+        if candidates:
+            await refresh_video_metadata(youtube, list(candidates))
+            for video_id, channel_id in candidates.items():
+                if video_metadata.get(video_id, {}).get('channel_id') != channel_id:
+                    video_metadata.pop(video_id, None)
+                    logger.warning(f"WebSub: видео {video_id} не принадлежит каналу {channel_id}, уведомление отброшено")
+                    continue
+                cursor = video_cursor.setdefault(channel_id, {'video_ids': []})
+                cursor['video_ids'].insert(0, video_id)
+                cursor.setdefault('pushed_ids', []).append(video_id)
+                video_channels[video_id] = channel_id
+                new_ids.setdefault(channel_id, []).append(video_id)
+        if new_ids:
+            save_video_cursor()
+            video_ids = [video_id for ids in new_ids.values() for video_id in ids]
+            logger.info(f"WebSub: добавлено {len(video_ids)} новых видео в отслеживание: {', '.join(video_ids)}")
+            video_stats, not_modified = await fetch_video_stats(youtube, video_ids)
+            poll_scheduler.observe(video_ids, video_stats, not_modified)
+            video_snapshot.update(video_stats)
+            for channel_id, ids in new_ids.items():
+                lines = [
+                    f'🎬 Новое видео "{video_stats[video_id]["title"]}", просмотров: {video_stats[video_id]["viewCount"]}'
+                    for video_id in ids if video_id in video_stats
+                ]
+                if lines:
+                    notify_channel(channel_id, f"📺 {get_channel_title(channel_id)}\n" + "\n".join(lines))
+    except Exception as e:
+        if str(e) == "Quota exceeded":
+            poll_scheduler.mark_exhausted()
+            logger.warning("Квота API превышена при обработке уведомления WebSub.")
+        else:
+            logger.error(f"Ошибка при обработке уведомления WebSub: {e}")
+    return new_ids
+
+# Отправка сообщения всем чатам, подписанным на канал, через очередь
+def notify_channel(channel_id, text):
+    for chat_id in subscriptions.chats_for(channel_id):
+        notifier.enqueue(chat_id, text)
+
+def notify_all(text):
+    for chat_id in subscriptions.all_chats():
+        notifier.enqueue(chat_id, text)
+
+def format_period(hours):
+    return f"{hours * 60:.0f} мин" if hours < 1 else f"{hours:.1f} ч"
+
+# Текст оповещения: что изменилось, за какой период и сколько ожидалось по базовой линии
+def format_anomaly(subject, anomaly):
+    expected = anomaly.expected * anomaly.hours
+    period = format_period(anomaly.hours)
+    if anomaly.kind == SPIKE:
+        return f"🚀 {subject}: {anomaly.delta:+,} за {period} (обычно {expected:+,.0f}). Теперь: {anomaly.value:,}"
+    return f"📉 {subject}: {anomaly.delta:+,} за {period} вместо обычных {expected:+,.0f}. Теперь: {anomaly.value:,}"
+
+# Всплески и провалы за тик по каналам: [(отклонение, текст)]. Строки детекторов просмотров
+# и лайков совпадают со строками video_snapshot
+def collect_alerts(channel_anomalies, view_anomalies, like_anomalies):
+    alerts = {}
+    channel_by_row = {row: channel_id for channel_id, row in channel_rows.items()}
+    for anomaly in channel_anomalies:
+        alerts.setdefault(channel_by_row[anomaly.row], []).append((anomaly, format_anomaly("Подписчики", anomaly)))
+    for name, anomalies in (("просмотры", view_anomalies), ("лайки", like_anomalies)):
+        for anomaly in anomalies:
+            video_id = video_snapshot.ids[anomaly.row]
+            text = format_anomaly(f'Видео "{get_video_title(video_id)}", {name}', anomaly)
+            alerts.setdefault(video_channels.get(video_id), []).append((anomaly, text))
+    for anomalies in (channel_anomalies, view_anomalies, like_anomalies):
+        for anomaly in anomalies:
+            metrics.inc('anomalies_total', kind=anomaly.kind)
+    alerts.pop(None, None)
+    return alerts
+
+# Раздел сводки по одному каналу: все оповещения за тик одним блоком, сильнейшие отклонения первыми
+def format_channel_digest(channel_id, alerts):
+    lines = [f"📈 {get_channel_title(channel_id)}"]
+    alerts = sorted(alerts, key=lambda alert: abs(alert[0].score), reverse=True)
+    lines.extend(text for _, text in alerts[:NOTIFY_MAX_VIDEOS])
+    if len(alerts) > NOTIFY_MAX_VIDEOS:
+        hidden = alerts[NOTIFY_MAX_VIDEOS:]
+        spikes = sum(1 for anomaly, _ in hidden if anomaly.kind == SPIKE)
+        lines.append(f"…и еще {len(hidden)} (всплесков {spikes}, провалов {len(hidden) - spikes})")
+    return "\n".join(lines)
+
+# Одна сводка на чат за тик: разделы всех каналов, на которые подписан чат
+def dispatch_digests(sections):
+    chats = {}
+    for channel_id, text in sections.items():
+        for chat_id in subscriptions.chats_for(channel_id):
+            chats.setdefault(chat_id, []).append(text)
+    for chat_id, texts in chats.items():
+        notifier.enqueue(chat_id, "\n\n".join(texts))
+    return len(chats)
+
+# Один тик опроса: статистика всех каналов и запланированных видео запрашивается один раз,
+# сколько бы чатов ни было подписано
+@metrics.timed('poll_tick')
+async def poll_tick():
+    global last_tick_plan, last_analytics_data, last_poll_ts
+    channel_ids = subscriptions.channels()
+    if not channel_ids:
+        logger.warning("Нет подписок, пропуск опроса.")
+        return None
+
+    plan = poll_scheduler.plan_tick(get_tracked_video_ids(), channel_ids)
+    if plan.exhausted:
+        return plan
+
+    try:
+        # Data API и Analytics API запрашиваются параллельно в пуле потоков. Аналитика нужна только
+        # для отчета и доступна только для канала владельца токена. Отчет по каналу отправляется
+        # в тик, когда его статистика есть в плане опроса
+        now = datetime.now()
+        due_reports = {
+            channel_id for channel_id in plan.channel_ids
+            if REPORT_INTERVAL and (
+                channel_id not in last_report_time or (now - last_report_time[channel_id]).total_seconds() >= REPORT_INTERVAL
+            )
+        }
+        analytics_enabled = CHANNEL_ID in due_reports
+        current_stats, (current_video_views, not_modified), analytics_data = await asyncio.gather(
+            fetch_channels_stats(youtube, plan.channel_ids) if plan.channel_ids else asyncio.sleep(0, {}),
+            fetch_video_stats(youtube, plan.video_ids),
+            fetch_analytics_data(youtube_analytics, get_channel_video_ids(CHANNEL_ID)) if analytics_enabled else asyncio.sleep(0)
+        )
+        poll_scheduler.observe(plan.video_ids, current_video_views, not_modified)
+        poll_scheduler.observe_channels(plan.channel_ids, current_stats)
+        last_channel_stats.update(current_stats)
+        if analytics_enabled:
+            last_analytics_data = analytics_data
+
+        # Замеры тика записываются одной транзакцией
+        tick_time = datetime.now()
+        last_poll_ts = tick_time.timestamp()
+        for channel_id, statistics in current_stats.items():
+            stats_store.add_channel_sample(channel_id, tick_time.timestamp(), statistics)
+        stats_store.add_video_samples(tick_time.timestamp(), current_video_views)
+        with metrics.span('persist_stats'):
+            await asyncio.to_thread(stats_store.flush)
 
+        # Всплески и провалы: каждый замер сравнивается с базовой линией своего ряда.
+        # Все ряды опрошенных видео обновляются одним проходом по массивам
+        timestamp = tick_time.timestamp()
+        subscriber_counts = {channel_id: int(statistics['subscriberCount']) for channel_id, statistics in current_stats.items()}
+        channel_anomalies = subscriber_detector.update(
+            [channel_rows.setdefault(channel_id, len(channel_rows)) for channel_id in subscriber_counts],
+            list(subscriber_counts.values()), timestamp
+        )
+        rows, _, _ = video_snapshot.update(current_video_views)
+        view_anomalies = view_detector.update(rows, video_snapshot.views[rows], timestamp)
+        like_anomalies = like_detector.update(rows, video_snapshot.likes[rows], timestamp)
+
+        # Все оповещения тика — одной сводкой на чат
+        alerts = collect_alerts(channel_anomalies, view_anomalies, like_anomalies)
+        sections = {channel_id: format_channel_digest(channel_id, channel_alerts) for channel_id, channel_alerts in alerts.items()}
+        if sections:
+            chats = dispatch_digests(sections)
+            logger.info(f"Сводки поставлены в очередь: каналов {len(sections)}, чатов {chats}")
+
+        # Отправка отчетов по каналам, для которых подошел срок
+        for channel_id, statistics in current_stats.items():
+            if channel_id not in due_reports:
+                continue
+            report = await build_channel_report(channel_id, statistics, now)
+            notify_channel(channel_id, report)
+            last_report_time[channel_id] = now
+            remember_report_baseline(channel_id, statistics)
+            await asyncio.to_thread(save_report_data, channel_id, tick_time)
+        save_warm_state()
+    finally:
+        last_tick_plan = poll_scheduler.finish_tick(plan)
+        delivery = notifier.metrics()
+        logger.info(
+            f"Квота за тик: запланировано {plan.planned_units}, потрачено {plan.spent_units} ед., "
+            f"каналов: {len(plan.channel_ids)}/{len(channel_ids)}, видео в опросе: {len(plan.video_ids)} (по уровням: {'/'.join(map(str, poll_scheduler.tier_counts()))}), "
+            f"остаток: {poll_scheduler.remaining}/{poll_scheduler.daily_budget}, "
+            f"ответов 304: {etag_hit_rate():.0%} (сэкономлено {etag_stats['bytes_saved'] / 1024:.0f} КБ), "
+            f"очередь сообщений: {delivery['queue_depth']}, задержка доставки p50/p99: "
+            f"{delivery['latency_p50']:.1f}/{delivery['latency_p99']:.1f} сек"
+        )
+    return plan
+
+# Фоновая задача
+async def background_task():
+    await services_ready.wait()
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        try:
+            plan = await poll_tick()
+            if plan is not None and plan.exhausted:
+                wait = poll_scheduler.seconds_until_reset()
+                logger.warning(f"Дневной бюджет квоты израсходован. Следующий опрос после сброса через {wait / 60:.0f} мин.")
+                await asyncio.sleep(wait)
         except Exception as e:
             if str(e) == "Quota exceeded":
-                await bot.send_message(chat_id, "Квота API превышена. Ожидание сброса...")
-                logger.warning("Квота API превышена в фоновой задаче.")
-                await asyncio.sleep(3600)
+                poll_scheduler.mark_exhausted()
+                wait = poll_scheduler.seconds_until_reset()
+                notify_all("Квота API превышена. Ожидание сброса...")
+                logger.warning(f"Квота API превышена в фоновой задаче. Сброс через {wait / 60:.0f} мин.")
+                await asyncio.sleep(wait)
             else:
                 logger.error(f"Ошибка в фоновой задаче: {e}")
-                await bot.send_message(chat_id, f"Ошибка в фоновой задаче: {e}")
+                notify_all(f"Ошибка в фоновой задаче: {e}")
+
+# Статистика каналов одним запросом для ответа на команды
+def format_channels_stats(channel_ids, stats):
+    lines = []
+    for channel_id in channel_ids:
+        data = stats.get(channel_id)
+        if data is None:
+            lines.append(f"{get_channel_title(channel_id)}: статистика недоступна")
+            continue
+        lines.append(
+            f"{get_channel_title(channel_id)}:\nПодписчиков: {int(data['subscriberCount'])}\n"
+            f"Загруженных видео: {int(data['videoCount'])}"
+        )
+    return "\n\n".join(lines)
 
-# Сохранение chat_id
-def save_chat_id():
-    if chat_id:
-        with open(CHAT_ID_FILE, "w") as f:
-            f.write(str(chat_id))
+# Подписка чата на канал: проверка канала, загрузка его видео и базовой статистики
+async def add_subscription(chat_id, channel_id):
+    await services_ready.wait()
+    stats = await fetch_channel_stats(youtube, channel_id)
+    if not stats:
+        return None
+    subscriptions.subscribe(chat_id, channel_id)
+    persistence.mark('subscriptions')
+    if not get_channel_video_ids(channel_id):
+        await refresh_all_video_ids([channel_id])
+    # Базовые значения нужны только для видео, которые еще не опрашивались
+    missing = [video_id for video_id in get_channel_video_ids(channel_id) if video_id not in video_snapshot]
+    if missing:
+        video_snapshot.update((await fetch_video_stats(youtube, missing))[0])
+    return stats
 
 # Обработчик команды /start
 @dp.message(Command(commands=['start']))
 async def start_command(message: types.Message):
-    global chat_id, prev_subscribers, prev_video_views
     chat_id = message.chat.id
-    save_chat_id()
-
-    if youtube is None:
-        await message.reply("Ошибка: YouTube API не инициализирован.")
-        logger.error("Команда /start вызвана, но YouTube API не инициализирован.")
-        return
 
     try:
-        stats = get_channel_stats(youtube, CHANNEL_ID)
+        # Без подписок чат подписывается на канал из CHANNEL_ID
+        if not subscriptions.channels_for(chat_id) and CHANNEL_ID:
+            await add_subscription(chat_id, CHANNEL_ID)
+        channel_ids = sorted(subscriptions.channels_for(chat_id))
+        if not channel_ids:
+            await message.reply("Нет подписок. Добавьте канал командой /subscribe <ID канала>.")
+            return
+        # Ответ из последнего опроса (после перезапуска — из снимка); в API — только за недостающими каналами
+        stats = {channel_id: last_channel_stats[channel_id] for channel_id in channel_ids if channel_id in last_channel_stats}
+        missing = [channel_id for channel_id in channel_ids if channel_id not in stats]
+        if missing:
+            await services_ready.wait()
+            if youtube is None:
+                await message.reply("Ошибка: YouTube API не инициализирован.")
+                logger.error("Команда /start вызвана, но YouTube API не инициализирован.")
+                return
+            stats.update(await fetch_channels_stats(youtube, missing))
         if stats:
-            subscribers = int(stats['subscriberCount'])
-            video_count = int(stats['videoCount'])
-            await message.reply(f"Статистика канала:\nПодписчиков: {subscribers}\nЗагруженных видео: {video_count}")
-            logger.info(f"Команда /start выполнена: Подписчиков: {subscribers}, Видео: {video_count}")
-            prev_subscribers = subscribers
-            prev_video_views = get_video_stats(youtube, video_ids)
+            await message.reply(f"Статистика каналов:\n\n{format_channels_stats(channel_ids, stats)}")
+            logger.info(f"Команда /start выполнена для чата {chat_id}: каналов {len(channel_ids)}")
         else:
             await message.reply("Не удалось получить статистику канала.")
             logger.warning("Не удалось получить статистику канала при выполнении /start.")
@@ -464,52 +1488,358 @@ async def start_command(message: types.Message):
             await message.reply(f"Ошибка: {e}")
             logger.error(f"Ошибка при выполнении /start: {e}")
 
-# Загрузка chat_id при старте
-def load_chat_id():
-    global chat_id
-    if os.path.exists(CHAT_ID_FILE):
+# Обработчик команды /subscribe <ID канала>
+@dp.message(Command(commands=['subscribe']))
+async def subscribe_command(message: types.Message):
+    args = (message.text or '').split()
+    if len(args) != 2:
+        await message.reply("Использование: /subscribe <ID канала>")
+        return
+    channel_id = args[1]
+    try:
+        stats = await add_subscription(message.chat.id, channel_id)
+        if stats is None:
+            await message.reply(f"Канал {channel_id} не найден.")
+            return
+        await message.reply(f"Подписка оформлена.\n\n{format_channels_stats([channel_id], {channel_id: stats})}")
+        logger.info(f"Чат {message.chat.id} подписан на канал {channel_id}")
+    except Exception as e:
+        if str(e) == "Quota exceeded":
+            await message.reply("Квота API превышена. Попробуйте позже.")
+        else:
+            await message.reply(f"Ошибка: {e}")
+            logger.error(f"Ошибка при выполнении /subscribe: {e}")
+
+# Обработчик команды /unsubscribe <ID канала>
+@dp.message(Command(commands=['unsubscribe']))
+async def unsubscribe_command(message: types.Message):
+    args = (message.text or '').split()
+    if len(args) != 2:
+        await message.reply("Использование: /unsubscribe <ID канала>")
+        return
+    if subscriptions.unsubscribe(message.chat.id, args[1]):
+        persistence.mark('subscriptions')
+        await message.reply(f"Подписка на канал {args[1]} отменена.")
+        logger.info(f"Чат {message.chat.id} отписан от канала {args[1]}")
+    else:
+        await message.reply(f"Подписки на канал {args[1]} нет.")
+
+# Обработчик команды /channels
+@dp.message(Command(commands=['channels']))
+async def channels_command(message: types.Message):
+    channel_ids = sorted(subscriptions.channels_for(message.chat.id))
+    if not channel_ids:
+        await message.reply("Нет подписок. Добавьте канал командой /subscribe <ID канала>.")
+        return
+    lines = [f"▫️ {get_channel_title(channel_id)} ({channel_id})" for channel_id in channel_ids]
+    await message.reply("Подписки:\n" + "\n".join(lines))
+
+# Ответ на команду с учетом лимита длины сообщения Telegram
+async def reply_long(message, text):
+    for part in split_message(text):
+        await message.reply(part)
+
+# Каналы чата для команды: указанный в аргументе (если чат на него подписан) или все подписки
+def command_channels(chat_id, args):
+    channel_ids = sorted(subscriptions.channels_for(chat_id))
+    if args:
+        channel_ids = [channel_id for channel_id in channel_ids if channel_id == args[0]]
+    return channel_ids
+
+# Обработчик команды /report [ID канала]: отчет из последних данных опроса, без запросов к Data API.
+# Аналитика канала владельца загружается по запросу, обычно из кэша stats.db
+@dp.message(Command(commands=['report']))
+async def report_command(message: types.Message):
+    args = (message.text or '').split()[1:]
+    channel_ids = command_channels(message.chat.id, args)
+    if not channel_ids:
+        await message.reply(f"Нет подписки на канал {args[0]}." if args else "Нет подписок. Добавьте канал командой /subscribe <ID канала>.")
+        return
+    with metrics.span('report_command'):
+        if CHANNEL_ID in channel_ids and CHANNEL_ID in last_channel_stats:
+            await refresh_owner_analytics()
+        reports = [
+            await build_channel_report(channel_id, last_channel_stats[channel_id])
+            for channel_id in channel_ids if channel_id in last_channel_stats
+        ]
+    if not reports:
+        await message.reply("Данных еще нет: дождитесь первого опроса.")
+        return
+    await reply_long(message, "\n\n".join(reports))
+
+# Обработчик команды /top [N]: видео каналов чата с наибольшим приростом просмотров с прошлого отчета
+@dp.message(Command(commands=['top']))
+async def top_command(message: types.Message):
+    args = (message.text or '').split()[1:]
+    if args and not args[0].isdigit():
+        await message.reply(f"Использование: /top [N], N до {TOP_MAX}")
+        return
+    k = min(int(args[0]) if args else TOP_DEFAULT, TOP_MAX)
+    growth = []
+    for channel_id in subscriptions.channels_for(message.chat.id):
+        growth.extend(channel_top_growth(channel_id, await get_report_data(channel_id), k))
+    growth.sort(key=lambda item: item[1], reverse=True)
+    if not growth:
+        await message.reply("Данных еще нет: дождитесь первого опроса.")
+        return
+    lines = [f"🏆 Топ-{min(k, len(growth))} видео по приросту просмотров с прошлого отчета:"]
+    for i, (video_id, diff) in enumerate(growth[:k], 1):
+        lines.append(f"{i}. {get_video_title(video_id)} — {diff:+,} (всего {video_snapshot.get(video_id)['viewCount']:,}) /video {video_id}")
+    await reply_long(message, "\n".join(lines))
+
+# Обработчик команды /video <ID видео>: последние известные значения, уровень опроса и базовая линия роста
+@dp.message(Command(commands=['video']))
+async def video_command(message: types.Message):
+    args = (message.text or '').split()[1:]
+    if len(args) != 1:
+        await message.reply("Использование: /video <ID видео>")
+        return
+    video_id = args[0]
+    channel_id = video_channels.get(video_id)
+    stats = video_snapshot.get(video_id)
+    if stats is None or channel_id not in subscriptions.channels_for(message.chat.id):
+        await message.reply(f"Видео {video_id} не отслеживается в каналах этого чата.")
+        return
+    metadata = video_metadata.get(video_id, {})
+    lines = [
+        f"🎬 {get_video_title(video_id)}",
+        f"Канал: {get_channel_title(channel_id)}",
+        f"Просмотры: {stats['viewCount']:,}, лайки: {stats['likeCount']:,}, комментарии: {stats['commentCount']:,}",
+    ]
+    if metadata.get('publishedAt'):
+        lines.append(f"Опубликовано: {metadata['publishedAt']}")
+    state = poll_scheduler.videos.get(video_id)
+    if state is not None:
+        now = datetime.now(timezone.utc)
+        interval = poll_scheduler.interval_for(state, now)
+        lines.append(f"Рост: {state.views_per_hour:,.1f} просмотров/ч, опрос раз в {format_period(interval / 3600)}")
+        if state.last_polled:
+            lines.append(f"Последний замер: {format_period((time.time() - state.last_polled) / 3600)} назад")
+    baseline = view_detector.baseline(video_snapshot.index[video_id])
+    if baseline is not None and baseline['samples'] > ANOMALY_MIN_SAMPLES:
+        lines.append(f"Обычный рост: {baseline['rate']:,.1f} ± {baseline['std']:,.1f} просмотров/ч")
+    await message.reply("\n".join(lines))
+
+# Состояние бота, которое снимается в момент запроса метрик
+def update_runtime_metrics():
+    delivery = notifier.metrics()
+    metrics.set_gauge('quota_remaining_units', poll_scheduler.remaining)
+    metrics.set_gauge('quota_spent_today_units', poll_scheduler.spent)
+    for method_id, units in poll_scheduler.units_by_method.items():
+        metrics.set_gauge('quota_today_units', units, method=method_id)
+    metrics.set_gauge('videos_tracked', len(get_tracked_video_ids()))
+    for tier, count in enumerate(poll_scheduler.tier_counts()):
+        metrics.set_gauge('videos_by_tier', count, tier=tier, interval=poll_scheduler.tiers[tier][1])
+    metrics.set_gauge('subscriptions', len(subscriptions))
+    metrics.set_gauge('conditional_requests', etag_stats['requests'])
+    metrics.set_gauge('conditional_not_modified', etag_stats['not_modified'])
+    metrics.set_gauge('conditional_bytes_saved', etag_stats['bytes_saved'])
+    metrics.set_gauge('notify_queue_depth', delivery['queue_depth'])
+    metrics.set_gauge('report_sections_rendered', report_sections.renders)
+    metrics.set_gauge('report_sections_cached', report_sections.hits)
+    metrics.set_gauge('notify_sent', delivery['sent'])
+    metrics.set_gauge('notify_failed', delivery['failed'])
+    metrics.set_gauge('notify_retries', delivery['retries'])
+    metrics.set_gauge('notify_latency_seconds', delivery['latency_p50'], quantile='0.5')
+    metrics.set_gauge('notify_latency_seconds', delivery['latency_p99'], quantile='0.99')
+    metrics.set_gauge('jobs_in_flight', len(pending_jobs))
+    if websub is not None:
+        metrics.set_gauge('websub_active_leases', sum(1 for channel_id in subscriptions.channels() if websub.is_active(channel_id)))
+        for name, value in websub.stats.items():
+            metrics.set_gauge(f'websub_{name}', value)
+
+# Сводка для /stats: этапы по суммарному времени и расход квоты по методам за сегодня
+def format_pipeline_stats():
+    update_runtime_metrics()
+    lines = ["⏱ Этапы (вызовов, среднее / макс):"]
+    spans = sorted(metrics.span_stats().items(), key=lambda item: item[1]['sum'], reverse=True)
+    for name, span in spans:
+        lines.append(f"▫️ {name}: {span['count']}, {span['sum'] / span['count'] * 1000:.0f} / {span['max'] * 1000:.0f} мс")
+    if not spans:
+        lines.append("▫️ нет данных")
+    lines.append(f"\n📊 Квота: потрачено {poll_scheduler.spent} из {poll_scheduler.daily_budget} ед.")
+    for method_id, units in sorted(poll_scheduler.units_by_method.items(), key=lambda item: item[1], reverse=True):
+        lines.append(f"▫️ {method_id}: {units}")
+    delivery = notifier.metrics()
+    lines.append(
+        f"\n📨 Очередь сообщений: {delivery['queue_depth']}, отправлено {delivery['sent']}, ошибок {delivery['failed']}, "
+        f"задержка p50/p99: {delivery['latency_p50']:.1f}/{delivery['latency_p99']:.1f} сек"
+    )
+    lines.append(f"🔁 Ответов 304: {etag_hit_rate():.0%}, видео в опросе: {len(get_tracked_video_ids())} (по уровням: {'/'.join(map(str, poll_scheduler.tier_counts()))})")
+    lines.append(f"🚀 Запуск: {format_startup_timings() or 'нет данных'}")
+    lines.append(f"🧾 Разделы отчетов: построено {report_sections.renders}, из кэша {report_sections.hits} ({report_sections.hit_rate():.0%})")
+    return "\n".join(lines)
+
+# Обработчик команды /stats
+@dp.message(Command(commands=['stats']))
+async def stats_command(message: types.Message):
+    text = format_pipeline_stats()
+    if use_job_queue():
+        text += "\n" + await format_workers()
+    await message.reply(text)
+
+# Сборщики, приславшие отметку о работе за последние три срока аренды, и очередь заданий
+async def format_workers():
+    now = time.time()
+    workers = await backend.get_state('worker:')
+    alive = [name for name, state in workers.items() if now - state['ts'] < 3 * JOB_LEASE_SECONDS]
+    return f"👷 Сборщиков: {len(alive)}, заданий в очереди: {await backend.pending()}, ожидают результата: {len(pending_jobs)}"
+
+# Локальный HTTP-эндпоинт /metrics в текстовом формате Prometheus
+async def metrics_handler(request):
+    update_runtime_metrics()
+    return web.Response(text=metrics.render(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+async def start_metrics_server():
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    logger.info(f"Метрики доступны на http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
+
+# Приемник WebSub: подтверждение подписок и уведомления хаба на WEBSUB_PATH.
+# Аренда подписок продлевается фоновой задачей renew_task
+async def start_websub_server():
+    global websub
+    # Без ключа подписи любой POST на публичный адрес выдавал бы себя за хаб
+    if not WEBSUB_SECRET:
+        raise SystemExit("Для приема WebSub (WEBSUB_CALLBACK_URL) нужен WEBSUB_SECRET")
+    websub = WebSubSubscriber(
+        WEBSUB_CALLBACK_URL, handle_feed_entries, hub_url=WEBSUB_HUB_URL, secret=WEBSUB_SECRET,
+        lease_seconds=WEBSUB_LEASE_SECONDS
+    )
+    app = web.Application(client_max_size=MAX_NOTIFICATION_SIZE)
+    websub.add_routes(app, WEBSUB_PATH)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBSUB_HOST, WEBSUB_PORT).start()
+    logger.info(f"Приемник WebSub слушает {WEBSUB_HOST}:{WEBSUB_PORT}{WEBSUB_PATH}, внешний адрес {WEBSUB_CALLBACK_URL}")
+    return runner
+
+# Загрузка подписок при старте. Прежний chat_id.txt превращается в подписку на CHANNEL_ID
+def load_subscriptions():
+    subscriptions.load()
+    if len(subscriptions) == 0 and CHANNEL_ID and os.path.exists(CHAT_ID_FILE):
         with open(CHAT_ID_FILE, "r") as f:
             chat_id = f.read().strip()
-            if chat_id.isdigit():
-                chat_id = int(chat_id)
+        if chat_id.lstrip('-').isdigit():
+            subscriptions.subscribe(int(chat_id), CHANNEL_ID)
+            subscriptions.save(PERSIST_FSYNC)
+            logger.info(f"Чат из {CHAT_ID_FILE} подписан на канал {CHANNEL_ID}.")
+
+# Клиенты Google API с OAuth-авторизацией. Документы discovery берутся из googleapiclient
+# (static_discovery), без HTTP-запросов за описанием API при каждом запуске
+def build_services():
+    credentials = get_credentials()
+    youtube = build('youtube', 'v3', credentials=credentials, static_discovery=True, cache_discovery=False)
+    youtube_analytics = build('youtubeAnalytics', 'v2', credentials=credentials, static_discovery=True, cache_discovery=False)
+    return credentials, youtube, youtube_analytics
+
+# Длительность этапа запуска: в лог, в /stats и в метрики
+def record_startup_phase(name, started):
+    startup_timings[name] = time.perf_counter() - started
+    metrics.set_gauge('startup_seconds', startup_timings[name], phase=name)
 
-# Инициализация при запуске
-async def on_startup(_):
-    global youtube, youtube_analytics, video_ids
+def format_startup_timings():
+    return ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in startup_timings.items())
+
+# Инициализация при запуске. Синхронно читается только локальное состояние: подписки, плейлисты,
+# метаданные и снимок последних данных, после чего бот уже отвечает на команды.
+# Клиенты API и первичный обход плейлистов — в фоне (warm_up), задачи опроса ждут services_ready.
+# services — готовые (credentials, youtube, youtube_analytics), например локальные заменители API
+# в benchmarks/replay.py; по умолчанию строятся build_services(). lazy=False дожидается warm_up
+async def on_startup(_, services=None, lazy=False):
+    global video_cursor, video_metadata, services_ready, startup_task, last_analytics_data
+    record_startup_phase('import', IMPORT_STARTED)
+    started = time.perf_counter()
+    services_ready = asyncio.Event()
+    load_subscriptions()
+    import_legacy_report_data()
+    video_metadata = load_video_metadata()
+    video_cursor = load_video_cursor()
+    for channel_id, cursor in video_cursor.items():
+        for video_id in cursor.get('video_ids', []):
+            video_channels[video_id] = channel_id
+    warm = load_warm_state()
+    last_analytics_data = load_cached_analytics()
+    logger.info(f"Загружено {len(video_channels)} ID видео из {VIDEO_CURSOR_FILE}, подписок: {len(subscriptions)}.")
+    record_startup_phase('state', started)
+    startup_task = asyncio.create_task(warm_up(services, warm))
+    if not lazy:
+        await startup_task
+
+# Фоновая часть запуска: OAuth и клиенты API, затем обход плейлистов каналов, которых нет в курсоре
+# (при запуске без снимка — всех каналов). Остальное обновят очередные тики опроса
+async def warm_up(services=None, warm=False):
+    global credentials, youtube, youtube_analytics
+    started = time.perf_counter()
     logger.info("Начало инициализации YouTube API с OAuth...")
-    load_chat_id()
     try:
-        credentials = get_credentials()
-        youtube = build('youtube', 'v3', credentials=credentials)
-        youtube_analytics = build('youtubeAnalytics', 'v2', credentials=credentials)
+        credentials, youtube, youtube_analytics = services or await asyncio.to_thread(build_services)
         logger.info("YouTube APIs успешно инициализированы.")
     except Exception as e:
         youtube = None
         youtube_analytics = None
         logger.error(f"Ошибка при инициализации YouTube APIs: {e}")
         raise SystemExit(f"Не удалось инициализировать YouTube APIs: {e}")
+    record_startup_phase('services', started)
+    services_ready.set()
 
-    logger.info("Получение ID видео с канала...")
+    started = time.perf_counter()
+    channel_ids = subscriptions.channels() if not warm else [
+        channel_id for channel_id in subscriptions.channels() if channel_id not in video_cursor
+    ]
     try:
-        video_ids = get_all_video_ids(youtube, CHANNEL_ID)
+        if channel_ids:
+            logger.info(f"Получение ID видео с каналов: {len(channel_ids)}...")
+            await refresh_all_video_ids(channel_ids)
+        video_ids = get_all_video_ids()
         if not video_ids:
-            logger.warning("Не удалось получить ID видео. Возможно, канал пустой или доступ ограничен.")
+            logger.warning("Не удалось получить ID видео. Возможно, каналы пустые или доступ ограничен.")
         else:
-            logger.info(f"Успешно получено {len(video_ids)} ID видео.")
-            video_stats = get_video_stats(youtube, video_ids)
-            logger.info("Список видео на канале:")
-            for video_id, data in video_stats.items():
-                logger.info(f"ID: {video_id}, Название: {data['title']}")
+            logger.info(f"Отслеживается {len(video_ids)} ID видео.")
     except Exception as e:
-        video_ids = []
-        logger.error(f"Ошибка при получении ID видео в on_startup: {e}")
+        logger.error(f"Ошибка при получении ID видео при запуске: {e}")
+    record_startup_phase('discovery', started)
+    logger.info(f"Запуск завершен: {format_startup_timings()}")
+
+# Сборщик без Telegram: только клиенты Google API и задания из общей очереди
+async def run_worker(services=None):
+    global credentials, youtube, youtube_analytics
+    credentials, youtube, youtube_analytics = services or build_services()
+    logger.info(f"Сборщик {WORKER_ID} ждет заданий (потоков: {YOUTUBE_WORKERS}).")
+    try:
+        await asyncio.gather(*start_job_queue())
+    finally:
+        await backend.close()
 
 # Основная функция
 async def main():
-    logger.info("Запуск бота...")
-    await on_startup(None)
+    logger.info(f"Запуск бота (роль: {BOT_ROLE})...")
+    if BOT_ROLE == 'worker':
+        await run_worker()
+        return
+    job_tasks = start_job_queue()
+    await on_startup(None, lazy=True)
+    if METRICS_PORT:
+        await start_metrics_server()
+    if WEBSUB_CALLBACK_URL:
+        await start_websub_server()
+        asyncio.create_task(websub.renew_task(subscriptions.channels))
     asyncio.create_task(background_task())
-    await dp.start_polling(bot)
+    asyncio.create_task(video_discovery_task())
+    try:
+        await dp.start_polling(bot)
+    finally:
+        save_warm_state(force=True)
+        await persistence.flush()
+        if websub is not None:
+            await websub.close()
+        for task in job_tasks:
+            task.cancel()
+        await backend.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
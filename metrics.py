@@ -0,0 +1,111 @@
+# Метрики конвейера опроса: длительности этапов, счетчики и их вывод в текстовом формате Prometheus
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Metrics:
+    # Все методы можно вызывать из потоков пула: состояние защищено одной блокировкой
+    def __init__(self, prefix='ytbot'):
+        self.prefix = prefix
+        self.spans = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    # Длительность этапа: число вызовов, сумма, максимум и гистограмма по SPAN_BUCKETS
+    def observe(self, name, seconds):
+        with self._lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(SPAN_BUCKETS)}
+            span['count'] += 1
+            span['sum'] += seconds
+            span['max'] = max(span['max'], seconds)
+            for i, bound in enumerate(SPAN_BUCKETS):
+                if seconds <= bound:
+                    span['buckets'][i] += 1
+                    break
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    # Декоратор: замер каждого вызова функции (обычной или асинхронной)
+    def timed(self, name):
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def counter_values(self, name):
+        with self._lock:
+            return {labels: value for (key, labels), value in self.counters.items() if key == name}
+
+    def span_stats(self):
+        with self._lock:
+            return {name: dict(span, buckets=list(span['buckets'])) for name, span in self.spans.items()}
+
+    # Текстовый формат Prometheus (https://prometheus.io/docs/instrumenting/exposition_formats/)
+    def render(self):
+        lines = []
+        spans = self.span_stats()
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        if spans:
+            metric = f"{self.prefix}_span_seconds"
+            lines.append(f"# HELP {metric} Длительность этапов конвейера опроса")
+            lines.append(f"# TYPE {metric} histogram")
+            for name in sorted(spans):
+                span = spans[name]
+                cumulative = 0
+                for bound, count in zip(SPAN_BUCKETS, span['buckets']):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {span["count"]}')
+                lines.append(f'{metric}_sum{{span="{name}"}} {span["sum"]:.6f}')
+                lines.append(f'{metric}_count{{span="{name}"}} {span["count"]}')
+
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({name for name, _ in values}):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} {kind}")
+                for (key, labels), value in sorted(values.items()):
+                    if key == name:
+                        lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
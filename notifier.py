@@ -0,0 +1,176 @@
+# Очередь исходящих сообщений Telegram с ограничением частоты по чатам и обработкой retry_after
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096  # Максимальная длина текста сообщения Telegram
+
+
+# Деление длинного текста на сообщения не длиннее limit: по абзацам, затем по строкам,
+# и только строка длиннее limit режется посередине
+def split_message(text, limit=MESSAGE_LIMIT):
+    if len(text) <= limit:
+        return [text]
+    parts = []
+    current = ''
+    for paragraph in text.split('\n\n'):
+        for chunk in _split_paragraph(paragraph, limit):
+            candidate = f"{current}\n\n{chunk}" if current else chunk
+            if len(candidate) <= limit:
+                current = candidate
+            else:
+                parts.append(current)
+                current = chunk
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _split_paragraph(paragraph, limit):
+    if len(paragraph) <= limit:
+        return [paragraph]
+    chunks = []
+    current = ''
+    for line in paragraph.split('\n'):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) <= limit:
+            current = candidate
+        else:
+            chunks.append(current)
+            current = line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# Ведро токенов. Резервирование синхронное, поэтому его можно вызывать
+# из множества корутин без блокировок: каждая получает свою задержку
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    # Telegram попросил подождать: токены появятся не раньше чем через delay секунд
+    def pause(self, delay):
+        self.tokens = min(self.tokens, 0) - delay * self.rate
+        self.updated = time.monotonic()
+
+
+class NotificationDispatcher:
+    # Лимиты Telegram: около 1 сообщения в секунду в личный чат, 20 в минуту в группу, 30 в секунду всего
+    def __init__(self, send, chat_rate=1.0, group_rate=20 / 60, global_rate=30.0, max_retries=5, latency_window=1000):
+        self.send = send
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_buckets = {}
+        self.queues = {}
+        self.workers = {}
+        self.latencies = deque(maxlen=latency_window)
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    # Сообщение ставится в очередь чата; для каждого чата с очередью работает одна корутина,
+    # поэтому медленный чат не задерживает остальные, а порядок сообщений в чате сохраняется.
+    # Текст длиннее лимита Telegram уходит несколькими сообщениями подряд
+    def enqueue(self, chat_id, text):
+        queue = self.queues.setdefault(chat_id, deque())
+        enqueued_at = time.monotonic()
+        for part in split_message(text):
+            queue.append((part, enqueued_at))
+        if chat_id not in self.workers:
+            self.workers[chat_id] = asyncio.create_task(self._drain(chat_id))
+
+    def _bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные ID принадлежат группам и каналам
+            rate = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate)
+        return bucket
+
+    async def _drain(self, chat_id):
+        queue = self.queues[chat_id]
+        bucket = self._bucket(chat_id)
+        try:
+            while queue:
+                text, enqueued_at = queue[0]
+                await self._deliver(chat_id, text, bucket)
+                queue.popleft()
+                self.latencies.append(time.monotonic() - enqueued_at)
+        finally:
+            # При отмене неотправленные сообщения остаются в очереди до следующего enqueue
+            del self.workers[chat_id]
+            if not queue:
+                del self.queues[chat_id]
+
+    async def _deliver(self, chat_id, text, bucket):
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self.send(chat_id, text)
+                self.sent += 1
+                return True
+            except Exception as e:
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after is None or attempt == self.max_retries:
+                    self.failed += 1
+                    logger.error(f"Ошибка при отправке сообщения в чат {chat_id}: {e}")
+                    return False
+                self.retries += 1
+                bucket.pause(retry_after)
+                logger.warning(f"Ограничение Telegram для чата {chat_id}: повтор через {retry_after} сек.")
+        return False
+
+    def queue_depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    # Ожидание отправки всех сообщений из очереди
+    async def join(self):
+        while self.workers:
+            await asyncio.gather(*list(self.workers.values()), return_exceptions=True)
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            'queue_depth': self.queue_depth(),
+            'active_chats': len(self.workers),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'latency_p50': percentile(0.5),
+            'latency_p99': percentile(0.99),
+            'latency_max': latencies[-1] if latencies else 0.0
+        }
@@ -0,0 +1,84 @@
+# Запись файлов состояния: атомарная замена через временный файл и отложенная запись вне цикла событий
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Файл либо остается прежним, либо целиком заменяется новым: при падении во время записи
+# на диске остается старая версия, а не обрезанный файл
+def atomic_write(path, data, fsync=True):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    # Переименование попадает на диск только после fsync каталога (на Windows не поддерживается)
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class DebouncedWriter:
+    # Изменения копятся delay секунд и записываются одним файлом. Сериализация выполняется в цикле
+    # событий (данные не меняются посреди json.dumps), сама запись и fsync — в потоке.
+    # observe(name, seconds) получает длительность каждой записи
+    def __init__(self, delay=2.0, fsync=True, observe=None):
+        self.delay = delay
+        self.fsync = fsync
+        self.observe = observe
+        self.targets = {}
+        self.dirty = set()
+        self.writes = 0
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    # serialize() возвращает строку или байты с текущим состоянием
+    def register(self, name, path, serialize):
+        self.targets[name] = (path, serialize)
+
+    def mark(self, name):
+        self.dirty.add(name)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        await self.flush()
+
+    # Записи идут по одной: иначе os.replace более старого снимка мог бы закончиться позже нового
+    async def flush(self):
+        async with self._lock:
+            while self.dirty:
+                names, self.dirty = self.dirty, set()
+                for name in names:
+                    path, serialize = self.targets[name]
+                    data = serialize()
+                    started = time.perf_counter()
+                    try:
+                        await asyncio.to_thread(atomic_write, path, data, self.fsync)
+                    except Exception as e:
+                        logger.error(f"Ошибка при записи {path}: {e}")
+                        continue
+                    self.writes += 1
+                    if self.observe is not None:
+                        self.observe(f'persist_{name}', time.perf_counter() - started)
+                    logger.debug(f"Состояние {name} сохранено в {path}")
@@ -0,0 +1,271 @@
+# Планировщик опроса с учетом дневной квоты YouTube Data API
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import heapq
+import math
+import threading
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    try:
+        QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+    except ZoneInfoNotFoundError:  # На Windows без пакета tzdata
+        QUOTA_TIMEZONE = timezone(timedelta(hours=-8))
+except ImportError:
+    QUOTA_TIMEZONE = timezone(timedelta(hours=-8))
+
+# Стоимость методов в единицах квоты (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COSTS = {
+    'youtube.channels.list': 1,
+    'youtube.videos.list': 1,
+    'youtube.playlistItems.list': 1,
+    'youtube.playlists.list': 1,
+    'youtube.search.list': 100,
+}
+VIDEOS_PER_REQUEST = 50
+CHANNELS_PER_REQUEST = 50
+VELOCITY_SMOOTHING = 0.5  # Вес последнего замера в сглаженной скорости роста просмотров
+
+
+# Стоимость одного вызова. Analytics API имеет собственную квоту и в дневной бюджет не входит
+def method_cost(method_id):
+    if method_id in QUOTA_COSTS:
+        return QUOTA_COSTS[method_id]
+    if method_id and method_id.startswith('youtube.'):
+        return 1
+    return 0
+
+
+# План одного тика: что опрашивать и сколько единиц это займет
+@dataclass
+class TickPlan:
+    video_ids: list = field(default_factory=list)
+    channel_ids: list = field(default_factory=list)
+    planned_units: int = 0
+    spent_units: int = 0
+    spent_before: int = 0
+    exhausted: bool = False
+
+
+# Состояние опроса одного видео
+@dataclass
+class VideoPollState:
+    last_polled: float = 0.0
+    last_views: int = None
+    views_per_hour: float = 0.0  # Сглаженная скорость роста по последним замерам
+    measured: bool = False  # Скорость уже посчитана хотя бы по двум замерам
+    published_at: datetime = None
+
+
+class QuotaScheduler:
+    # tiers — уровни опроса [(минимум просмотров в час, интервал опроса в секундах), ...] от самого
+    # частого к самому редкому; последний уровень с порогом 0 принимает все остальные видео.
+    # По умолчанию: горячие — каждый тик, затем раз в cold_interval.
+    # Статистика каналов запрашивается раз в channel_interval (по умолчанию каждый тик)
+    def __init__(self, daily_budget=9000, poll_interval=60, cold_interval=3600,
+                 hot_age=timedelta(days=2), hot_views_per_hour=60, tiers=None, channel_interval=None):
+        self.daily_budget = daily_budget
+        self.poll_interval = poll_interval
+        self.channel_interval = poll_interval if channel_interval is None else channel_interval
+        self.hot_age = hot_age
+        self.tiers = sorted(tiers or [(hot_views_per_hour, poll_interval), (0, cold_interval)], reverse=True)
+        self.spent = 0
+        self.units_by_method = {}
+        self.videos = {}
+        self.channels = {}  # channel_id -> время последнего замера статистики
+        self.reset_at = self.next_reset()
+        self._lock = threading.Lock()
+
+    # Ближайший сброс квоты — полночь по тихоокеанскому времени
+    @staticmethod
+    def next_reset(now=None):
+        now = (now or datetime.now(timezone.utc)).astimezone(QUOTA_TIMEZONE)
+        midnight = datetime(now.year, now.month, now.day, tzinfo=QUOTA_TIMEZONE) + timedelta(days=1)
+        return midnight.astimezone(timezone.utc)
+
+    def seconds_until_reset(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        return max(0.0, (self.reset_at - now).total_seconds())
+
+    def _maybe_reset(self, now):
+        if now >= self.reset_at:
+            with self._lock:
+                self.spent = 0
+                self.units_by_method = {}
+                self.reset_at = self.next_reset(now)
+
+    @property
+    def remaining(self):
+        return max(0, self.daily_budget - self.spent)
+
+    # Учет фактически выполненного запроса (вызывается из потоков пула)
+    def record(self, method_id):
+        cost = method_cost(method_id)
+        with self._lock:
+            self.spent += cost
+            key = method_id or 'unknown'
+            self.units_by_method[key] = self.units_by_method.get(key, 0) + cost
+        return cost
+
+    # Квота исчерпана раньше, чем рассчитывали: до сброса больше ничего не тратим
+    def mark_exhausted(self):
+        with self._lock:
+            self.spent = max(self.spent, self.daily_budget)
+
+    # Сколько единиц можно потратить в этом тике, чтобы бюджета хватило до сброса
+    def tick_allowance(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        ticks_left = max(1.0, self.seconds_until_reset(now) / self.poll_interval)
+        return min(self.remaining, max(2, int(self.remaining / ticks_left)))
+
+    # Номер уровня опроса: новые видео и видео с еще неизвестной скоростью — на самом частом,
+    # остальные — по скорости роста просмотров
+    def tier_for(self, state, now):
+        if not state.measured:
+            return 0
+        if state.published_at is not None and now - state.published_at < self.hot_age:
+            return 0
+        for tier, (min_views_per_hour, _) in enumerate(self.tiers):
+            if state.views_per_hour >= min_views_per_hour:
+                return tier
+        return len(self.tiers) - 1
+
+    def interval_for(self, state, now):
+        return self.tiers[self.tier_for(state, now)][1]
+
+    # Выбор каналов и видео для тика: сначала просроченные видео частых уровней, с учетом бюджета.
+    # Свободные места в последней пачке videos().list занимают видео, срок которых подходит раньше
+    # остальных: запрос стоит столько же, а данные обновляются заранее.
+    # Статистика каналов запрашивается пачками по CHANNELS_PER_REQUEST раз в channel_interval и тоже
+    # входит в бюджет тика: при нехватке каналы получают не больше половины бюджета, давно не
+    # опрошенные — первыми, остальные ждут следующих тиков
+    def plan_tick(self, video_ids, channel_ids=(), now=None):
+        now = now or datetime.now(timezone.utc)
+        self._maybe_reset(now)
+        plan = TickPlan(spent_before=self.spent)
+        allowance = self.tick_allowance(now)
+        if allowance < 1:
+            plan.exhausted = True
+            return plan
+
+        timestamp = now.timestamp()
+        channels_due = sorted(
+            (self.channels.get(channel_id, 0.0), channel_id) for channel_id in channel_ids
+            if timestamp >= self.channels.get(channel_id, 0.0) + self.channel_interval
+        )
+        due = []
+        upcoming = []
+        for video_id in video_ids:
+            state = self.videos.setdefault(video_id, VideoPollState())
+            tier = self.tier_for(state, now)
+            interval = self.tiers[tier][1]
+            next_poll = state.last_polled + interval
+            if timestamp >= next_poll:
+                due.append((tier, next_poll, video_id))
+            elif timestamp >= next_poll - interval / 2:
+                # Досрочно — не раньше середины интервала, иначе замер скорости слишком короткий
+                upcoming.append((next_poll, video_id))
+        due.sort()
+
+        channel_requests = min(
+            math.ceil(len(channels_due) / CHANNELS_PER_REQUEST),
+            max(allowance // 2, allowance - math.ceil(len(due) / VIDEOS_PER_REQUEST))
+        )
+        plan.channel_ids = [channel_id for _, channel_id in channels_due[:channel_requests * CHANNELS_PER_REQUEST]]
+        plan.planned_units = channel_requests * method_cost('youtube.channels.list')
+
+        max_videos = max(0, allowance - plan.planned_units) * VIDEOS_PER_REQUEST
+        plan.video_ids = [video_id for _, _, video_id in due[:max_videos]]
+        free = min(-len(plan.video_ids) % VIDEOS_PER_REQUEST, max_videos - len(plan.video_ids))
+        if free and upcoming:
+            plan.video_ids += [video_id for _, video_id in heapq.nsmallest(free, upcoming)]
+        plan.planned_units += math.ceil(len(plan.video_ids) / VIDEOS_PER_REQUEST) * method_cost('youtube.videos.list')
+        return plan
+
+    # Фиксация результатов тика: время опроса и скорость роста просмотров.
+    # not_modified — видео из пачек с ответом 304: просмотры не выросли. Видео без данных и не из
+    # not_modified (пачка не получена из-за ошибки) остаются как были и опрашиваются в следующий раз
+    def observe(self, polled_ids, video_stats, not_modified=(), now=None):
+        now = now or datetime.now(timezone.utc)
+        timestamp = now.timestamp()
+        not_modified = set(not_modified)
+        for video_id in polled_ids:
+            data = video_stats.get(video_id)
+            if data is None and video_id not in not_modified:
+                continue
+            state = self.videos.setdefault(video_id, VideoPollState())
+            # Повторный опрос сразу после предыдущего (например, после уведомления WebSub)
+            # не говорит о скорости роста: прирост за секунды почти всегда нулевой
+            too_soon = timestamp - state.last_polled < self.poll_interval / 2
+            if data is not None:
+                views = data['viewCount']
+                if state.last_views is not None and state.last_polled and not too_soon:
+                    self._update_velocity(state, max(0, views - state.last_views), timestamp)
+                state.last_views = views
+                if state.published_at is None and data.get('publishedAt'):
+                    state.published_at = datetime.fromisoformat(data['publishedAt'].replace('Z', '+00:00'))
+            elif state.last_views is not None and state.last_polled and not too_soon:
+                # Данные не изменились (304) — просмотры не выросли
+                self._update_velocity(state, 0, timestamp)
+            state.last_polled = timestamp
+
+    # Фиксация опроса каналов: каналы без статистики (ошибка запроса) опрашиваются в следующий раз
+    def observe_channels(self, polled_ids, channel_stats, now=None):
+        timestamp = (now or datetime.now(timezone.utc)).timestamp()
+        for channel_id in polled_ids:
+            if channel_id in channel_stats:
+                self.channels[channel_id] = timestamp
+
+    # Сглаживание скорости: один всплеск не переводит видео на частый уровень надолго,
+    # а затихшее видео опускается на редкие уровни за несколько опросов
+    @staticmethod
+    def _update_velocity(state, delta, timestamp):
+        hours = max((timestamp - state.last_polled) / 3600, 1 / 3600)
+        rate = delta / hours
+        if not state.measured:
+            state.views_per_hour = rate
+            state.measured = True
+        else:
+            state.views_per_hour = VELOCITY_SMOOTHING * rate + (1 - VELOCITY_SMOOTHING) * state.views_per_hour
+
+    # Состояние для снимка быстрого запуска: расход квоты до ближайшего сброса и состояние опроса видео.
+    # После перезапуска видео остаются на своих уровнях, а не опрашиваются все сразу как новые
+    def dump_state(self):
+        with self._lock:
+            return {
+                'reset_at': self.reset_at.isoformat(),
+                'spent': self.spent,
+                'units_by_method': dict(self.units_by_method),
+                'channels': dict(self.channels),
+                'videos': {
+                    video_id: [state.last_polled, state.last_views, state.views_per_hour, state.measured,
+                               state.published_at.isoformat() if state.published_at else None]
+                    for video_id, state in self.videos.items()
+                }
+            }
+
+    def load_state(self, data, now=None):
+        now = now or datetime.now(timezone.utc)
+        # Расход квоты имеет смысл, только если сброс с момента сохранения еще не наступил
+        if datetime.fromisoformat(data['reset_at']) == self.reset_at and now < self.reset_at:
+            self.spent = data['spent']
+            self.units_by_method = dict(data['units_by_method'])
+        self.channels.update(data.get('channels', {}))
+        for video_id, (last_polled, last_views, views_per_hour, measured, published_at) in data['videos'].items():
+            self.videos[video_id] = VideoPollState(
+                last_polled, last_views, views_per_hour, measured,
+                datetime.fromisoformat(published_at) if published_at else None
+            )
+
+    def finish_tick(self, plan):
+        plan.spent_units = self.spent - plan.spent_before
+        return plan
+
+    # Число видео на каждом уровне опроса
+    def tier_counts(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        counts = [0] * len(self.tiers)
+        for state in self.videos.values():
+            counts[self.tier_for(state, now)] += 1
+        return counts
+
@@ -0,0 +1,122 @@
+# Отчет по каналу из независимых разделов. Каждый раздел кэшируется по своим входным данным
+# и перестраивается, только когда они изменились: отчеты по расписанию и /report между тиками
+# собираются из готовых строк
+from collections import OrderedDict
+
+
+class SectionCache:
+    # key — кортеж входных данных раздела из простых значений (числа, строки, вложенные кортежи),
+    # чтобы изменение исходного словаря на месте не выдавало старый текст за актуальный
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (scope, name) -> (key, text)
+        self.renders = 0
+        self.hits = 0
+
+    def render(self, scope, name, key, render, *args):
+        entry = self.entries.get((scope, name))
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            self.entries.move_to_end((scope, name))
+            return entry[1]
+        text = render(*args)
+        self.renders += 1
+        self.entries[(scope, name)] = (key, text)
+        self.entries.move_to_end((scope, name))
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return text
+
+    def hit_rate(self):
+        total = self.renders + self.hits
+        return self.hits / total if total else 0.0
+
+
+# Прирост за сутки и неделю относительно предыдущих периодов
+def format_comparison(growth):
+    def signed(value):
+        return "N/A" if value is None else f"{value:+,}"
+    if not growth:
+        return "N/A"
+    return (f"{signed(growth['day'])} за сутки (сутками ранее {signed(growth['prev_day'])}), "
+            f"{signed(growth['week'])} за неделю (неделей ранее {signed(growth['prev_week'])})")
+
+
+def render_header(channel_title, date):
+    text = "📅 **Ежедневный отчет по каналу**  \n"
+    if channel_title:
+        text += f"Канал: {channel_title}  \n"
+    return text + f"Дата: {date}  \n\n"
+
+
+def render_metrics(subscribers, subscriber_diff, total_views, views_diff):
+    return ("### **Основные метрики**  \n"
+            f"▫️ **Подписчики:** {subscribers:,} (+{subscriber_diff})  \n"
+            f"▫️ **Просмотры канала:** {total_views:,} (+{views_diff:,})  \n\n")
+
+
+# daily_activity — кортеж get_analytics_data или None: для чужих каналов (own_channel=False)
+# или пока аналитика канала владельца еще не загружена
+def render_activity(daily_activity, own_channel=False):
+    text = "### **Активность за 24 часа**  \n"
+    if daily_activity is None and own_channel:
+        return text + "▫️ Данные Analytics API еще не загружены, повторите запрос позже  \n\n"
+    if daily_activity is None:
+        return text + "▫️ N/A (Analytics API доступен только для своего канала)  \n\n"
+    views_24h, likes_24h, dislikes_24h, comments_24h, shares_24h, minutes_watched, avg_duration, subs_gained = daily_activity
+    if views_24h == 0 and subs_gained == 0:
+        text += "⚠️ Данные за последние 24 часа еще не обработаны YouTube Analytics.\n"
+    text += f"▫️ **Просмотры:** {views_24h:,}  \n"
+    text += f"▫️ **Лайки:** {likes_24h:,}  \n"
+    text += f"▫️ **Дизлайки:** {dislikes_24h:,}  \n"
+    text += f"▫️ **Комментарии:** {comments_24h:,}  \n"
+    text += f"▫️ **Шеры:** {shares_24h:,}  \n"
+    text += f"▫️ **Средняя продолжительность просмотра:** {avg_duration:.2f} сек  \n"
+    text += f"▫️ **Подписчики за день:** {subs_gained}  \n\n"
+    return text
+
+
+# top_videos — кортежи (title, views, likes, dislikes, comments, retention), retention — (viewPercentage, minutesWatched) или None
+def render_top_videos(top_videos):
+    text = "### **Топ-видео дня**  \n"
+    for i, (title, views, likes, dislikes, comments, retention) in enumerate(top_videos, 1):
+        text += f"{i}. **«{title}»**  \n"
+        text += f"   - Просмотры всего: {views:,}  \n"
+        text += f"   - Лайки: {likes:,}  \n"
+        text += f"   - Дизлайки: {dislikes:,}  \n"
+        text += f"   - Комментарии: {comments:,}  \n"
+        if retention is None:
+            text += "   - % досмотра: N/A (Analytics API)  \n\n"
+        else:
+            text += f"   - % досмотра: {retention[0]:.1f}%  \n"
+            text += f"   - Время просмотра за 7 дней: {retention[1]:,} мин  \n\n"
+    return text
+
+
+def render_audience(male, female):
+    return ("### **Анализ аудитории**  \n"
+            "▫️ **Пол аудитории:**  \n"
+            f"   - Мужчины: {male:.1f}%  \n"
+            f"   - Женщины: {female:.1f}%  \n"
+            "▫️ **Процент возвращающихся зрителей:** N/A (Требуется подписка)  \n\n")
+
+
+def render_traffic(suggested, search, external):
+    return ("### **Источники трафика**  \n"
+            f"▫️ **Рекомендации YouTube:** {suggested:.1f}%  \n"
+            f"▫️ **Поисковые запросы:** {search:.1f}%  \n"
+            f"▫️ **Внешние источники:** {external:.1f}%  \n\n")
+
+
+# subscribers и views — кортежи прироста (day, prev_day, week, prev_week) или None
+def render_comparison(subscribers, views):
+    def growth(values):
+        return dict(zip(('day', 'prev_day', 'week', 'prev_week'), values)) if values else None
+    return ("### **Сравнение с прошлыми периодами**  \n"
+            f"▫️ **Подписки:** {format_comparison(growth(subscribers))}  \n"
+            f"▫️ **Просмотры:** {format_comparison(growth(views))}  \n\n")
+
+
+def render_trend(growing):
+    trend = "Подписки и просмотры растут." if growing else "Активность стабильна."
+    return f"📊 **Общий тренд:**  \n{trend}  \n"
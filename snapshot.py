@@ -0,0 +1,139 @@
+# Колоночный срез статистики видео: массивы NumPy, выровненные по постоянному индексу video_id
+from itertools import chain, repeat
+from operator import itemgetter
+
+import numpy as np
+
+COLUMNS = ('viewCount', 'likeCount', 'commentCount')
+ROW_CACHE_SIZE = 8
+_get_columns = itemgetter(*COLUMNS)
+
+
+class VideoSnapshot:
+    # Строка видео назначается при первом появлении и больше не меняется,
+    # поэтому номера строк можно хранить между тиками
+    def __init__(self, capacity=1024):
+        self.index = {}
+        self.ids = []
+        self.views = np.zeros(capacity, dtype=np.int64)
+        self.likes = np.zeros(capacity, dtype=np.int64)
+        self.comments = np.zeros(capacity, dtype=np.int64)
+        # Списки ID повторяются от тика к тику, а строки не меняются — их можно не искать заново
+        self._row_cache = {}
+        self.version = 0  # Растет с каждым update(): по нему кэшируются производные от среза данные
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, video_id):
+        return video_id in self.index
+
+    def _grow(self, size):
+        capacity = len(self.views)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ('views', 'likes', 'comments'):
+            old = getattr(self, name)
+            column = np.zeros(capacity, dtype=np.int64)
+            column[:len(old)] = old
+            setattr(self, name, column)
+
+    # Номера строк для списка ID; неизвестные видео получают новые строки
+    def rows(self, video_ids):
+        cached = self._cached_rows(video_ids)
+        if cached is not None:
+            return cached
+        index = self.index
+        for video_id in [video_id for video_id in video_ids if video_id not in index]:
+            if video_id not in index:  # ID может повторяться в списке
+                index[video_id] = len(self.ids)
+                self.ids.append(video_id)
+        self._grow(len(self.ids))
+        rows = np.fromiter(map(index.__getitem__, video_ids), dtype=np.int64, count=len(video_ids))
+        rows.flags.writeable = False
+        if len(self._row_cache) >= ROW_CACHE_SIZE:
+            self._row_cache.pop(next(iter(self._row_cache)))
+        self._row_cache[self._cache_key(video_ids)] = (list(video_ids), rows)
+        return rows
+
+    @staticmethod
+    def _cache_key(video_ids):
+        return (len(video_ids), video_ids[0], video_ids[-1]) if video_ids else None
+
+    def _cached_rows(self, video_ids):
+        cached = self._row_cache.get(self._cache_key(video_ids))
+        if cached is not None and cached[0] == video_ids:
+            return cached[1]
+        return None
+
+    # Запись ответа videos().list. Возвращает строки, просмотры до и после обновления.
+    # Для новых видео «до» равно «после»
+    def update(self, video_stats):
+        video_ids = list(video_stats)
+        self.version += 1
+        first_new = len(self.ids)
+        rows = self.rows(video_ids)
+        values = np.fromiter(
+            chain.from_iterable(map(_get_columns, video_stats.values())), dtype=np.int64, count=len(video_ids) * len(COLUMNS)
+        ).reshape(len(video_ids), len(COLUMNS))
+        new = rows >= first_new
+        self.views[rows[new]] = values[new, 0]
+        previous = self.views[rows]
+        self.views[rows] = values[:, 0]
+        self.likes[rows] = values[:, 1]
+        self.comments[rows] = values[:, 2]
+        return rows, previous, values[:, 0]
+
+    # k видео с наибольшим приростом относительно baseline (словарь video_id -> просмотры).
+    # argpartition выбирает k лучших за линейное время, сортируются только они
+    def top_growth(self, video_ids, baseline, k):
+        rows = self._cached_rows(video_ids)
+        known = video_ids
+        if rows is None:
+            known = [video_id for video_id in video_ids if video_id in self.index]
+            rows = self.rows(known)
+        if not len(rows) or k <= 0:
+            return []
+        base = np.fromiter(map(baseline.get, known, repeat(0)), dtype=np.int64, count=len(known))
+        diff = self.views[rows] - base
+        if len(rows) > k:
+            best = np.argpartition(-diff, k - 1)[:k]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(-diff[best], kind='stable')]
+        return [(self.ids[rows[i]], int(diff[i])) for i in best]
+
+    # Срез для снимка быстрого запуска: ID и значения по строкам
+    def dump_state(self):
+        size = len(self.ids)
+        return {
+            'ids': self.ids,
+            'views': self.views[:size].tolist(),
+            'likes': self.likes[:size].tolist(),
+            'comments': self.comments[:size].tolist()
+        }
+
+    # Восстановление среза при запуске, до первых update()
+    def load_state(self, data):
+        self.ids = list(data['ids'])
+        self.index = {video_id: row for row, video_id in enumerate(self.ids)}
+        size = len(self.ids)
+        self._grow(size)
+        self.views[:size] = data['views']
+        self.likes[:size] = data['likes']
+        self.comments[:size] = data['comments']
+        self._row_cache = {}
+        self.version += 1
+
+    def get(self, video_id):
+        row = self.index.get(video_id)
+        if row is None:
+            return None
+        return {
+            'viewCount': int(self.views[row]),
+            'likeCount': int(self.likes[row]),
+            'dislikeCount': 0,
+            'commentCount': int(self.comments[row])
+        }
@@ -0,0 +1,68 @@
+# Реестр подписок: какие чаты следят за какими каналами
+import json
+import os
+
+from persistence import atomic_write
+
+
+class SubscriptionRegistry:
+    def __init__(self, path):
+        self.path = path
+        self.chats_by_channel = {}
+        self.channels_by_chat = {}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.chats_by_channel = {}
+            self.channels_by_chat = {}
+            for channel_id, chats in data.items():
+                for chat_id in chats:
+                    self.subscribe(chat_id, channel_id)
+        return self
+
+    def dumps(self):
+        data = {channel_id: sorted(chats) for channel_id, chats in self.chats_by_channel.items()}
+        return json.dumps(data, ensure_ascii=False)
+
+    def save(self, fsync=True):
+        atomic_write(self.path, self.dumps(), fsync)
+
+    # Возвращает True, если подписка новая
+    def subscribe(self, chat_id, channel_id):
+        chats = self.chats_by_channel.setdefault(channel_id, set())
+        if chat_id in chats:
+            return False
+        chats.add(chat_id)
+        self.channels_by_chat.setdefault(chat_id, set()).add(channel_id)
+        return True
+
+    def unsubscribe(self, chat_id, channel_id):
+        chats = self.chats_by_channel.get(channel_id)
+        if not chats or chat_id not in chats:
+            return False
+        chats.discard(chat_id)
+        if not chats:
+            del self.chats_by_channel[channel_id]
+        channels = self.channels_by_chat[chat_id]
+        channels.discard(channel_id)
+        if not channels:
+            del self.channels_by_chat[chat_id]
+        return True
+
+    # Каналы, на которые подписан хотя бы один чат: каждый опрашивается один раз за тик
+    def channels(self):
+        return list(self.chats_by_channel)
+
+    def chats_for(self, channel_id):
+        return self.chats_by_channel.get(channel_id, set())
+
+    def channels_for(self, chat_id):
+        return self.channels_by_chat.get(chat_id, set())
+
+    def all_chats(self):
+        return set(self.channels_by_chat)
+
+    def __len__(self):
+        return sum(len(chats) for chats in self.chats_by_channel.values())
@@ -0,0 +1,222 @@
+# Локальное хранилище временных рядов статистики канала и видео (SQLite в режиме WAL)
+import json
+import sqlite3
+import threading
+import time
+
+DAY = 86400
+HOUR = 3600
+QUERY_CHUNK = 500  # ID в одном IN (...): меньше лимита параметров SQLite
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_stats (
+    channel_id TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    subscribers INTEGER NOT NULL,
+    views INTEGER NOT NULL,
+    videos INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS channel_stats_ts ON channel_stats (ts);
+CREATE TABLE IF NOT EXISTS video_stats (
+    video_id TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    views INTEGER NOT NULL,
+    likes INTEGER NOT NULL,
+    comments INTEGER NOT NULL,
+    PRIMARY KEY (video_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS video_stats_ts ON video_stats (ts);
+CREATE TABLE IF NOT EXISTS analytics_cache (
+    key TEXT PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class StatsStore:
+    # raw_retention — сколько хранятся все замеры, затем остается последний замер за час,
+    # после hourly_retention — последний за сутки, после daily_retention данные удаляются.
+    # legacy_channel_id — канал, к которому относятся замеры базы без колонки channel_id
+    def __init__(self, path, raw_retention=2 * DAY, hourly_retention=30 * DAY, daily_retention=400 * DAY,
+                 compact_interval=HOUR, legacy_channel_id=''):
+        self.path = path
+        self.raw_retention = raw_retention
+        self.hourly_retention = hourly_retention
+        self.daily_retention = daily_retention
+        self.compact_interval = compact_interval
+        self.last_compaction = 0
+        self._pending_channel = []
+        self._pending_videos = []
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate_channel_stats(legacy_channel_id)
+        self.conn.executescript(SCHEMA)
+
+    # Первая версия базы хранила замеры одного канала без channel_id
+    def _migrate_channel_stats(self, legacy_channel_id):
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(channel_stats)")]
+        if not columns or 'channel_id' in columns:
+            return
+        with self.conn:
+            self.conn.execute("ALTER TABLE channel_stats RENAME TO channel_stats_v1")
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(
+                "INSERT INTO channel_stats SELECT ?, ts, subscribers, views, videos FROM channel_stats_v1",
+                (legacy_channel_id,)
+            )
+            self.conn.execute("DROP TABLE channel_stats_v1")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # Замеры копятся в памяти и записываются одной транзакцией в flush()
+    def add_channel_sample(self, channel_id, ts, statistics):
+        with self._lock:
+            self._pending_channel.append((
+                channel_id,
+                int(ts),
+                int(statistics.get('subscriberCount', 0)),
+                int(statistics.get('viewCount', 0)),
+                int(statistics.get('videoCount', 0))
+            ))
+
+    def add_video_samples(self, ts, video_stats):
+        ts = int(ts)
+        rows = [
+            (video_id, ts, data['viewCount'], data['likeCount'], data['commentCount'])
+            for video_id, data in video_stats.items()
+        ]
+        with self._lock:
+            self._pending_videos.extend(rows)
+
+    def flush(self):
+        with self._lock:
+            channel_rows, self._pending_channel = self._pending_channel, []
+            video_rows, self._pending_videos = self._pending_videos, []
+            if channel_rows or video_rows:
+                with self.conn:
+                    self.conn.executemany("INSERT OR REPLACE INTO channel_stats VALUES (?, ?, ?, ?, ?)", channel_rows)
+                    self.conn.executemany("INSERT OR REPLACE INTO video_stats VALUES (?, ?, ?, ?, ?)", video_rows)
+        if time.time() - self.last_compaction >= self.compact_interval:
+            self.compact()
+        return len(channel_rows) + len(video_rows)
+
+    # Прореживание старых замеров: после raw_retention — по одному в час, после hourly_retention — по одному в сутки
+    def compact(self, now=None):
+        now = int(now or time.time())
+        raw_cutoff = now - self.raw_retention
+        hourly_cutoff = now - self.hourly_retention
+        daily_cutoff = now - self.daily_retention
+        with self._lock, self.conn:
+            for bucket, start, end in ((HOUR, hourly_cutoff, raw_cutoff), (DAY, daily_cutoff, hourly_cutoff)):
+                self.conn.execute(
+                    "DELETE FROM channel_stats WHERE ts >= ? AND ts < ? AND (channel_id, ts) NOT IN ("
+                    "SELECT channel_id, MAX(ts) FROM channel_stats WHERE ts >= ? AND ts < ? GROUP BY channel_id, ts / ?)",
+                    (start, end, start, end, bucket)
+                )
+                self.conn.execute(
+                    "DELETE FROM video_stats WHERE ts >= ? AND ts < ? AND (video_id, ts) NOT IN ("
+                    "SELECT video_id, MAX(ts) FROM video_stats WHERE ts >= ? AND ts < ? GROUP BY video_id, ts / ?)",
+                    (start, end, start, end, bucket)
+                )
+            self.conn.execute("DELETE FROM channel_stats WHERE ts < ?", (daily_cutoff,))
+            self.conn.execute("DELETE FROM video_stats WHERE ts < ?", (daily_cutoff,))
+        self.last_compaction = now
+
+    # Последний известный срез канала и его видео на момент ts. Для каждого видео читается
+    # одна строка по первичному ключу (video_id, ts), ряды других каналов не затрагиваются
+    def snapshot_at(self, ts, channel_id, video_ids):
+        ts = int(ts)
+        video_ids = list(dict.fromkeys(video_ids))
+        rows = []
+        with self._lock:
+            channel = self.conn.execute(
+                "SELECT subscribers, views FROM channel_stats WHERE channel_id = ? AND ts <= ? ORDER BY ts DESC LIMIT 1",
+                (channel_id, ts)
+            ).fetchone()
+            for i in range(0, len(video_ids), QUERY_CHUNK):
+                chunk = video_ids[i:i + QUERY_CHUNK]
+                rows += self.conn.execute(
+                    "SELECT video_id, views, likes, comments FROM video_stats WHERE (video_id, ts) IN ("
+                    f"SELECT video_id, MAX(ts) FROM video_stats WHERE video_id IN ({','.join('?' * len(chunk))}) "
+                    "AND ts <= ? GROUP BY video_id)",
+                    (*chunk, ts)
+                ).fetchall()
+        if channel is None and not rows:
+            return {}
+        snapshot = {
+            'video_stats': {
+                video_id: {'viewCount': views, 'likeCount': likes, 'dislikeCount': 0, 'commentCount': comments}
+                for video_id, views, likes, comments in rows
+            }
+        }
+        if channel is not None:
+            snapshot['subscribers'], snapshot['total_views'] = channel
+        return snapshot
+
+    # Прирост подписчиков и просмотров за сутки и неделю и за предыдущие такие же периоды — одним запросом
+    def channel_comparison(self, channel_id, now=None):
+        now = int(now or time.time())
+        offsets = (0, DAY, 2 * DAY, 7 * DAY, 14 * DAY)
+        query = " UNION ALL ".join(
+            f"SELECT {i}, (SELECT subscribers FROM channel_stats WHERE channel_id = ? AND ts <= ? ORDER BY ts DESC LIMIT 1), "
+            f"(SELECT views FROM channel_stats WHERE channel_id = ? AND ts <= ? ORDER BY ts DESC LIMIT 1)"
+            for i in range(len(offsets))
+        )
+        params = [value for offset in offsets for _ in range(2) for value in (channel_id, now - offset)]
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        points = {offsets[i]: (subscribers, views) for i, subscribers, views in rows}
+
+        def growth(newer, older, field):
+            a, b = points[newer][field], points[older][field]
+            return None if a is None or b is None else a - b
+
+        return {
+            name: {
+                'day': growth(0, DAY, field),
+                'prev_day': growth(DAY, 2 * DAY, field),
+                'week': growth(0, 7 * DAY, field),
+                'prev_week': growth(7 * DAY, 14 * DAY, field)
+            }
+            for field, name in ((0, 'subscribers'), (1, 'views'))
+        }
+
+    # Одна запись кэша, если она моложе max_age, иначе None
+    def get_cached(self, key, max_age, now=None):
+        now = int(now or time.time())
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM analytics_cache WHERE key = ? AND ts > ?", (key, now - max_age)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_cache(self, data, now=None):
+        now = int(now or time.time())
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO analytics_cache VALUES (?, ?, ?)",
+                [(key, now, json.dumps(value, ensure_ascii=False)) for key, value in data.items()]
+            )
+
+    def clear_cache(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM analytics_cache")
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
@@ -0,0 +1,232 @@
+# Push-уведомления о загрузках через WebSub (PubSubHubbub): подписка на Atom-ленту канала,
+# подтверждение подписки хабом, прием уведомлений и продление аренды подписки
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+HUB_URL = "https://pubsubhubbub.appspot.com/subscribe"
+TOPIC_URL = "https://www.youtube.com/xml/feeds/videos.xml?channel_id={channel_id}"
+MAX_NOTIFICATION_SIZE = 256 * 1024
+
+NAMESPACES = {
+    'atom': 'http://www.w3.org/2005/Atom',
+    'yt': 'http://www.youtube.com/xml/schemas/2015',
+    'at': 'http://purl.org/atompub/tombstones/1.0',
+}
+
+
+@dataclass
+class FeedEntry:
+    video_id: str
+    channel_id: str
+    title: str = None
+    published: str = None
+    updated: str = None
+    deleted: bool = False
+
+
+def topic_for(channel_id):
+    return TOPIC_URL.format(channel_id=channel_id)
+
+
+def channel_from_topic(topic):
+    prefix = TOPIC_URL.format(channel_id='')
+    return topic[len(prefix):] if topic and topic.startswith(prefix) else None
+
+
+# Разбор уведомления: новые и измененные видео приходят как <entry>, удаленные — как <at:deleted-entry>
+def parse_feed(body):
+    root = ET.fromstring(body)
+    entries = []
+    for entry in root.findall('atom:entry', NAMESPACES):
+        video_id = entry.findtext('yt:videoId', namespaces=NAMESPACES)
+        channel_id = entry.findtext('yt:channelId', namespaces=NAMESPACES)
+        if not video_id or not channel_id:
+            continue
+        entries.append(FeedEntry(
+            video_id=video_id,
+            channel_id=channel_id,
+            title=entry.findtext('atom:title', namespaces=NAMESPACES),
+            published=entry.findtext('atom:published', namespaces=NAMESPACES),
+            updated=entry.findtext('atom:updated', namespaces=NAMESPACES)
+        ))
+    for entry in root.findall('at:deleted-entry', NAMESPACES):
+        ref = entry.get('ref', '')
+        uri = entry.findtext('at:by/atom:uri', namespaces=NAMESPACES) or ''
+        if ref.startswith('yt:video:'):
+            entries.append(FeedEntry(video_id=ref[len('yt:video:'):], channel_id=uri.rsplit('/', 1)[-1], deleted=True))
+    return entries
+
+
+def sign(secret, body):
+    return 'sha1=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha1).hexdigest()
+
+
+# Состояние подписки на ленту одного канала
+@dataclass
+class Lease:
+    requested_at: float = 0.0
+    expires_at: float = 0.0
+
+
+class WebSubSubscriber:
+    # callback_url — внешний адрес приемника, который хаб вызывает для подтверждения и уведомлений.
+    # on_entries(entries) — корутина, получающая разобранные записи ленты.
+    # Аренда продлевается за renew_margin секунд до окончания; неподтвержденная подписка
+    # запрашивается повторно через retry_interval секунд
+    def __init__(self, callback_url, on_entries, hub_url=HUB_URL, secret=None, lease_seconds=432000,
+                 renew_margin=3600, retry_interval=300):
+        self.callback_url = callback_url
+        self.on_entries = on_entries
+        self.hub_url = hub_url
+        self.secret = secret or None
+        self.lease_seconds = lease_seconds
+        self.renew_margin = renew_margin
+        self.retry_interval = retry_interval
+        self.leases = {}  # channel_id -> Lease
+        self.wanted = set()
+        self.stats = {'notifications': 0, 'entries': 0, 'rejected': 0, 'verified': 0, 'hub_errors': 0}
+        self._session = None
+        self._tasks = set()
+
+    def add_routes(self, app, path):
+        app.router.add_get(path, self.handle_verify)
+        app.router.add_post(path, self.handle_notification)
+
+    def is_active(self, channel_id, now=None):
+        lease = self.leases.get(channel_id)
+        return lease is not None and lease.expires_at > (now or time.time())
+
+    async def _hub_request(self, mode, channel_id):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        data = {
+            'hub.mode': mode,
+            'hub.topic': topic_for(channel_id),
+            'hub.callback': self.callback_url,
+            'hub.verify': 'async',
+        }
+        if mode == 'subscribe':
+            data['hub.lease_seconds'] = str(self.lease_seconds)
+            if self.secret:
+                data['hub.secret'] = self.secret
+        try:
+            async with self._session.post(self.hub_url, data=data) as response:
+                # 202 — хаб проверит подписку позже, 204 — уже проверил
+                if response.status not in (202, 204):
+                    self.stats['hub_errors'] += 1
+                    logger.warning(f"WebSub: хаб ответил {response.status} на {mode} канала {channel_id}: {await response.text()}")
+                    return False
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.stats['hub_errors'] += 1
+            logger.warning(f"WebSub: ошибка запроса {mode} канала {channel_id}: {e}")
+            return False
+
+    async def subscribe(self, channel_id):
+        self.wanted.add(channel_id)
+        lease = self.leases.setdefault(channel_id, Lease())
+        lease.requested_at = time.time()
+        return await self._hub_request('subscribe', channel_id)
+
+    async def unsubscribe(self, channel_id):
+        self.wanted.discard(channel_id)
+        self.leases.pop(channel_id, None)
+        return await self._hub_request('unsubscribe', channel_id)
+
+    # Подписки приводятся к списку каналов: новые оформляются, истекающие продлеваются, лишние снимаются
+    async def sync(self, channel_ids, now=None):
+        now = now or time.time()
+        channel_ids = set(channel_ids)
+        requests = []
+        for channel_id in channel_ids:
+            lease = self.leases.get(channel_id)
+            if lease is not None and lease.expires_at - now > self.renew_margin:
+                continue
+            if lease is not None and now - lease.requested_at < self.retry_interval:
+                continue  # Ждем подтверждения от хаба
+            requests.append(self.subscribe(channel_id))
+        for channel_id in (self.wanted | set(self.leases)) - channel_ids:
+            requests.append(self.unsubscribe(channel_id))
+        if requests:
+            await asyncio.gather(*requests)
+        return len(requests)
+
+    # Продление аренды подписок: проверка раз в check_interval секунд
+    async def renew_task(self, get_channel_ids, check_interval=60):
+        while True:
+            try:
+                await self.sync(get_channel_ids())
+            except Exception as e:
+                logger.error(f"WebSub: ошибка продления подписок: {e}")
+            await asyncio.sleep(check_interval)
+
+    # Проверка намерения: хаб спрашивает, действительно ли мы подписываемся (или отписываемся)
+    async def handle_verify(self, request):
+        query = request.query
+        mode = query.get('hub.mode')
+        channel_id = channel_from_topic(query.get('hub.topic'))
+        challenge = query.get('hub.challenge')
+        if mode == 'denied' and channel_id is not None:
+            # Повторная попытка — не раньше чем через retry_interval
+            self.leases[channel_id] = Lease(requested_at=time.time())
+            logger.warning(f"WebSub: хаб отклонил подписку на канал {channel_id}: {query.get('hub.reason')}")
+            return web.Response(text='')
+        if channel_id is None or challenge is None:
+            return web.Response(status=404)
+        if mode == 'subscribe' and channel_id in self.wanted:
+            lease_seconds = int(query.get('hub.lease_seconds') or self.lease_seconds)
+            lease = self.leases.setdefault(channel_id, Lease())
+            lease.expires_at = time.time() + lease_seconds
+            self.stats['verified'] += 1
+            logger.info(f"WebSub: подписка на канал {channel_id} подтверждена на {lease_seconds / 3600:.0f} ч")
+            return web.Response(text=challenge)
+        if mode == 'unsubscribe' and channel_id not in self.wanted:
+            return web.Response(text=challenge)
+        return web.Response(status=404)
+
+    # Уведомление о загрузке или изменении видео. Хаб ждет быстрого ответа 2xx, поэтому записи
+    # обрабатываются в отдельной задаче; поддельные уведомления (неверная подпись) отбрасываются молча
+    async def handle_notification(self, request):
+        if request.content_length is not None and request.content_length > MAX_NOTIFICATION_SIZE:
+            return web.Response(status=413)
+        body = await request.read()
+        self.stats['notifications'] += 1
+        if self.secret:
+            signature = request.headers.get('X-Hub-Signature', '')
+            if not hmac.compare_digest(signature, sign(self.secret, body)):
+                self.stats['rejected'] += 1
+                logger.warning("WebSub: уведомление с неверной подписью отброшено")
+                return web.Response(status=204)
+        try:
+            entries = parse_feed(body)
+        except ET.ParseError as e:
+            self.stats['rejected'] += 1
+            logger.warning(f"WebSub: не удалось разобрать уведомление: {e}")
+            return web.Response(status=204)
+        if entries:
+            self.stats['entries'] += len(entries)
+            task = asyncio.create_task(self._dispatch(entries))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return web.Response(status=204)
+
+    async def _dispatch(self, entries):
+        try:
+            await self.on_entries(entries)
+        except Exception as e:
+            logger.error(f"WebSub: ошибка обработки уведомления: {e}")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None